@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+
+# 文本日志格式
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 写入线程每次最多从队列中取出的记录数量，取完或达到此数量后统一写入并刷新一次
+MAX_BATCH_RECORDS = 512
+
+class JsonFormatter(logging.Formatter):
+    """JSON Lines 格式，每条记录一行，便于日志采集"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'timestamp': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class _QueueHandler(logging.Handler):
+    """
+    把日志记录放入队列，由写入线程格式化和写入
+    与 logging.handlers.QueueHandler 不同，入队前不格式化消息，调用线程只付出一次入队的开销
+    """
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def handle(self, record):
+        # 跳过 Handler 的锁，SimpleQueue 本身是线程安全的
+        if self.filter(record):
+            self.records.put(record)
+        return True
+
+    def emit(self, record):
+        self.records.put(record)
+
+class _RotatingFileWriter:
+    """按大小轮转的日志文件，只在写入线程中使用"""
+
+    def __init__(self, path, max_bytes=0, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, text):
+        self._file.write(text)
+
+    def flush(self):
+        """刷新到文件，达到大小上限时轮转（每批检查一次）"""
+        self._file.flush()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """autofilemover.log -> autofilemover.log.1 -> ... -> autofilemover.log.N"""
+        self._file.close()
+        # 不保留轮转文件时直接清空；重命名失败（如文件被其他程序占用）时继续追加写入原文件
+        mode = 'w' if self.backup_count <= 0 else 'a'
+        try:
+            if self.backup_count > 0:
+                for index in range(self.backup_count - 1, 0, -1):
+                    source = f"{self.path}.{index}"
+                    if os.path.exists(source):
+                        os.replace(source, f"{self.path}.{index + 1}")
+                os.replace(self.path, f"{self.path}.1")
+        finally:
+            self._file = open(self.path, mode, encoding='utf-8')
+
+    def close(self):
+        self._file.close()
+
+class AsyncLogWriter:
+    """
+    异步日志管道
+    根日志记录器只挂一个入队处理器，单个写入线程批量取出记录，格式化后写入文本日志、控制台和可选的 JSON Lines 日志，
+    每批只刷新一次；日志文件按大小轮转
+    """
+
+    def __init__(self, log_file, level=logging.INFO, console=True, max_bytes=0, backup_count=5, json_file=None):
+        """
+        :param log_file: 文本日志文件路径
+        :param level: 日志级别
+        :param console: 是否同时输出到控制台
+        :param max_bytes: 日志文件达到此大小（字节）时轮转，0 表示不轮转
+        :param backup_count: 保留的轮转日志文件数量
+        :param json_file: JSON Lines 日志文件路径（可选）
+        """
+        self.log_file = log_file
+        self.level = level
+        self.console = console
+        # 控制台只输出此级别及以上的日志，文件不受影响
+        self.console_level = logging.NOTSET
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.json_file = json_file
+
+        self._records = queue.SimpleQueue()
+        self._handler = _QueueHandler(self._records)
+        self._formatter = logging.Formatter(LOG_FORMAT)
+        self._json_formatter = JsonFormatter()
+        self._writers = []
+        self._thread = None
+
+    def start(self):
+        """打开日志文件，启动写入线程，并把根日志记录器的输出切换到队列"""
+        if self._thread is not None:
+            return
+        self._writers = [(_RotatingFileWriter(self.log_file, self.max_bytes, self.backup_count), self._formatter)]
+        if self.json_file:
+            self._writers.append(
+                (_RotatingFileWriter(self.json_file, self.max_bytes, self.backup_count), self._json_formatter)
+            )
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self._handler)
+        root.setLevel(self.level)
+
+        self._thread = threading.Thread(target=self._run, name="AsyncLogWriter", daemon=True)
+        self._thread.start()
+        # 异常退出时也写完队列中的日志
+        atexit.register(self.stop)
+
+    def stop(self):
+        """写完队列中剩余的日志后停止写入线程，关闭日志文件"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        logging.getLogger().removeHandler(self._handler)
+        self._records.put(None)
+        thread.join()
+        for writer, _ in self._writers:
+            writer.close()
+        self._writers = []
+        atexit.unregister(self.stop)
+
+    def _run(self):
+        """写入线程主循环"""
+        while True:
+            record = self._records.get()
+            batch = []
+            stopping = record is None
+            if not stopping:
+                batch.append(record)
+                # 取出已在队列中的记录，一起写入
+                while len(batch) < MAX_BATCH_RECORDS:
+                    try:
+                        record = self._records.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        stopping = True
+                        break
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        """格式化并写入一批记录，每个输出只刷新一次"""
+        console_lines = []
+        for writer, formatter in self._writers:
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(formatter.format(record))
+                except Exception:
+                    lines.append(f"日志格式化失败: {record.msg!r} {record.args!r}")
+            text = '\n'.join(lines) + '\n'
+            try:
+                writer.write(text)
+                writer.flush()
+            except (OSError, ValueError) as e:
+                sys.stderr.write(f"写入日志失败 {writer.path}: {e}\n")
+            if formatter is self._formatter and self.console:
+                console_lines = [line for line, record in zip(lines, batch) if record.levelno >= self.console_level]
+        if console_lines:
+            try:
+                sys.stdout.write('\n'.join(console_lines) + '\n')
+                sys.stdout.flush()
+            except (OSError, ValueError):
+                pass
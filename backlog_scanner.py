@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+import logging
+
+class BacklogScanner:
+    """
+    启动时的积压文件扫描器
+    使用 os.scandir 流式遍历监听目录，把已存在的文件交给稳定性跟踪器，
+    由分发器的有界队列提供背压，不会一次性把整个目录列表读入内存
+    """
+
+    def __init__(self, watch_directory, stability_tracker, ignore_suffixes=None, progress_interval=5,
+                 recursive=False, exclude_directories=None):
+        """
+        :param watch_directory: 要扫描的目录
+        :param stability_tracker: 稳定性跟踪器，已静默的文件会立即进入处理队列
+        :param ignore_suffixes: 需要忽略的临时文件后缀
+        :param progress_interval: 进度日志输出间隔（秒）
+        :param recursive: 是否同时扫描所有子目录
+        :param exclude_directories: 不扫描的子目录
+        """
+        self.watch_directory = watch_directory
+        self.stability_tracker = stability_tracker
+        self.ignore_suffixes = tuple(suffix.lower() for suffix in (ignore_suffixes or []))
+        self.progress_interval = progress_interval
+        self.recursive = recursive
+        self.exclude_directories = {os.path.abspath(directory) for directory in (exclude_directories or [])}
+        self.logger = logging.getLogger(__name__)
+
+        self.scanned = 0
+        self.submitted = 0
+        self._start_time = None
+        self._last_report = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """在后台线程中开始扫描"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.scan, name="BacklogScanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """中止扫描"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        """检查扫描是否仍在进行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def scan(self):
+        """扫描目录中已存在的文件"""
+        self.scanned = 0
+        self.submitted = 0
+        self._start_time = time.monotonic()
+        self._last_report = self._start_time
+        self.logger.info(f"开始扫描已存在的文件: {self.watch_directory}")
+
+        # 待扫描的目录栈，递归扫描时子目录在当前目录遍历完后再处理
+        directories = [self.watch_directory]
+        while directories:
+            directory = directories.pop()
+            if not self._scan_directory(directory, directories):
+                self.logger.info(f"积压文件扫描已中止: 已扫描 {self.scanned} 个文件")
+                return
+
+        elapsed = time.monotonic() - self._start_time
+        self.logger.info(
+            f"积压文件扫描完成: 已扫描 {self.scanned} 个, 已提交 {self.submitted} 个, 用时 {elapsed:.1f} 秒"
+        )
+
+    def _scan_directory(self, directory, directories):
+        """扫描单个目录，子目录加入待扫描栈；扫描被中止时返回 False"""
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if self._stop_event.is_set():
+                        return False
+                    self.scanned += 1
+
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            if (self.recursive and entry.is_dir(follow_symlinks=False)
+                                    and os.path.abspath(entry.path) not in self.exclude_directories):
+                                directories.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    if self.ignore_suffixes and entry.name.lower().endswith(self.ignore_suffixes):
+                        continue
+
+                    # 跟踪器会立即提交已静默的文件，队列满时在此阻塞
+                    self.stability_tracker.track(entry.path)
+                    self.submitted += 1
+
+                    now = time.monotonic()
+                    if now - self._last_report >= self.progress_interval:
+                        self._last_report = now
+                        rate = self.scanned / (now - self._start_time)
+                        self.logger.info(
+                            f"积压文件扫描进度: 已扫描 {self.scanned} 个, 已提交 {self.submitted} 个, {rate:.0f} 个/秒"
+                        )
+        except OSError as e:
+            self.logger.error(f"扫描目录失败 {directory}: {e}")
+        return True
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+import yaml
+
+# 将当前目录添加到Python路径中
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 负载名称，all 表示依次运行全部负载
+WORKLOADS = ('tiny', 'large', 'trickle', 'rename')
+
+# 大文件每次写入的数据量
+WRITE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 浏览器下载过程中使用的临时后缀，rename 负载写完后去掉此后缀
+DOWNLOAD_SUFFIX = '.crdownload'
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class LatencyRecorder:
+    """记录每个文件的关闭时间和移动完成时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """开始新的负载前清空记录"""
+        self.closed = {}      # 源路径 -> 写入方关闭文件的时间
+        self.completed = {}   # 源路径 -> 移动完成的时间
+        self.expected_size = {}
+        self.moved_to = {}
+        self.failed = set()
+
+    def file_closed(self, path, size):
+        with self._lock:
+            self.closed[path] = time.monotonic()
+            self.expected_size[path] = size
+
+    def batch_done(self, result):
+        """处理完一批文件后调用，批内所有文件以这一时刻作为移动完成时间"""
+        now = time.monotonic()
+        with self._lock:
+            for source_path, moved_path, _ in result.moved:
+                self.completed[source_path] = now
+                self.moved_to[source_path] = moved_path
+            for source_path, _, _ in result.duplicates:
+                self.completed[source_path] = now
+            for source_path, _ in result.failed:
+                self.failed.add(source_path)
+
+    def finished_count(self):
+        with self._lock:
+            return len(self.completed) + len(self.failed)
+
+class ResourceSampler:
+    """后台定时采样线程数和常驻内存，记录峰值"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self.peak_threads = threading.active_count()
+        self.peak_rss = current_rss()
+        self._thread = threading.Thread(target=self._run, name="ResourceSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        # 不包括采样线程本身
+        self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+def current_rss():
+    """当前进程的常驻内存（字节），无法获取时返回进程峰值或 0"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # Linux 上单位为 KB，macOS 上为字节
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return 0
+
+def percentile(values, fraction):
+    """最近秩法计算分位数，values 须已排序"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+def write_file(path, size, recorder, chunk=None, chunk_count=1, chunk_delay=0, final_path=None):
+    """
+    写入文件并记录关闭时间
+    :param chunk_count: 分多少次写入，配合 chunk_delay 模拟慢速写入方
+    :param final_path: 写完后重命名到的路径（可选），关闭时间以重命名完成为准
+    """
+    written = 0
+    with open(path, 'wb') as file:
+        for index in range(chunk_count):
+            part = min(size - written, -(-size // chunk_count))
+            if chunk is None:
+                file.write(os.urandom(part))
+            else:
+                # 复用同一块数据，开头写入文件名避免被识别为重复文件
+                header = os.path.basename(final_path or path).encode()[:part] if index == 0 else b''
+                file.write(header + chunk[:part - len(header)])
+            written += part
+            if chunk_delay and index < chunk_count - 1:
+                file.flush()
+                time.sleep(chunk_delay)
+    if final_path is not None:
+        os.rename(path, final_path)
+        path = final_path
+    recorder.file_closed(path, size)
+
+def run_tiny(watch_directory, recorder, args):
+    """大量小文件的突发"""
+    for index in range(args.count):
+        write_file(os.path.join(watch_directory, f"tiny_{index:06d}.txt"), args.tiny_size, recorder)
+    return args.count
+
+def run_large(watch_directory, recorder, args):
+    """少量大文件，每个大小为 --large-size MB"""
+    chunk = os.urandom(WRITE_CHUNK_SIZE)
+    size = args.large_size * 1024 * 1024
+    count = args.large_count
+    for index in range(count):
+        write_file(os.path.join(watch_directory, f"large_{index:03d}.zip"), size, recorder,
+                   chunk=chunk, chunk_count=max(1, -(-size // WRITE_CHUNK_SIZE)))
+    return count
+
+def run_trickle(watch_directory, recorder, args):
+    """多个慢速写入方同时写入，每个文件在 --trickle-duration 秒内分多次写完"""
+    chunk_count = 20
+    chunk_delay = args.trickle_duration / chunk_count
+    writers = [
+        threading.Thread(
+            target=write_file,
+            args=(os.path.join(watch_directory, f"trickle_{index:03d}.mp4"), 1024 * 1024, recorder),
+            kwargs={'chunk_count': chunk_count, 'chunk_delay': chunk_delay},
+            daemon=True
+        )
+        for index in range(args.trickle_writers)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    return len(writers)
+
+def run_rename(watch_directory, recorder, args):
+    """写入带下载临时后缀的文件，写完后重命名为正式文件名（浏览器下载方式）"""
+    count = max(1, args.count // 10)
+    for index in range(count):
+        final_path = os.path.join(watch_directory, f"download_{index:05d}.pdf")
+        write_file(final_path + DOWNLOAD_SUFFIX, args.tiny_size * 16, recorder,
+                   chunk_count=4, final_path=final_path)
+    return count
+
+WORKLOAD_RUNNERS = {
+    'tiny': run_tiny,
+    'large': run_large,
+    'trickle': run_trickle,
+    'rename': run_rename,
+}
+
+def build_config(base_config_path, work_directory, target_root, args):
+    """以现有配置文件为基础生成基准测试配置：监听目录和目标目录都指向临时目录"""
+    with open(base_config_path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file) or {}
+
+    config.pop('watch_directories', None)
+    config['watch_directory'] = os.path.join(work_directory, 'watch')
+    config['watch_backend'] = args.backend
+    config['startup_scan'] = False
+    config['config_reload_interval'] = 0
+    config['debug'] = False
+    config['log_file'] = os.path.join(work_directory, 'benchmark.log')
+    config['integrity_check_delay'] = args.quiet_period
+    config['target_directories'] = {
+        category: os.path.join(target_root, category)
+        for category in (config.get('target_directories') or {'others': None})
+    }
+    config.setdefault('journal', {})['path'] = os.path.join(work_directory, 'benchmark.journal')
+    duplicates = config.setdefault('duplicates', {})
+    duplicates['index_path'] = os.path.join(work_directory, 'benchmark.hashes')
+    if args.no_duplicates:
+        duplicates['enabled'] = False
+    config.setdefault('notifications', {})['enabled'] = False
+
+    config_path = os.path.join(work_directory, 'benchmark.yaml')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        yaml.safe_dump(config, file, allow_unicode=True)
+    return config_path, config['watch_directory']
+
+def run_workload(name, watch_directory, recorder, args):
+    """运行一种负载，等待所有文件处理完成后返回统计结果"""
+    recorder.reset()
+    sampler = ResourceSampler()
+    sampler.start()
+
+    start_time = time.monotonic()
+    expected = WORKLOAD_RUNNERS[name](watch_directory, recorder, args)
+    written_time = time.monotonic()
+
+    deadline = written_time + args.timeout
+    while recorder.finished_count() < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    end_time = time.monotonic()
+    sampler.stop()
+
+    latencies = sorted(
+        recorder.completed[path] - closed
+        for path, closed in recorder.closed.items() if path in recorder.completed
+    )
+    # 移动后大小与写入大小不一致，说明文件在写入完成前就被移动
+    truncated = sum(
+        1 for path, moved_path in recorder.moved_to.items()
+        if os.path.getsize(moved_path) != recorder.expected_size.get(path)
+    )
+    finished = len(recorder.completed)
+    elapsed = (max(recorder.completed.values()) if recorder.completed else end_time) - start_time
+    return {
+        'workload': name,
+        'files': expected,
+        'completed': finished,
+        'failed': len(recorder.failed),
+        'timed_out': expected - finished - len(recorder.failed),
+        'truncated': truncated,
+        'write_seconds': written_time - start_time,
+        'elapsed_seconds': elapsed,
+        'files_per_second': finished / elapsed if elapsed > 0 else None,
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p90': percentile(latencies, 0.90),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': latencies[-1] if latencies else None,
+        'peak_threads': sampler.peak_threads,
+        'peak_rss_mb': sampler.peak_rss / (1024 * 1024),
+    }
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.1f} ms"
+
+def print_report(results, cross_device):
+    """输出基准测试结果"""
+    print()
+    print(f"目标目录{'位于其他设备（跨设备移动）' if cross_device else '与监听目录位于同一设备'}")
+    for stats in results:
+        print("=" * 50)
+        print(f"负载: {stats['workload']}")
+        print(f"  文件: {stats['completed']}/{stats['files']} 完成, 失败 {stats['failed']}, "
+              f"超时 {stats['timed_out']}, 未写完即移动 {stats['truncated']}")
+        rate = stats['files_per_second']
+        print(f"  吞吐量: {'-' if rate is None else f'{rate:.1f}'} 个文件/秒, "
+              f"总用时 {stats['elapsed_seconds']:.2f} 秒（写入 {stats['write_seconds']:.2f} 秒）")
+        print(f"  延迟（关闭 -> 移动完成）: p50 {format_seconds(stats['latency_p50'])}, "
+              f"p90 {format_seconds(stats['latency_p90'])}, p99 {format_seconds(stats['latency_p99'])}, "
+              f"max {format_seconds(stats['latency_max'])}")
+        print(f"  峰值线程数: {stats['peak_threads']}, 峰值内存: {stats['peak_rss_mb']:.1f} MB")
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="AutoFileMover 性能基准测试")
+    parser.add_argument("--workload", choices=WORKLOADS + ('all',), default='all', help="运行的负载（默认: all）")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml"),
+                        help="作为基础的配置文件，规则、分发器和批处理设置沿用此文件")
+    parser.add_argument("--work-dir", help="临时监听目录所在的目录（默认: 系统临时目录）")
+    parser.add_argument("--target-root", help="目标目录所在的目录，指定其他磁盘上的路径可测试跨设备移动")
+    parser.add_argument("--backend", choices=('events', 'polling'), default='events', help="监听方式")
+    parser.add_argument("--count", type=int, default=10000, help="tiny 负载的文件数量，rename 负载为其十分之一")
+    parser.add_argument("--tiny-size", type=int, default=256, help="小文件大小（字节）")
+    parser.add_argument("--large-count", type=int, default=2, help="large 负载的文件数量")
+    parser.add_argument("--large-size", type=int, default=2048, help="large 负载的文件大小（MB）")
+    parser.add_argument("--trickle-writers", type=int, default=8, help="trickle 负载同时写入的文件数量")
+    parser.add_argument("--trickle-duration", type=float, default=5.0, help="trickle 负载每个文件的写入时长（秒）")
+    parser.add_argument("--quiet-period", type=float, default=1.0, help="文件静默多久视为写入完成（秒）")
+    parser.add_argument("--no-duplicates", action="store_true", help="关闭重复文件检测")
+    parser.add_argument("--timeout", type=float, default=600, help="等待所有文件处理完成的最长时间（秒）")
+    parser.add_argument("--json", help="把结果以 JSON 格式写入此文件，便于比较不同版本")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    parser.add_argument("--verbose", action="store_true", help="在控制台输出处理日志")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_directory = tempfile.mkdtemp(prefix="afm-bench-", dir=args.work_dir)
+    target_root = (tempfile.mkdtemp(prefix="afm-bench-target-", dir=args.target_root)
+                   if args.target_root else os.path.join(work_directory, 'targets'))
+    config_path, watch_directory = build_config(args.config, work_directory, target_root, args)
+    os.makedirs(watch_directory, exist_ok=True)
+    os.makedirs(target_root, exist_ok=True)
+    cross_device = os.stat(watch_directory).st_dev != os.stat(target_root).st_dev
+
+    from main import AutoFileMover
+    app = AutoFileMover(config_path=config_path, headless=True, enable_notifications=False)
+    if not args.verbose:
+        app.log_writer.console_level = logging.WARNING
+
+    # 每批处理完成后记录移动完成时间
+    recorder = LatencyRecorder()
+    notify_batch_result = app.notify_batch_result
+    def record_batch_result(result, decisions):
+        recorder.batch_done(result)
+        notify_batch_result(result, decisions)
+    app.notify_batch_result = record_batch_result
+
+    results = []
+    app.start()
+    try:
+        workloads = WORKLOADS if args.workload == 'all' else (args.workload,)
+        for name in workloads:
+            print(f"运行负载: {name} ...")
+            results.append(run_workload(name, watch_directory, recorder, args))
+    finally:
+        try:
+            app.stop()
+        except SystemExit:
+            # stop() 结束时会退出程序，这里只需要停止各组件
+            pass
+        if not args.keep:
+            shutil.rmtree(work_directory, ignore_errors=True)
+            if args.target_root:
+                shutil.rmtree(target_root, ignore_errors=True)
+
+    print_report(results, cross_device)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'cross_device': cross_device, 'results': results}, file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 写入完成判定方式
+STRATEGY_CLOSE_WRITE = 'close_write'    # 写入方关闭文件的事件（inotify IN_CLOSE_WRITE），由文件监听器触发
+STRATEGY_OPEN_HANDLES = 'open_handles'  # /proc/*/fd 中是否有进程以写入方式打开文件
+STRATEGY_LOCK = 'lock'                  # 独占打开 / 文件锁探测
+STRATEGY_SIDECAR = 'sidecar'            # 同名的 .part / .crdownload 等附属文件
+STRATEGIES = (STRATEGY_CLOSE_WRITE, STRATEGY_OPEN_HANDLES, STRATEGY_LOCK, STRATEGY_SIDECAR)
+
+# 未配置时的判定方式：写入方关闭文件后立即处理，其余情况按静默期判断
+DEFAULT_STRATEGIES = (STRATEGY_CLOSE_WRITE,)
+
+def normalize_strategies(strategies):
+    """把配置中的判定方式（字符串或列表）转换为元组，忽略无效的名称；未配置时返回 None"""
+    if strategies is None:
+        return None
+    if isinstance(strategies, str):
+        strategies = [strategies]
+    result = []
+    for name in strategies:
+        name = str(name).strip().lower()
+        if name not in STRATEGIES:
+            logging.getLogger(__name__).error(f"无效的写入完成判定方式: {name}，可选: {', '.join(STRATEGIES)}")
+            continue
+        if name not in result:
+            result.append(name)
+    return tuple(result)
+
+class OpenHandleProbe:
+    """
+    通过 /proc/*/fd 检查是否有进程以写入方式打开文件（仅 Linux）
+    一次扫描的结果由所有待检查的文件共用；只能看到有权限读取的进程（通常为同一用户），
+    其他主机通过网络共享写入的文件无法判断
+    """
+
+    def __init__(self):
+        self.available = sys.platform.startswith('linux') and os.path.isdir('/proc/self/fd')
+        self.logger = logging.getLogger(__name__)
+        # 文件路径 -> [(进程号, 文件描述符)]，只记录打开的普通路径
+        self._open_files = {}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+
+    def check(self, path, since=None):
+        """
+        :param since: 只接受在此时间（time.monotonic）之后开始的扫描结果，避免用写入方打开文件之前的扫描做判断
+        返回 False 表示有进程正在写入，True 表示没有，None 表示无法判断
+        """
+        if not self.available:
+            return None
+        with self._lock:
+            if self._scanned_at is None or (since is not None and self._scanned_at < since):
+                self._scan()
+            handles = self._open_files.get(os.path.realpath(path))
+        if not handles:
+            return True
+        return not any(self._opened_for_writing(pid, fd) for pid, fd in handles)
+
+    def _scan(self):
+        """扫描所有进程打开的文件，必须在持有锁时调用"""
+        started = time.monotonic()
+        open_files = {}
+        try:
+            # 包括本进程：复制时以只读方式打开的源文件由打开标志排除
+            pids = [entry.name for entry in os.scandir('/proc') if entry.name.isdigit()]
+        except OSError as e:
+            self.logger.warning(f"无法读取进程列表，停止使用打开句柄检查: {e}")
+            self.available = False
+            return
+        for pid in pids:
+            fd_directory = f'/proc/{pid}/fd'
+            try:
+                fds = os.listdir(fd_directory)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    target = os.readlink(f'{fd_directory}/{fd}')
+                except OSError:
+                    continue
+                # 套接字、管道等不是路径
+                if target.startswith('/'):
+                    open_files.setdefault(target, []).append((pid, fd))
+        self._open_files = open_files
+        self._scanned_at = started
+        self.logger.debug("扫描打开的文件: %d 个进程, 用时 %.1f ms", len(pids), (time.monotonic() - started) * 1000)
+
+    @staticmethod
+    def _opened_for_writing(pid, fd):
+        """根据 /proc/<pid>/fdinfo 中的打开标志判断是否以写入方式打开，读不到打开标志时按正在写入处理"""
+        try:
+            with open(f'/proc/{pid}/fdinfo/{fd}') as fdinfo:
+                for line in fdinfo:
+                    if line.startswith('flags:'):
+                        return int(line.split()[1], 8) & os.O_ACCMODE != os.O_RDONLY
+        except (OSError, ValueError, IndexError):
+            # 进程已退出或文件描述符已关闭
+            return False
+        return True
+
+class LockProbe:
+    """
+    独占打开 / 文件锁探测
+    Windows 上写入方通常不共享写权限，以读写方式打开失败即表示仍在写入；
+    POSIX 上只能发现其他进程持有的 flock 排他锁，没有锁不代表写入完成
+    """
+
+    def check(self, path, since=None):
+        """返回 False 表示文件被占用，True 表示可以独占打开（仅 Windows），None 表示无法判断"""
+        if sys.platform == 'win32':
+            try:
+                fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+            except PermissionError:
+                return False
+            except OSError:
+                return None
+            os.close(fd)
+            return True
+        if fcntl is None:
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        except OSError:
+            # 文件系统不支持文件锁
+            return None
+        finally:
+            os.close(fd)
+        return None
+
+class SidecarProbe:
+    """
+    附属文件检查：下载工具在写入期间常保留同名的附属文件（如 Firefox 的 .part、aria2 的 .aria2），
+    存在时视为未完成；不存在时无法判断
+    """
+
+    def __init__(self, suffixes=()):
+        self.suffixes = tuple(suffixes)
+
+    def check(self, path, since=None):
+        for suffix in self.suffixes:
+            if os.path.lexists(path + suffix):
+                return False
+        return None
+
+class CompletionDetector:
+    """
+    写入完成判定
+    按文件所用的判定方式依次探测：任一方式确认仍在写入则继续等待，
+    否则只要有一种方式确认写入完成即可立即处理，全部无法判断时由调用方按静默期判断
+    """
+
+    def __init__(self, default_strategies=DEFAULT_STRATEGIES, probe_interval=0.5, sidecar_suffixes=()):
+        """
+        :param default_strategies: 规则未指定判定方式时使用的判定方式
+        :param probe_interval: 探测的初始间隔（秒）
+        :param sidecar_suffixes: 附属文件后缀
+        """
+        self.logger = logging.getLogger(__name__)
+        self.probes = {
+            STRATEGY_OPEN_HANDLES: OpenHandleProbe(),
+            STRATEGY_LOCK: LockProbe(),
+            STRATEGY_SIDECAR: SidecarProbe(),
+        }
+        self.configure(default_strategies, probe_interval, sidecar_suffixes)
+
+    def configure(self, default_strategies=DEFAULT_STRATEGIES, probe_interval=0.5, sidecar_suffixes=()):
+        """更新默认判定方式、探测间隔和附属文件后缀"""
+        self.default_strategies = normalize_strategies(default_strategies) or ()
+        self.probe_interval = max(0.05, float(probe_interval))
+        self.probes[STRATEGY_SIDECAR].suffixes = tuple(sidecar_suffixes)
+
+    def has_probes(self, strategies):
+        """判定方式中是否包含需要主动探测的方式"""
+        return any(name in self.probes for name in strategies)
+
+    def check(self, path, strategies, since=None):
+        """
+        按判定方式探测文件
+        :param since: 文件最近一次变化的时间（time.monotonic），早于此时间的探测结果不可用
+        返回 False 表示仍在写入，True 表示写入完成，None 表示无法判断
+        """
+        verdict = None
+        for name in strategies:
+            probe = self.probes.get(name)
+            if probe is None:
+                continue
+            result = probe.check(path, since)
+            if result is False:
+                self.logger.debug("文件仍在写入（%s）: %s", name, path)
+                return False
+            if result is True:
+                verdict = True
+        return verdict
@@ -1,22 +1,43 @@
 import yaml
 import os
+import hashlib
 import logging
 from pathlib import Path
 
+# 安装了 libyaml 时使用 C 实现的解析器，解析速度快一个数量级，行为与 SafeLoader 相同
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 class ConfigManager:
-    """配置管理器，负责读取和解析YAML配置文件"""
+    """
+    配置管理器，负责读取和解析YAML配置文件
+    配置文件在第一次读取配置项时才加载，导入模块和创建实例时不读取文件，启动前仍可修改配置文件路径
+    """
     
     def __init__(self, config_path="config.yaml"):
         self.config_path = config_path
         self.config = {}
+        self.loaded = False
         self.logger = logging.getLogger(__name__)
-        self.load_config()
+        # 已加载配置文件的 (修改时间, 大小) 和内容哈希，用于低成本地判断文件是否变化
+        self._file_signature = None
+        self._content_hash = None
+    
+    def set_config_path(self, config_path):
+        """更换配置文件路径，已加载的配置在下次读取配置项时从新路径重新加载"""
+        self.config_path = config_path
+        self.loaded = False
     
     def load_config(self):
-        """加载配置文件"""
+        """加载配置文件，解析成功后整体替换当前配置，解析失败时保留原配置"""
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as file:
-                self.config = yaml.safe_load(file)
+            signature = self._read_signature()
+            with open(self.config_path, 'rb') as file:
+                content = file.read()
+            config = yaml.load(content.decode('utf-8'), Loader=_YAML_LOADER)
+            self.config = config if config is not None else {}
+            self.loaded = True
+            self._file_signature = signature
+            self._content_hash = hashlib.sha256(content).digest()
             self.logger.info(f"配置文件加载成功: {self.config_path}")
         except FileNotFoundError:
             self.logger.error(f"配置文件未找到: {self.config_path}")
@@ -28,13 +49,53 @@ class ConfigManager:
             self.logger.error(f"加载配置文件时发生未知错误: {e}")
             raise
     
-    def reload_config(self):
-        """重新加载配置文件"""
+    def _read_signature(self):
+        stat_result = os.stat(self.config_path)
+        return (stat_result.st_mtime_ns, stat_result.st_size)
+    
+    def has_changed(self):
+        """
+        检查配置文件自上次加载后是否变化
+        修改时间和大小都未变化时只需一次 stat；变化时再比较内容哈希，只是被 touch 的文件不算变化
+        """
+        try:
+            signature = self._read_signature()
+        except OSError:
+            return False
+        if signature == self._file_signature:
+            return False
+        try:
+            with open(self.config_path, 'rb') as file:
+                content_hash = hashlib.sha256(file.read()).digest()
+        except OSError:
+            return False
+        if content_hash == self._content_hash:
+            self._file_signature = signature
+            return False
+        return True
+    
+    def invalidate_signature(self):
+        """清除已加载配置文件的签名，下次检查时视为已变化（配置未能完整应用时调用）"""
+        self._file_signature = None
+        self._content_hash = None
+    
+    def reload_config(self, force=False):
+        """
+        重新加载配置文件
+        :param force: 为 False 时文件未变化则跳过
+        返回 True 表示已加载新的配置
+        """
+        if not force and not self.has_changed():
+            self.logger.debug("配置文件未变化，跳过重新加载")
+            return False
         self.logger.info("重新加载配置文件")
         self.load_config()
+        return True
     
     def get(self, key, default=None):
         """获取配置项"""
+        if not self.loaded:
+            self.load_config()
         keys = key.split('.')
         value = self.config
         try:
@@ -45,9 +106,69 @@ class ConfigManager:
             return default
     
     def get_watch_directory(self):
-        """获取监听目录路径"""
-        watch_dir = self.get('watch_directory', '~/Downloads')
-        return os.path.expanduser(watch_dir)
+        """获取监听目录路径（配置了多个监听目录时返回第一个）"""
+        return self.get_watch_sources()[0]['path']
+    
+    def get_watch_sources(self):
+        """
+        获取所有监听目录的配置
+        未配置 watch_directories 时，使用 watch_directory 和全局规则组成唯一的监听目录
+        每个监听目录未单独配置的规则、目标目录和默认目标沿用全局配置，单独配置的目标目录与全局目标目录合并
+        返回字典列表，包含 name、path、recursive、priority、backend、rules、target_directories、default_target
+        """
+        global_targets = self.get_target_directories()
+        default_backend = self.get('watch_backend', 'events')
+        entries = self.get('watch_directories') or [{'path': self.get('watch_directory', '~/Downloads')}]
+        
+        sources = []
+        names = set()
+        for index, entry in enumerate(entries):
+            if isinstance(entry, str):
+                entry = {'path': entry}
+            path = os.path.expanduser(entry['path'])
+            name = str(entry.get('name') or (os.path.basename(os.path.normpath(path)) or path))
+            if name in names:
+                name = f"{name}#{index + 1}"
+            names.add(name)
+            
+            target_directories = dict(global_targets)
+            for category, directory in (entry.get('target_directories') or {}).items():
+                target_directories[category] = os.path.expanduser(directory)
+            sources.append({
+                'name': name,
+                'path': path,
+                'recursive': bool(entry.get('recursive', False)),
+                'priority': entry.get('priority', 1),
+                'backend': str(entry.get('backend', default_backend)).lower(),
+                'rules': entry.get('rules', self.get_rules()),
+                'target_directories': target_directories,
+                'default_target': entry.get('default_target', self.get_default_target()),
+            })
+        return sources
+    
+    def get_polling_min_interval(self):
+        """获取轮询监听的最短间隔（秒）"""
+        return self.get('polling.min_interval', 1.0)
+    
+    def get_polling_max_interval(self):
+        """获取轮询监听的最长间隔（秒）"""
+        return self.get('polling.max_interval', 30.0)
+    
+    def get_polling_max_cpu(self):
+        """获取轮询监听允许占用的 CPU 比例"""
+        return self.get('polling.max_cpu', 0.05)
+    
+    def get_config_reload_interval(self):
+        """获取自动检查配置文件变化的间隔（秒），0 表示不自动重新加载"""
+        return self.get('config_reload_interval', 5)
+    
+    def get_ignore_suffixes(self):
+        """获取需要忽略的临时下载文件后缀"""
+        return self.get('ignore_suffixes', [".crdownload", ".part", ".partial", ".download", ".tmp"])
+    
+    def is_startup_scan_enabled(self):
+        """检查启动时是否处理监听目录中已存在的文件"""
+        return self.get('startup_scan', True)
     
     def get_target_directories(self):
         """获取目标目录映射"""
@@ -66,10 +187,86 @@ class ConfigManager:
         """获取默认目标目录"""
         return self.get('default_target', 'others')
     
+    def is_adaptive_rule_order_enabled(self):
+        """检查是否按命中次数调整条件规则的检查顺序"""
+        return self.get('rule_stats.adaptive_order', False)
+    
     def get_integrity_check_delay(self):
         """获取文件完整性检查延迟时间"""
         return self.get('integrity_check_delay', 2)
     
+    def get_max_wait_time(self):
+        """获取文件持续变化时的最长等待时间"""
+        return self.get('max_wait_time', 30)
+    
+    def get_large_file_threshold(self):
+        """获取大文件的大小阈值（MB），0 表示不区分大小文件"""
+        return self.get('large_files.threshold', 100)
+    
+    def get_large_file_workers(self):
+        """获取同时处理大文件的工作线程数量"""
+        return self.get('large_files.max_workers', 1)
+    
+    def get_large_file_quiet_period(self):
+        """获取大文件静默期上限（秒）"""
+        return self.get('large_files.quiet_period', 30)
+    
+    def get_large_file_max_wait_time(self):
+        """获取大文件持续变化的最长等待时间（秒）"""
+        return self.get('large_files.max_wait_time', 600)
+    
+    def get_large_file_retry_interval(self):
+        """获取大文件重试检查的间隔（秒）"""
+        return self.get('large_files.retry_interval', 60)
+    
+    def get_completion_strategies(self):
+        """获取默认的写入完成判定方式"""
+        return self.get('completion.strategies', ['close_write'])
+    
+    def get_completion_probe_interval(self):
+        """获取写入完成探测的初始间隔（秒）"""
+        return self.get('completion.probe_interval', 0.5)
+    
+    def get_sidecar_suffixes(self):
+        """获取写入期间存在的附属文件后缀，为空时使用忽略的临时文件后缀"""
+        return self.get('completion.sidecar_suffixes', [])
+    
+    def get_io_max_concurrency(self):
+        """获取每组设备同时跨设备复制的文件数量上限，0 表示自动调整"""
+        return self.get('io_throttle.max_concurrency', 0)
+    
+    def get_io_auto_max_concurrency(self):
+        """获取自动调整跨设备复制并发数时的上限"""
+        return self.get('io_throttle.auto_max_concurrency', 4)
+    
+    def get_io_bandwidth_limit(self):
+        """获取每组设备的跨设备复制速率上限（MB/s），0 表示不限制"""
+        return self.get('io_throttle.bandwidth_limit', 0)
+    
+    def get_max_workers(self):
+        """获取文件处理工作线程数量"""
+        return self.get('dispatcher.max_workers', 4)
+    
+    def get_queue_size(self):
+        """获取文件处理队列容量"""
+        return self.get('dispatcher.queue_size', 1000)
+    
+    def get_process_workers(self):
+        """获取分类工作进程数量，0 表示不启用多进程分类"""
+        return self.get('process_pool.workers', 0)
+    
+    def is_batch_enabled(self):
+        """检查是否启用批量移动"""
+        return self.get('batch.enabled', True)
+    
+    def get_batch_size(self):
+        """获取每批处理的最大文件数量"""
+        return self.get('batch.max_size', 100)
+    
+    def get_batch_window(self):
+        """获取收集一批文件的等待时间（秒）"""
+        return self.get('batch.window', 0.2)
+    
     def is_debug_mode(self):
         """检查是否为调试模式"""
         return self.get('debug', False)
@@ -79,6 +276,46 @@ class ConfigManager:
         log_file = self.get('log_file', 'autofilemover.log')
         return log_file
     
+    def get_log_max_size(self):
+        """获取日志文件轮转大小（MB），0 表示不轮转"""
+        return self.get('log_max_size', 10)
+    
+    def get_log_backup_count(self):
+        """获取保留的轮转日志文件数量"""
+        return self.get('log_backup_count', 5)
+    
+    def get_log_json_file(self):
+        """获取 JSON Lines 格式日志文件路径，未配置时返回空字符串"""
+        return self.get('log_json_file', '') or ''
+    
+    def is_journal_enabled(self):
+        """检查是否启用移动日志"""
+        return self.get('journal.enabled', True)
+    
+    def get_journal_path(self):
+        """获取移动日志文件路径"""
+        return os.path.expanduser(self.get('journal.path', 'autofilemover.journal'))
+    
+    def get_journal_compact_interval(self):
+        """获取移动日志清理间隔（秒）"""
+        return self.get('journal.compact_interval', 300)
+    
+    def is_duplicate_detection_enabled(self):
+        """检查是否启用重复文件检测"""
+        return self.get('duplicates.enabled', False)
+    
+    def get_duplicate_policy(self):
+        """获取重复文件处理策略: skip、delete 或 hardlink"""
+        return str(self.get('duplicates.policy', 'skip')).lower()
+    
+    def get_duplicate_index_path(self):
+        """获取重复文件索引的数据库文件路径"""
+        return os.path.expanduser(self.get('duplicates.index_path', 'autofilemover.hashes'))
+    
+    def get_trace_path(self):
+        """获取文件事件记录的路径，未配置时返回空字符串"""
+        return os.path.expanduser(self.get('trace.path', '') or '')
+    
     def is_notification_enabled(self):
         """检查是否启用通知"""
         return self.get('notifications.enabled', True)
@@ -86,6 +323,30 @@ class ConfigManager:
     def is_sound_enabled(self):
         """检查是否启用声音"""
         return self.get('notifications.sound', True)
+    
+    def get_notification_rate_limit(self):
+        """获取每分钟最多发送的通知数量"""
+        return self.get('notifications.rate_limit', 10)
+    
+    def get_notification_burst(self):
+        """获取允许连续发送的最大通知数量"""
+        return self.get('notifications.burst', 3)
+    
+    def get_notification_aggregation_window(self):
+        """获取合并通知的时间窗口（秒）"""
+        return self.get('notifications.aggregation_window', 1.0)
+    
+    def get_metrics_port(self):
+        """获取指标服务端口，0 表示不启动"""
+        return self.get('metrics.http_port', 0)
+    
+    def get_metrics_host(self):
+        """获取指标服务监听的地址"""
+        return self.get('metrics.http_host', '127.0.0.1')
+    
+    def get_metrics_log_interval(self):
+        """获取指标快照写入日志的间隔（秒），0 表示不输出"""
+        return self.get('metrics.log_interval', 300)
 
-# 全局配置管理器实例
+# 全局配置管理器实例（第一次读取配置项时加载配置文件）
 config_manager = ConfigManager()
\ No newline at end of file
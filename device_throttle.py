@@ -0,0 +1,220 @@
+import time
+import threading
+import logging
+
+from rate_limiter import TokenBucket
+from file_dispatcher import LANE_SMALL, LANE_LARGE
+
+# 自动调整并发数时每次测量吞吐量的时间窗口（秒）
+TUNE_INTERVAL = 2.0
+
+# 吞吐量下降超过此比例时认为上一次调整变差，反向调整
+TUNE_TOLERANCE = 0.1
+
+# 调整变差并退回后保持当前并发数的窗口数量，之后再重新试探，避免在最优值两侧频繁来回
+TUNE_HOLD_WINDOWS = 10
+
+class _DeviceGate:
+    """
+    一组设备（源设备, 目标设备）之间一个处理通道的复制限制：并发数量上限、速率令牌桶（同组设备的各通道共用）和并发数自动调整
+    自动调整采用爬山法：只在复制任务排队等待的时间窗口内测量总吞吐量，
+    吞吐量提高则继续同方向调整并发数，下降则退回上一个并发数并保持一段时间，之后再试探另一方向
+    """
+
+    def __init__(self, key, limit, max_limit, auto, bucket):
+        """
+        :param key: (源设备, 目标设备, 处理通道)
+        :param bucket: 同组设备共用的速率令牌桶，None 表示不限制速率
+        """
+        self.key = key
+        self.limit = limit
+        self.max_limit = max_limit
+        self.auto = auto
+        self.bucket = bucket
+        self.logger = logging.getLogger(__name__)
+
+        self.active = 0
+        self.waiting = 0
+        self.total_bytes = 0
+        self._condition = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        # 本窗口内是否出现过复制任务排队，没有排队时吞吐量受需求限制，不用于调整
+        self._window_saturated = False
+        self._previous_throughput = None
+        self._direction = 1
+        self._hold = 0
+
+    def set_limit(self, limit, max_limit, auto):
+        with self._condition:
+            self.limit = limit
+            self.max_limit = max_limit
+            self.auto = auto
+            self._previous_throughput = None
+            self._hold = 0
+            self._condition.notify_all()
+
+    def acquire(self):
+        """等待复制名额"""
+        with self._condition:
+            if self.active >= self.limit:
+                self._window_saturated = True
+                self.waiting += 1
+                try:
+                    while self.active >= self.limit:
+                        self._condition.wait()
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            if self.active >= self.limit:
+                self._window_saturated = True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def consumed(self, amount):
+        """记录已复制的字节数，超过速率上限时阻塞等待"""
+        bucket = self.bucket
+        if bucket is not None:
+            bucket.acquire(amount)
+        with self._condition:
+            self.total_bytes += amount
+            self._window_bytes += amount
+            if self.auto:
+                self._tune(time.monotonic())
+
+    def _tune(self, now):
+        """时间窗口结束时根据吞吐量调整并发数，必须在持有锁时调用"""
+        elapsed = now - self._window_start
+        if elapsed < TUNE_INTERVAL:
+            return
+        throughput = self._window_bytes / elapsed
+        saturated = self._window_saturated or self.waiting > 0
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_saturated = False
+        if not saturated:
+            # 没有排队的复制任务，吞吐量不代表当前并发数的能力
+            self._previous_throughput = None
+            return
+
+        if self._hold:
+            self._hold -= 1
+            self._previous_throughput = None
+            return
+
+        previous = self._previous_throughput
+        self._previous_throughput = throughput
+        if previous is not None and throughput < previous * (1 - TUNE_TOLERANCE):
+            # 上一次调整变差：退回并保持，保持结束后从退回的方向继续试探
+            self._direction = -self._direction
+            self._hold = TUNE_HOLD_WINDOWS
+        limit = min(max(self.limit + self._direction, 1), self.max_limit)
+        if limit == self.limit:
+            # 到达边界后下一次从另一方向试探
+            self._direction = -self._direction
+            return
+        self.logger.debug(
+            f"设备 {self.key[0]} -> {self.key[1]}（{self.key[2]}）复制并发数 {self.limit} -> {limit}"
+            f"（并发数 {self.limit} 时 {throughput / 1024 / 1024:.1f} MB/s）"
+        )
+        self.limit = limit
+        self._condition.notify_all()
+
+class _CopySlot:
+    """一次复制占用的名额，复制过程中通过 consumed 报告进度"""
+
+    __slots__ = ('gate',)
+
+    def __init__(self, gate):
+        self.gate = gate
+
+    def __enter__(self):
+        self.gate.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.gate.release()
+        return False
+
+    def consumed(self, amount):
+        self.gate.consumed(amount)
+
+class DeviceThrottle:
+    """
+    跨设备复制的 I/O 限制
+    按 (源设备, 目标设备) 分组：每组有同时复制的文件数量上限和复制速率上限，
+    未配置并发数时按实测吞吐量自动调整，避免并行复制导致机械硬盘或 NAS 来回寻道、吞吐量下降。
+    小文件和大文件的复制分别计算并发数（与分发器的处理通道一致），小文件不会等待大文件复制完成；
+    速率上限由同组设备的两个通道共用
+    """
+
+    def __init__(self, max_concurrency=0, auto_max_concurrency=4, bytes_per_second=0, large_file_size=0):
+        """
+        :param max_concurrency: 每组每个通道同时复制的文件数量上限，0 表示自动调整
+        :param auto_max_concurrency: 自动调整时的并发数上限
+        :param bytes_per_second: 每组复制速率上限（字节/秒），0 表示不限制
+        :param large_file_size: 使用大文件通道的文件大小（字节），0 表示不区分大小文件
+        """
+        self._gates = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.configure(max_concurrency, auto_max_concurrency, bytes_per_second, large_file_size)
+
+    def configure(self, max_concurrency=0, auto_max_concurrency=4, bytes_per_second=0, large_file_size=0):
+        """更新限制，已有的设备组立即生效（自动调整重新开始）"""
+        self.max_concurrency = max(0, int(max_concurrency))
+        self.auto_max_concurrency = max(1, int(auto_max_concurrency))
+        self.bytes_per_second = max(0, float(bytes_per_second))
+        self.large_file_size = max(0, int(large_file_size))
+        with self._lock:
+            for pair in self._buckets:
+                self._buckets[pair] = self._new_bucket()
+            for gate in self._gates.values():
+                gate.set_limit(*self._initial_limit())
+                gate.bucket = self._buckets[gate.key[:2]]
+
+    def _new_bucket(self):
+        """速率令牌桶，允许约一秒的突发；不限制速率时返回 None"""
+        if self.bytes_per_second > 0:
+            return TokenBucket(rate=self.bytes_per_second, capacity=self.bytes_per_second)
+        return None
+
+    def _initial_limit(self):
+        """返回 (初始并发数, 并发数上限, 是否自动调整)"""
+        if self.max_concurrency:
+            return self.max_concurrency, self.max_concurrency, False
+        # 自动调整从单个复制开始，逐步试探更高的并发数
+        return 1, self.auto_max_concurrency, True
+
+    def slot(self, source_device, target_device, size=0):
+        """获取一次复制的名额：with throttle.slot(源设备, 目标设备, 文件大小) as slot: ..."""
+        lane = LANE_LARGE if self.large_file_size and size >= self.large_file_size else LANE_SMALL
+        key = (source_device, target_device, lane)
+        gate = self._gates.get(key)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.get(key)
+                if gate is None:
+                    pair = key[:2]
+                    if pair not in self._buckets:
+                        self._buckets[pair] = self._new_bucket()
+                    limit, max_limit, auto = self._initial_limit()
+                    gate = self._gates[key] = _DeviceGate(key, limit, max_limit, auto, self._buckets[pair])
+        return _CopySlot(gate)
+
+    def get_stats(self):
+        """各设备组各通道的当前并发数上限、正在复制和排队的数量以及已复制的字节数，键为 (源设备->目标设备, 通道)"""
+        with self._lock:
+            gates = list(self._gates.values())
+        return {
+            (f"{gate.key[0]}->{gate.key[1]}", gate.key[2]): {
+                'limit': gate.limit,
+                'active': gate.active,
+                'waiting': gate.waiting,
+                'bytes': gate.total_bytes,
+            }
+            for gate in gates
+        }
@@ -0,0 +1,256 @@
+import os
+import mmap
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import namedtuple
+
+# 重复文件处理策略
+DUPLICATE_SKIP = 'skip'          # 保留源文件不移动
+DUPLICATE_DELETE = 'delete'      # 删除源文件
+DUPLICATE_HARDLINK = 'hardlink'  # 在目标目录中创建指向已有文件的硬链接，再删除源文件
+DUPLICATE_POLICIES = (DUPLICATE_SKIP, DUPLICATE_DELETE, DUPLICATE_HARDLINK)
+
+# 部分哈希读取文件开头和结尾各一个数据块；不超过两个数据块的文件，部分哈希即完整哈希
+PARTIAL_BLOCK_SIZE = 64 * 1024
+
+# 计算完整哈希时每次送入哈希函数的数据量
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 文件指纹：部分哈希和完整哈希（尚未计算时为 None）
+Fingerprint = namedtuple('Fingerprint', ['partial', 'full'])
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=20)
+
+def partial_hash(path, size):
+    """计算文件开头和结尾数据块的哈希"""
+    digest = _new_hash()
+    with open(path, 'rb', buffering=0) as file:
+        if size <= PARTIAL_BLOCK_SIZE * 2:
+            digest.update(file.read(size))
+        else:
+            digest.update(file.read(PARTIAL_BLOCK_SIZE))
+            file.seek(size - PARTIAL_BLOCK_SIZE)
+            digest.update(file.read(PARTIAL_BLOCK_SIZE))
+    return digest.hexdigest()
+
+def full_hash(path):
+    """通过内存映射流式计算文件内容的完整哈希，无法映射时退回普通读取"""
+    digest = _new_hash()
+    with open(path, 'rb', buffering=0) as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空文件或不支持映射的文件系统
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+        with mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                    digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+class _IndexedFile:
+    """索引中的单个文件"""
+
+    __slots__ = ('path', 'size', 'mtime_ns', 'partial', 'full')
+
+    def __init__(self, path, size, mtime_ns, partial=None, full=None):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.partial = partial
+        self.full = full
+
+class _DirectoryFiles:
+    """单个目标目录的文件索引，按大小分组便于筛选候选文件"""
+
+    __slots__ = ('by_size', 'by_path')
+
+    def __init__(self):
+        self.by_size = {}
+        self.by_path = {}
+
+    def put(self, indexed):
+        self.discard(indexed.path)
+        self.by_path[indexed.path] = indexed
+        self.by_size.setdefault(indexed.size, {})[indexed.path] = indexed
+
+    def discard(self, path):
+        indexed = self.by_path.pop(path, None)
+        if indexed is not None:
+            files = self.by_size[indexed.size]
+            del files[path]
+            if not files:
+                del self.by_size[indexed.size]
+
+class DuplicateIndex:
+    """
+    目标目录内容哈希索引，用于识别重复文件
+    候选文件先按大小筛选，再比较开头和结尾数据块的部分哈希，最后才计算完整哈希；
+    哈希只在需要比较时计算一次并持久化保存。每个目录首次使用时登记一次已有文件（只读取大小），
+    之后随文件移动增量更新，不再扫描目标目录
+    """
+
+    def __init__(self, index_path):
+        """
+        :param index_path: 索引数据库文件路径
+        """
+        self.index_path = index_path
+        self.logger = logging.getLogger(__name__)
+
+        # 规范化的目录路径 -> _DirectoryFiles
+        self._directories = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " directory TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " partial TEXT,"
+            " full TEXT)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY)")
+        self._connection.commit()
+
+    @staticmethod
+    def _directory_key(directory):
+        return os.path.normcase(os.path.abspath(directory))
+
+    def _get(self, directory):
+        """获取目录的内存索引，首次使用时从数据库加载或登记目录中已有的文件，必须在持有锁时调用"""
+        key = self._directory_key(directory)
+        directory_files = self._directories.get(key)
+        if directory_files is not None:
+            return directory_files
+
+        directory_files = _DirectoryFiles()
+        if self._connection.execute("SELECT 1 FROM directories WHERE path = ?", (key,)).fetchone():
+            rows = self._connection.execute(
+                "SELECT path, size, mtime_ns, partial, full FROM files WHERE directory = ?", (key,)
+            ).fetchall()
+            for path, size, mtime_ns, partial, full in rows:
+                directory_files.put(_IndexedFile(path, size, mtime_ns, partial, full))
+        else:
+            self._register_existing(directory, key, directory_files)
+        self._directories[key] = directory_files
+        return directory_files
+
+    def _register_existing(self, directory, key, directory_files):
+        """登记目录中已有的文件（只记录大小和修改时间，哈希在需要比较时再计算）"""
+        records = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    indexed = _IndexedFile(entry.path, stat_result.st_size, stat_result.st_mtime_ns)
+                    directory_files.put(indexed)
+                    records.append((indexed.path, key, indexed.size, indexed.mtime_ns))
+        except FileNotFoundError:
+            pass
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO files (path, directory, size, mtime_ns) VALUES (?, ?, ?, ?)", records
+        )
+        self._connection.execute("INSERT OR IGNORE INTO directories (path) VALUES (?)", (key,))
+        self._connection.commit()
+        self.logger.info(f"建立重复文件索引: {directory}, {len(records)} 个文件")
+
+    def find_duplicate(self, file_path, file_stat, target_dir):
+        """
+        在目标目录中查找与文件内容相同的已有文件
+        返回 (重复文件路径或 None, 源文件的 Fingerprint)；指纹中已计算的哈希可在登记移动结果时复用
+        """
+        size = file_stat.st_size
+        with self._lock:
+            candidates = list(self._get(target_dir).by_size.get(size, {}).values())
+        if not candidates:
+            return None, Fingerprint(None, None)
+
+        source_partial = partial_hash(file_path, size)
+        # 小文件的部分哈希已覆盖全部内容
+        whole = size <= PARTIAL_BLOCK_SIZE * 2
+        source_full = source_partial if whole else None
+        for candidate in candidates:
+            if not self._is_current(candidate):
+                continue
+            if candidate.partial is None:
+                candidate.partial = partial_hash(candidate.path, size)
+                self._store_hashes(candidate)
+            if candidate.partial != source_partial:
+                continue
+            if whole:
+                return candidate.path, Fingerprint(source_partial, source_full)
+            if source_full is None:
+                source_full = full_hash(file_path)
+            if candidate.full is None:
+                candidate.full = full_hash(candidate.path)
+                self._store_hashes(candidate)
+            if candidate.full == source_full:
+                return candidate.path, Fingerprint(source_partial, source_full)
+        return None, Fingerprint(source_partial, source_full)
+
+    def _is_current(self, candidate):
+        """检查索引记录是否仍与磁盘上的文件一致，文件已删除或被修改时更新索引"""
+        try:
+            stat_result = os.stat(candidate.path)
+        except FileNotFoundError:
+            self.remove(candidate.path)
+            return False
+        if stat_result.st_size != candidate.size or stat_result.st_mtime_ns != candidate.mtime_ns:
+            self.add(candidate.path, stat_result)
+            return False
+        return True
+
+    def add(self, file_path, file_stat, fingerprint=None):
+        """登记目标目录中新增（或被修改）的文件"""
+        partial, full = fingerprint if fingerprint is not None else (None, None)
+        indexed = _IndexedFile(file_path, file_stat.st_size, file_stat.st_mtime_ns, partial, full)
+        directory = os.path.dirname(file_path)
+        with self._lock:
+            self._get(directory).put(indexed)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (path, directory, size, mtime_ns, partial, full) VALUES (?, ?, ?, ?, ?, ?)",
+                (file_path, self._directory_key(directory), indexed.size, indexed.mtime_ns, partial, full)
+            )
+
+    def remove(self, file_path):
+        """从索引中移除文件"""
+        key = self._directory_key(os.path.dirname(file_path))
+        with self._lock:
+            directory_files = self._directories.get(key)
+            if directory_files is not None:
+                directory_files.discard(file_path)
+            self._connection.execute("DELETE FROM files WHERE path = ?", (file_path,))
+
+    def _store_hashes(self, indexed):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE files SET partial = ?, full = ? WHERE path = ?", (indexed.partial, indexed.full, indexed.path)
+            )
+
+    def commit(self):
+        """持久化未提交的索引更新"""
+        with self._lock:
+            self._connection.commit()
+
+    def close(self):
+        """提交剩余更新并关闭数据库"""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
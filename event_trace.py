@@ -0,0 +1,129 @@
+import os
+import gzip
+import time
+import struct
+import threading
+import logging
+
+# 文件头，读取时用于识别格式和版本
+TRACE_MAGIC = b'AFMTRACE1\n'
+
+# 记录类型：0 为路径定义，其余为文件事件
+_PATH_DEFINITION = 0
+EVENT_TYPES = ('created', 'modified', 'closed', 'moved', 'deleted')
+_EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES, start=1)}
+
+# 定长记录: 类型, 路径编号, 目标路径编号（moved 事件，其余为 0）, 时间戳, 文件大小
+# 路径定义记录复用同一结构: 类型 0, 路径编号, UTF-8 编码后的长度, 0, 0，紧跟路径内容
+_RECORD = struct.Struct('<BIIdQ')
+
+# 缓冲数据写入文件的最长间隔（秒）
+FLUSH_INTERVAL = 1.0
+
+class TraceWriter:
+    """
+    文件事件记录器
+    以紧凑的二进制格式记录监听到的文件事件（类型、路径、大小、时间），每个事件 25 字节，
+    路径只在首次出现时写入一次；文件名以 .gz 结尾时压缩。记录由 simulate.py 回放
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # 路径 -> 编号；文件被删除或移走后移除，记录期间占用的内存只与监听目录中的文件数量有关
+        self._path_ids = {}
+        self._next_id = 1
+        self._file = None
+        self._last_flush = 0.0
+        self.events = 0
+
+    def open(self):
+        """打开记录文件（追加到已有记录之后会破坏格式，因此总是重新创建）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        if self.path.endswith('.gz'):
+            self._file = gzip.open(self.path, 'wb', compresslevel=1)
+        else:
+            self._file = open(self.path, 'wb', buffering=1024 * 1024)
+        self._file.write(TRACE_MAGIC)
+        self._last_flush = time.monotonic()
+        self.logger.info(f"开始记录文件事件: {self.path}")
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        self.logger.info(f"文件事件记录已保存: {self.path}, {self.events} 个事件")
+
+    def record(self, event):
+        """记录一个文件事件（watchdog 事件对象），不支持的事件类型直接忽略"""
+        code = _EVENT_CODES.get(event.event_type)
+        if code is None or event.is_directory:
+            return
+        src_path = os.fsdecode(event.src_path)
+        dest_path = os.fsdecode(event.dest_path) if code == _EVENT_CODES['moved'] else None
+        size = 0
+        if code != _EVENT_CODES['deleted']:
+            try:
+                size = os.stat(dest_path or src_path).st_size
+            except OSError:
+                pass
+        timestamp = time.time()
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                src_id = self._path_id(src_path)
+                dest_id = self._path_id(dest_path) if dest_path is not None else 0
+                self._file.write(_RECORD.pack(code, src_id, dest_id, timestamp, size))
+                if code in (_EVENT_CODES['deleted'], _EVENT_CODES['moved']):
+                    self._path_ids.pop(src_path, None)
+                self.events += 1
+                now = time.monotonic()
+                if now - self._last_flush >= FLUSH_INTERVAL:
+                    self._last_flush = now
+                    self._file.flush()
+            except (OSError, ValueError) as e:
+                self.logger.error(f"写入文件事件记录失败，停止记录: {e}")
+                self._file = None
+
+    def _path_id(self, path):
+        """返回路径编号，首次出现时写入路径定义，必须在持有锁时调用"""
+        path_id = self._path_ids.get(path)
+        if path_id is None:
+            path_id = self._path_ids[path] = self._next_id
+            self._next_id += 1
+            encoded = path.encode('utf-8', 'surrogateescape')
+            self._file.write(_RECORD.pack(_PATH_DEFINITION, path_id, len(encoded), 0.0, 0))
+            self._file.write(encoded)
+        return path_id
+
+def read_trace(path):
+    """
+    读取事件记录，逐个返回 (时间戳, 事件类型, 路径, 目标路径, 文件大小)
+    目标路径只在 moved 事件中有值；记录末尾不完整（如程序异常退出）时忽略最后一条
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"不是事件记录文件: {path}")
+
+    paths = {0: None}
+    unpack_from = _RECORD.unpack_from
+    record_size = _RECORD.size
+    offset = len(TRACE_MAGIC)
+    end = len(data)
+    while offset + record_size <= end:
+        code, path_id, dest_id, timestamp, size = unpack_from(data, offset)
+        offset += record_size
+        if code == _PATH_DEFINITION:
+            if offset + dest_id > end:
+                break
+            paths[path_id] = data[offset:offset + dest_id].decode('utf-8', 'surrogateescape')
+            offset += dest_id
+            continue
+        yield timestamp, EVENT_TYPES[code - 1], paths[path_id], paths[dest_id], size
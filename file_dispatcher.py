@@ -0,0 +1,350 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+
+from metrics import stage_histogram
+
+# 未指定来源时使用的默认来源名称
+DEFAULT_SOURCE = 'default'
+
+# 处理通道：大文件使用单独的工作线程，小文件不会排在大文件的复制之后
+LANE_SMALL = 'small'
+LANE_LARGE = 'large'
+
+_QUEUE_SECONDS = stage_histogram('queue')
+
+class _SourceQueue:
+    """单个来源（监听目录）在一个处理通道中的等待队列和统计"""
+
+    __slots__ = ('name', 'lane', 'handler', 'priority', 'capacity', 'items', 'current_weight', 'saturated',
+                 'submitted', 'processed', 'failed', 'dropped', 'in_flight')
+
+    def __init__(self, name, lane, handler, priority, capacity):
+        self.name = name
+        self.lane = lane
+        self.handler = handler
+        self.priority = priority
+        self.capacity = capacity
+        # (文件路径, 入队时间)
+        self.items = deque()
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0
+        self.saturated = False
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.in_flight = 0
+
+    def get_stats(self):
+        return {
+            'priority': self.priority,
+            'queue_depth': len(self.items),
+            'in_flight': self.in_flight,
+            'submitted': self.submitted,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }
+
+class FileDispatcher:
+    """
+    文件分发器，使用有界工作线程池和任务队列处理文件
+    每个来源有独立的有界队列，工作线程按优先级加权轮询各来源，繁忙的来源不会饿死其他来源。
+    启用大文件通道时，达到大小阈值的文件进入单独的队列，由单独的工作线程逐个处理
+    """
+
+    def __init__(self, handler=None, max_workers=4, queue_size=1000, batch_size=1, batch_window=0,
+                 large_file_size=0, large_workers=1):
+        """
+        :param handler: 默认来源的处理回调函数，batch_size 为 1 时参数为单个文件路径，否则为文件路径列表
+        :param max_workers: 小文件通道的工作线程数量上限
+        :param queue_size: 每个来源的等待队列容量，队列满时该来源的提交方会被阻塞（背压）
+        :param batch_size: 每个工作线程一次取出的最大文件数量（同一批文件来自同一来源）
+        :param batch_window: 收集一批文件的最长等待时间（秒）
+        :param large_file_size: 进入大文件通道的文件大小（字节），0 表示不区分大小文件
+        :param large_workers: 大文件通道的工作线程数量
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.queue_size = max(1, int(queue_size))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_window = max(0, float(batch_window))
+        self.large_file_size = max(0, int(large_file_size))
+        self.large_workers = max(1, int(large_workers))
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        # 每个通道的工作线程只等待自己通道的队列
+        self._not_empty = {
+            LANE_SMALL: threading.Condition(self._lock),
+            LANE_LARGE: threading.Condition(self._lock),
+        }
+        self._not_full = threading.Condition(self._lock)
+        # (来源名称, 通道) -> _SourceQueue
+        self._sources = {}
+        self._workers = []
+        # 已排队和正在处理的路径，用于去重
+        self._queued = set()
+        self._active = set()
+        self._resubmit = {}
+        self._running = False
+
+        if handler is not None:
+            self.register_source(DEFAULT_SOURCE, handler)
+
+    def register_source(self, name, handler, priority=1, queue_size=None):
+        """
+        注册一个来源
+        :param handler: 该来源文件的处理回调函数
+        :param priority: 调度权重，权重越大分到的处理机会越多
+        :param queue_size: 该来源的队列容量（可选），默认使用分发器的队列容量
+        """
+        capacity = max(1, int(queue_size or self.queue_size))
+        with self._lock:
+            for lane in self._lanes():
+                source = self._sources.get((name, lane))
+                if source is None:
+                    self._sources[(name, lane)] = _SourceQueue(name, lane, handler, max(1, int(priority)), capacity)
+                else:
+                    source.handler = handler
+                    source.priority = max(1, int(priority))
+                    source.capacity = capacity
+
+    def _lanes(self):
+        """启用的处理通道"""
+        return (LANE_SMALL, LANE_LARGE) if self.large_file_size else (LANE_SMALL,)
+
+    def _select_lane(self, file_path):
+        """按文件大小选择处理通道"""
+        if not self.large_file_size:
+            return LANE_SMALL
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            return LANE_SMALL
+        return LANE_LARGE if size >= self.large_file_size else LANE_SMALL
+
+    def start(self):
+        """启动工作线程"""
+        if self._running:
+            return
+        self._running = True
+        for lane in self._lanes():
+            count = self.large_workers if lane == LANE_LARGE else self.max_workers
+            for index in range(count):
+                name = f"FileDispatcher-{index}" if lane == LANE_SMALL else f"FileDispatcher-large-{index}"
+                worker = threading.Thread(target=self._worker_loop, args=(lane,), name=name, daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        large = (f", 大文件通道 {self.large_workers} 个工作线程（{self.large_file_size // (1024 * 1024)} MB 以上）"
+                 if self.large_file_size else "")
+        self.logger.info(f"文件分发器已启动: 工作线程 {self.max_workers} 个, 队列容量 {self.queue_size}{large}")
+
+    def submit(self, file_path, timeout=None, source=DEFAULT_SOURCE):
+        """
+        提交文件到来源的处理队列
+        队列已满时阻塞等待，直到有空位或超时
+        同一路径已在队列中时直接合并；正在处理时，在处理结束后重新提交一次
+        返回 True 表示提交成功，False 表示分发器未运行或等待超时
+        """
+        # 在锁外读取文件大小
+        lane = self._select_lane(file_path)
+        with self._lock:
+            if not self._running:
+                self.logger.warning(f"文件分发器未运行，忽略文件: {file_path}")
+                return False
+            if file_path in self._queued:
+                self.logger.debug("文件已在处理队列中，合并事件: %s", file_path)
+                return True
+            if file_path in self._active:
+                self._resubmit[file_path] = source
+                return True
+
+            queue = self._sources[(source, lane)]
+            if len(queue.items) >= queue.capacity:
+                # 只在队列刚变满时告警一次，避免突发期间刷屏
+                if not queue.saturated:
+                    queue.saturated = True
+                    self.logger.warning(f"来源 {source} 的处理队列已满({queue.capacity})，暂停接收新文件直到有空位")
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._running and len(queue.items) >= queue.capacity:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        queue.dropped += 1
+                        self.logger.error(f"等待处理队列超时，丢弃文件: {file_path}")
+                        return False
+                    self._not_full.wait(remaining)
+                if not self._running:
+                    return False
+            else:
+                queue.saturated = False
+
+            queue.items.append((file_path, time.monotonic()))
+            queue.submitted += 1
+            self._queued.add(file_path)
+            # 收集批次中的工作线程只等待自己的来源，全部唤醒以免新文件等到批处理窗口结束
+            self._not_empty[lane].notify_all()
+            return True
+
+    def _select_source(self, lane):
+        """
+        按平滑加权轮询选出通道中下一个有待处理文件的来源，必须在持有锁时调用
+        每个来源的处理机会与其权重成正比，且不会连续集中在同一来源上
+        """
+        selected = None
+        total = 0
+        for queue in self._sources.values():
+            if queue.lane == lane and queue.items:
+                queue.current_weight += queue.priority
+                total += queue.priority
+                if selected is None or queue.current_weight > selected.current_weight:
+                    selected = queue
+        if selected is not None:
+            selected.current_weight -= total
+        return selected
+
+    def _next_batch(self, lane):
+        """
+        取出通道中的下一批文件
+        阻塞等待第一个文件，然后在批处理窗口内继续收集同一来源的文件，直到达到批大小上限；
+        大文件通道每次只取一个文件，不等待批处理窗口
+        返回 (来源, 文件列表)，分发器停止后返回 (None, [])
+        """
+        not_empty = self._not_empty[lane]
+        batch_size = 1 if lane == LANE_LARGE else self.batch_size
+        with self._lock:
+            queue = self._select_source(lane)
+            while queue is None:
+                if not self._running:
+                    return None, []
+                not_empty.wait()
+                queue = self._select_source(lane)
+
+            items = [queue.items.popleft()]
+            deadline = time.monotonic() + self.batch_window
+            while len(items) < batch_size:
+                # 先取走已在队列中的文件，再在窗口剩余时间内等待新文件
+                if queue.items:
+                    items.append(queue.items.popleft())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                not_empty.wait(remaining)
+
+            now = time.monotonic()
+            batch = []
+            for file_path, enqueued in items:
+                _QUEUE_SECONDS.observe(now - enqueued)
+                self._queued.discard(file_path)
+                self._active.add(file_path)
+                batch.append(file_path)
+            queue.in_flight += len(batch)
+            self._not_full.notify_all()
+            return queue, batch
+
+    def _worker_loop(self, lane):
+        """工作线程主循环"""
+        while True:
+            queue, batch = self._next_batch(lane)
+            if queue is None:
+                break
+            self._process_batch(queue, batch)
+
+    def _process_batch(self, queue, batch):
+        """处理一批文件"""
+        try:
+            if self.batch_size > 1:
+                queue.handler(batch)
+            else:
+                queue.handler(batch[0])
+            with self._lock:
+                queue.processed += len(batch)
+        except Exception as e:
+            self.logger.error(f"处理文件时发生未捕获的错误 {batch[0]} 等 {len(batch)} 个文件: {e}")
+            with self._lock:
+                queue.failed += len(batch)
+        finally:
+            with self._lock:
+                resubmit = []
+                for file_path in batch:
+                    self._active.discard(file_path)
+                    source = self._resubmit.pop(file_path, None)
+                    if source is not None:
+                        resubmit.append((file_path, source))
+                queue.in_flight -= len(batch)
+            # 处理期间同一路径又出现了新文件，重新提交
+            for file_path, source in resubmit:
+                if self._running and os.path.exists(file_path):
+                    self.submit(file_path, timeout=0, source=source)
+
+    def stop(self, wait=True):
+        """
+        停止工作线程
+        尚未开始处理的文件会被丢弃，正在处理的文件会等待其完成
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+
+            # 清空等待队列，避免退出时长时间阻塞
+            dropped = 0
+            for queue in self._sources.values():
+                dropped += len(queue.items)
+                queue.dropped += len(queue.items)
+                queue.items.clear()
+            self._queued.clear()
+            self._resubmit.clear()
+            for not_empty in self._not_empty.values():
+                not_empty.notify_all()
+            self._not_full.notify_all()
+        if dropped:
+            self.logger.warning(f"文件分发器停止，丢弃 {dropped} 个未处理的文件")
+
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+        for name, stats in self.get_stats()['sources'].items():
+            self.logger.info(
+                f"来源 {name}: 已提交 {stats['submitted']}, 已处理 {stats['processed']}, "
+                f"失败 {stats['failed']}, 丢弃 {stats['dropped']}"
+            )
+        self.logger.info("文件分发器已停止")
+
+    def get_queue_depth(self, source=None):
+        """获取等待处理的文件数量，不指定来源时返回所有来源的合计"""
+        with self._lock:
+            return sum(len(queue.items) for queue in self._sources.values() if source in (None, queue.name))
+
+    def get_in_flight(self):
+        """获取正在处理的文件数量"""
+        with self._lock:
+            return len(self._active)
+
+    def get_stats(self):
+        """获取分发器运行统计，sources 中为每个来源各通道合计的统计，lanes 中为每个通道的统计"""
+        sources = {}
+        lanes = {}
+        with self._lock:
+            for queue in self._sources.values():
+                stats = queue.get_stats()
+                for totals in (sources.setdefault(queue.name, {}), lanes.setdefault(queue.lane, {})):
+                    for key, value in stats.items():
+                        # 优先级各通道相同，不累加
+                        totals[key] = value if key == 'priority' else totals.get(key, 0) + value
+        for stats in lanes.values():
+            stats.pop('priority', None)
+        return {
+            'max_workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'queue_depth': sum(stats['queue_depth'] for stats in sources.values()),
+            'in_flight': sum(stats['in_flight'] for stats in sources.values()),
+            'processed': sum(stats['processed'] for stats in sources.values()),
+            'failed': sum(stats['failed'] for stats in sources.values()),
+            'sources': sources,
+            'lanes': lanes,
+        }
@@ -1,59 +1,55 @@
-import time
 import os
+import time
 import logging
 
 class FileIntegrityChecker:
     """文件完整性检查器"""
-    
+
     def __init__(self, check_delay=2):
         self.check_delay = check_delay
         self.logger = logging.getLogger(__name__)
-    
-    def is_file_complete(self, file_path):
+
+    def get_file_state(self, file_path):
         """
-        检查文件是否完整
-        通过在短时间内检查文件大小是否发生变化来判断
+        获取文件当前状态
+        返回 (文件大小, 修改时间纳秒) 元组，文件不存在或无法访问时返回 None
         """
-        if not os.path.exists(file_path):
-            self.logger.debug(f"文件不存在: {file_path}")
-            return False
-        
         try:
-            # 获取初始文件大小
-            initial_size = os.path.getsize(file_path)
-            self.logger.debug(f"初始文件大小: {initial_size} bytes")
-            
-            # 等待一段时间
-            time.sleep(self.check_delay)
-            
-            # 再次检查文件大小
-            current_size = os.path.getsize(file_path)
-            self.logger.debug(f"当前文件大小: {current_size} bytes")
-            
-            # 如果文件大小没有变化，则认为文件传输完成
-            if initial_size == current_size:
-                self.logger.debug(f"文件传输完成: {file_path}")
-                return True
-            else:
-                self.logger.debug(f"文件仍在传输中: {file_path}")
-                return False
+            stat_result = os.stat(file_path)
+        except FileNotFoundError:
+            self.logger.debug("文件不存在: %s", file_path)
+            return None
         except OSError as e:
-            self.logger.error(f"检查文件完整性时发生错误: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"检查文件完整性时发生未知错误: {e}")
-            return False
-    
-    def wait_for_file_complete(self, file_path, max_wait_time=30):
+            self.logger.error(f"获取文件状态时发生错误: {e}")
+            return None
+        return (stat_result.st_size, stat_result.st_mtime_ns)
+
+    def is_file_complete(self, file_path, previous_state):
+        """
+        检查文件是否完整
+        将当前状态与上一次记录的状态比较，大小和修改时间都没有变化则认为传输完成
+        不会休眠等待，调用方负责在两次检查之间留出静默期
+        返回 (是否完整, 当前状态)
+        """
+        current_state = self.get_file_state(file_path)
+        if current_state is None:
+            return False, None
+
+        if current_state == previous_state:
+            self.logger.debug("文件传输完成: %s", file_path)
+            return True, current_state
+
+        self.logger.debug("文件仍在传输中: %s, 当前大小: %d bytes", file_path, current_state[0])
+        return False, current_state
+
+    def is_at_rest(self, file_state, quiet_period=None):
         """
-        等待文件传输完成
-        返回 True 表示文件完整，False 表示超时或文件不完整
+        检查文件是否已经静默超过检查延迟
+        用于已存在或从其他位置移入的文件，无需再等待一个完整的静默期
+        :param quiet_period: 静默时间（秒，可选），默认使用检查延迟
         """
-        elapsed_time = 0
-        while elapsed_time < max_wait_time:
-            if self.is_file_complete(file_path):
-                return True
-            elapsed_time += self.check_delay
-        
-        self.logger.warning(f"等待文件完成超时: {file_path}")
-        return False
\ No newline at end of file
+        if file_state is None:
+            return False
+        if quiet_period is None:
+            quiet_period = self.check_delay
+        return time.time_ns() - file_state[1] >= quiet_period * 1_000_000_000
@@ -1,81 +1,488 @@
 import os
+import sys
+import time
+import errno
 import shutil
+import uuid
+import tempfile
 import logging
 from pathlib import Path
 
+from name_index import NameIndex
+from move_journal import STATE_COPIED, STATE_COMMITTED, STATE_ROLLED_BACK
+from duplicate_index import DUPLICATE_SKIP, DUPLICATE_DELETE, DUPLICATE_HARDLINK
+
+# 跨设备复制时每次系统调用传输的数据量
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 跨设备复制过程中写入的临时文件后缀
+TEMP_SUFFIX = '.afmpart'
+
+# 目标文件名被外部占用时的最大重试次数
+MAX_COMMIT_ATTEMPTS = 100
+
+# 表示文件系统不支持零拷贝的错误码，遇到时退回缓冲复制
+_ZERO_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}
+
+class BatchResult:
+    """批量移动结果，汇总一批文件的移动情况"""
+    
+    def __init__(self):
+        self.moved = []    # (源路径, 目标路径, 目标分类)
+        self.failed = []   # (源路径, 目标分类)
+        self.duplicates = []  # (源路径, 已有的相同文件路径, 目标分类)
+        self.bytes_moved = 0
+        self.start_time = time.monotonic()
+    
+    @property
+    def elapsed(self):
+        """从创建到现在经过的时间（秒）"""
+        return time.monotonic() - self.start_time
+    
+    def category_counts(self):
+        """按目标分类统计移动成功的文件数量，按数量从多到少排列"""
+        counts = {}
+        for _, _, category in self.moved:
+            counts[category] = counts.get(category, 0) + 1
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+    
+    def summary(self):
+        """生成简要说明，如 "312 个文件已移动: images 200, documents 112" """
+        parts = [f"{category} {count}" for category, count in self.category_counts().items()]
+        text = f"{len(self.moved)} 个文件已移动"
+        if parts:
+            text += ": " + ", ".join(parts)
+        if self.duplicates:
+            text += f"; {len(self.duplicates)} 个重复文件"
+        if self.failed:
+            text += f"; {len(self.failed)} 个文件移动失败"
+        return text
+
+class _MovePlan:
+    """单个文件的移动计划"""
+    
+    __slots__ = ('source_path', 'source_stat', 'filename', 'target_path', 'temp_path', 'move_id', 'fingerprint')
+    
+    def __init__(self, source_path, source_stat, filename):
+        self.source_path = source_path
+        self.source_stat = source_stat
+        self.filename = filename
+        self.target_path = None
+        self.temp_path = None
+        self.move_id = None
+        self.fingerprint = None
+
 class FileMover:
     """文件移动器，负责将文件移动到目标目录"""
     
-    def __init__(self, target_directories):
+    def __init__(self, target_directories, progress_interval=5, journal=None,
+                 duplicate_index=None, duplicate_policy=DUPLICATE_SKIP, name_index=None,
+                 directory_cache=None, throttle=None):
+        """
+        :param target_directories: 目标分类 -> 目标目录 映射
+        :param progress_interval: 跨设备复制进度日志的输出间隔（秒）
+        :param journal: 移动日志（可选），启用后每次移动都会记录进度，便于崩溃后恢复
+        :param duplicate_index: 重复文件索引（可选），启用后目标目录中已有相同内容的文件不再重复移动
+        :param duplicate_policy: 重复文件的处理策略: skip、delete 或 hardlink
+        :param name_index: 目标目录文件名索引（可选），多个移动器写入相同目录时应共用同一个索引
+        :param directory_cache: 已确认存在的目录 -> 设备号 缓存（可选），共用时重新创建移动器不会重复创建目录
+        :param throttle: 跨设备复制的 I/O 限制（可选，DeviceThrottle），多个移动器应共用同一个实例
+        """
         self.target_directories = target_directories
+        self.progress_interval = progress_interval
+        self.journal = journal
+        self.duplicate_index = duplicate_index
+        self.duplicate_policy = duplicate_policy
+        self.name_index = name_index if name_index is not None else NameIndex()
+        self.throttle = throttle
         self.logger = logging.getLogger(__name__)
         
+        # 已确认存在的目标目录 -> 设备号，避免每个文件都重复 mkdir 和 stat
+        self._known_directories = directory_cache if directory_cache is not None else {}
+        
         # 确保所有目标目录都存在
         self._ensure_target_directories_exist()
     
     def _ensure_target_directories_exist(self):
         """确保所有目标目录都存在"""
         for name, path in self.target_directories.items():
+            if path in self._known_directories:
+                continue
             try:
-                Path(path).mkdir(parents=True, exist_ok=True)
+                self._ensure_directory(path)
                 self.logger.debug(f"确保目标目录存在: {path}")
             except Exception as e:
                 self.logger.error(f"创建目标目录失败 {path}: {e}")
     
+    def _ensure_directory(self, target_dir):
+        """
+        确保目标目录存在，返回其设备号
+        结果会被缓存，同一目录只在首次使用（或移动失败后）创建一次
+        """
+        device = self._known_directories.get(target_dir)
+        if device is None:
+            Path(target_dir).mkdir(parents=True, exist_ok=True)
+            device = os.stat(target_dir).st_dev
+            self._known_directories[target_dir] = device
+        return device
+    
     def move_file(self, file_path, target_category):
         """
         将文件移动到目标目录
         返回移动后的文件路径，如果移动失败则返回None
         """
-        if not os.path.exists(file_path):
-            self.logger.error(f"源文件不存在: {file_path}")
-            return None
+        result = self.move_batch(target_category, [file_path])
+        if result.moved:
+            return result.moved[0][1]
+        return None
+    
+    def move_batch(self, target_category, file_paths, result=None):
+        """
+        将同一分类的一组文件移动到目标目录
+        目标目录每批只检查一次，结果汇总到 BatchResult 中
+        :param result: 已有的批量结果（可选），用于汇总多个分类
+        """
+        if result is None:
+            result = BatchResult()
         
         # 获取目标目录路径
         target_dir = self.target_directories.get(target_category)
         if not target_dir:
             self.logger.error(f"目标目录未定义: {target_category}")
-            return None
+            result.failed.extend((file_path, target_category) for file_path in file_paths)
+            return result
         
         # 确保目标目录存在
         try:
-            Path(target_dir).mkdir(parents=True, exist_ok=True)
+            target_device = self._ensure_directory(target_dir)
         except Exception as e:
             self.logger.error(f"创建目标目录失败 {target_dir}: {e}")
-            return None
+            result.failed.extend((file_path, target_category) for file_path in file_paths)
+            return result
         
-        # 获取文件名
-        filename = os.path.basename(file_path)
+        # 逐个文件生成移动计划；启用移动日志时先预留目标文件名，整批意图一次性持久化
+        plans = []
+        for file_path in file_paths:
+            try:
+                source_stat = os.stat(file_path)
+            except FileNotFoundError:
+                self.logger.error(f"源文件不存在: {file_path}")
+                result.failed.append((file_path, target_category))
+                continue
+            except OSError as e:
+                self.logger.error(f"文件移动失败 {file_path} -> {target_dir}: {e}")
+                result.failed.append((file_path, target_category))
+                continue
+            plan = _MovePlan(file_path, source_stat, os.path.basename(file_path))
+            if self.journal:
+                plan.target_path = self.name_index.reserve(target_dir, plan.filename)
+                if source_stat.st_dev != target_device:
+                    plan.temp_path = os.path.join(target_dir, f".{uuid.uuid4().hex}{TEMP_SUFFIX}")
+            plans.append(plan)
+        
+        if self.journal and plans:
+            move_ids = self.journal.record_intents(
+                [(plan.source_path, plan.target_path, plan.temp_path) for plan in plans]
+            )
+            for plan, move_id in zip(plans, move_ids):
+                plan.move_id = move_id
         
-        # 构建目标文件路径
-        target_path = os.path.join(target_dir, filename)
+        single = len(file_paths) == 1
+        try:
+            for plan in plans:
+                file_path = plan.source_path
+                if self.duplicate_index and self._handle_duplicate(plan, target_dir, target_category, result):
+                    continue
+                
+                # 移动文件，目标文件名由文件名索引预留，冲突时自动添加数字后缀
+                try:
+                    target_path = self._move(plan, target_dir, target_device)
+                except Exception as e:
+                    self._handle_failure(plan, target_dir, e)
+                    result.failed.append((file_path, target_category))
+                    continue
+                
+                if self.journal:
+                    self.journal.mark(plan.move_id, STATE_COMMITTED)
+                if self.duplicate_index:
+                    # 移动保留了文件大小和修改时间，已计算的哈希直接登记
+                    self.duplicate_index.add(target_path, plan.source_stat, plan.fingerprint)
+                result.moved.append((file_path, target_path, target_category))
+                result.bytes_moved += plan.source_stat.st_size
+                if single:
+                    self.logger.info("文件移动成功: %s -> %s", file_path, target_path)
+                else:
+                    self.logger.debug("文件移动成功: %s -> %s", file_path, target_path)
+        finally:
+            if self.journal and plans:
+                # 整批移动结果一次性持久化
+                self.journal.commit()
+            if self.duplicate_index and plans:
+                self.duplicate_index.commit()
         
-        # 处理文件名冲突
-        target_path = self._resolve_filename_conflict(target_path)
+        return result
+    
+    def _handle_duplicate(self, plan, target_dir, target_category, result):
+        """
+        检查目标目录中是否已有相同内容的文件，有则按重复文件策略处理
+        返回 True 表示文件已作为重复文件处理，不再移动
+        """
+        try:
+            duplicate_path, plan.fingerprint = self.duplicate_index.find_duplicate(
+                plan.source_path, plan.source_stat, target_dir
+            )
+        except OSError as e:
+            # 无法计算哈希时按普通文件移动
+            self.logger.warning(f"重复文件检查失败 {plan.source_path}: {e}")
+            return False
+        if duplicate_path is None:
+            return False
         
-        # 移动文件
+        policy = self.duplicate_policy
         try:
-            shutil.move(file_path, target_path)
-            self.logger.info(f"文件移动成功: {file_path} -> {target_path}")
-            return target_path
-        except Exception as e:
-            self.logger.error(f"文件移动失败 {file_path} -> {target_path}: {e}")
-            return None
+            if policy == DUPLICATE_HARDLINK:
+                linked_path = self._link_duplicate(plan, duplicate_path, target_dir)
+                if linked_path is None:
+                    return False
+                os.unlink(plan.source_path)
+                self.logger.info("重复文件已链接: %s -> %s (与 %s 相同)", plan.source_path, linked_path, duplicate_path)
+            elif policy == DUPLICATE_DELETE:
+                os.unlink(plan.source_path)
+                self.logger.info("重复文件已删除: %s (与 %s 相同)", plan.source_path, duplicate_path)
+            else:
+                self.logger.info("重复文件已跳过: %s (与 %s 相同)", plan.source_path, duplicate_path)
+        except OSError as e:
+            self.logger.error(f"重复文件处理失败 {plan.source_path}: {e}")
+            result.failed.append((plan.source_path, target_category))
+            policy = None
+        else:
+            result.duplicates.append((plan.source_path, duplicate_path, target_category))
+        
+        # 没有使用预留的目标文件名时释放它，移动日志中的记录直接结束
+        if policy != DUPLICATE_HARDLINK:
+            if plan.target_path is not None and not os.path.lexists(plan.target_path):
+                self.name_index.release(plan.target_path)
+            if self.journal:
+                self.journal.mark(plan.move_id, STATE_ROLLED_BACK)
+        elif self.journal:
+            self.journal.mark(plan.move_id, STATE_COMMITTED)
+        return True
     
-    def _resolve_filename_conflict(self, target_path):
+    def _link_duplicate(self, plan, duplicate_path, target_dir):
         """
-        解决文件名冲突，通过添加数字后缀
+        在目标目录中创建指向已有相同文件的硬链接，返回链接路径
+        文件系统不支持硬链接时返回 None，由调用方按普通文件移动
         """
-        if not os.path.exists(target_path):
-            return target_path
+        if plan.target_path is None:
+            plan.target_path = self.name_index.reserve(target_dir, plan.filename)
+        for _ in range(MAX_COMMIT_ATTEMPTS):
+            try:
+                os.link(duplicate_path, plan.target_path)
+            except FileExistsError:
+                plan.target_path = self.name_index.reserve(target_dir, plan.filename)
+                if self.journal:
+                    self.journal.set_target(plan.move_id, plan.target_path)
+                continue
+            except (OSError, NotImplementedError) as e:
+                self.logger.warning(f"无法创建硬链接，按普通文件移动 {plan.source_path}: {e}")
+                return None
+            self.duplicate_index.add(plan.target_path, os.stat(plan.target_path), plan.fingerprint)
+            return plan.target_path
+        raise FileExistsError(f"无法在 {target_dir} 中为 {plan.filename} 找到可用的文件名")
+    
+    def _handle_failure(self, plan, target_dir, error):
+        """记录移动失败，并立即收尾移动日志中的对应记录"""
+        if isinstance(error, FileNotFoundError) and not os.path.exists(plan.source_path):
+            self.logger.error(f"源文件不存在: {plan.source_path}")
+        else:
+            if isinstance(error, FileNotFoundError):
+                # 目标目录可能已被删除，下次使用时重新创建
+                self._known_directories.pop(target_dir, None)
+            self.logger.error(f"文件移动失败 {plan.source_path} -> {target_dir}: {error}")
         
-        # 分离文件名和扩展名
-        base_name, extension = os.path.splitext(target_path)
-        counter = 1
+        if self.journal:
+            if os.path.lexists(plan.source_path) or os.path.lexists(plan.target_path):
+                self.journal.reconcile(plan.move_id, plan.source_path, plan.target_path, plan.temp_path)
+            else:
+                # 源文件在移动前已消失，没有需要收尾的内容
+                self.journal.mark(plan.move_id, STATE_ROLLED_BACK)
+            if not os.path.lexists(plan.target_path):
+                self.name_index.release(plan.target_path)
+    
+    def _move(self, plan, target_dir, target_device):
+        """
+        按计划移动单个文件，返回最终的目标路径
+        源文件和目标目录位于同一设备时直接链接/重命名，否则先复制到目标目录中的临时文件
+        """
+        if plan.source_stat.st_dev == target_device:
+            try:
+                target_path = self._commit(plan.source_path, target_dir, plan)
+                self.logger.debug("同设备重命名: %s -> %s", plan.source_path, target_path)
+                return target_path
+            except OSError as e:
+                # 绑定挂载等情况下设备号相同但仍无法重命名，退回复制
+                if e.errno != errno.EXDEV:
+                    raise
+        return self._copy_across_devices(plan, target_dir, target_device)
+    
+    def _commit(self, staged_path, target_dir, plan):
+        """
+        以不覆盖已有文件的方式把 staged_path 放到目标目录，返回最终路径
+        优先使用计划中预留的文件名；名称被其他进程抢先占用时，预留下一个名称重试
+        """
+        if plan.target_path is None:
+            plan.target_path = self.name_index.reserve(target_dir, plan.filename)
+        for _ in range(MAX_COMMIT_ATTEMPTS):
+            target_path = plan.target_path
+            try:
+                self._place_exclusive(staged_path, target_path)
+                return target_path
+            except FileExistsError:
+                # 名称保持为已占用状态，下次预留会跳过它
+                self.logger.debug("目标文件已存在，重新选择文件名: %s", target_path)
+                plan.target_path = self.name_index.reserve(target_dir, plan.filename)
+                if self.journal:
+                    self.journal.set_target(plan.move_id, plan.target_path)
+            except BaseException:
+                if not self.journal:
+                    self.name_index.release(target_path)
+                    plan.target_path = None
+                raise
+        raise FileExistsError(f"无法在 {target_dir} 中为 {plan.filename} 找到可用的文件名")
+    
+    @staticmethod
+    def _place_exclusive(source_path, target_path):
+        """
+        把文件放到目标路径，目标已存在时抛出 FileExistsError 而不是覆盖
+        优先使用硬链接后删除源名称；文件系统不支持硬链接时，先独占创建占位文件再替换
+        """
+        try:
+            os.link(source_path, target_path)
+        except FileExistsError:
+            raise
+        except (OSError, NotImplementedError):
+            fd = os.open(target_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            try:
+                os.replace(source_path, target_path)
+            except BaseException:
+                os.unlink(target_path)
+                raise
+            return
+        os.unlink(source_path)
+    
+    def _copy_across_devices(self, plan, target_dir, target_device):
+        """
+        跨设备移动：复制到目标目录中的临时文件，fsync 后以独占方式放到目标路径，最后删除源文件
+        失败时删除临时文件，不会在目标目录留下不完整的文件
+        启用 I/O 限制时，复制前等待该组设备的复制名额，复制过程按速率上限限流
+        返回最终的目标路径
+        """
+        source_path = plan.source_path
+        size = plan.source_stat.st_size
+        if plan.temp_path:
+            temp_path = plan.temp_path
+            temp_fd = os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o600)
+        else:
+            temp_fd, temp_path = tempfile.mkstemp(prefix='.', suffix=TEMP_SUFFIX, dir=target_dir)
+        start_time = time.monotonic()
+        try:
+            try:
+                if self.throttle is None:
+                    with open(source_path, 'rb', buffering=0) as source:
+                        copied = self._copy_data(source, temp_fd, size, source_path)
+                    os.fsync(temp_fd)
+                else:
+                    with self.throttle.slot(plan.source_stat.st_dev, target_device, size) as slot:
+                        with open(source_path, 'rb', buffering=0) as source:
+                            copied = self._copy_data(source, temp_fd, size, source_path, slot)
+                        os.fsync(temp_fd)
+            finally:
+                os.close(temp_fd)
+            shutil.copystat(source_path, temp_path)
+            target_path = self._commit(temp_path, target_dir, plan)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        
+        self._fsync_directory(target_dir)
+        if self.journal:
+            self.journal.mark(plan.move_id, STATE_COPIED)
+        os.unlink(source_path)
+        
+        elapsed = max(time.monotonic() - start_time, 1e-6)
+        self.logger.info(
+            f"跨设备复制完成: {copied} bytes, 用时 {elapsed:.2f} 秒, {copied / elapsed / 1024 / 1024:.1f} MB/s"
+        )
+        return target_path
+    
+    def _copy_data(self, source, target_fd, size, source_path, slot=None):
+        """
+        将源文件数据复制到目标文件描述符
+        优先使用内核态零拷贝（copy_file_range / sendfile），不支持时退回用户态缓冲复制
+        :param slot: I/O 限制的复制名额（可选），每复制一块数据向其报告字节数，超过速率上限时在此等待
+        返回复制的字节数
+        """
+        source_fd = source.fileno()
+        copied = 0
+        start_time = time.monotonic()
+        last_report = start_time
+        # 按优先级排列的零拷贝方式，旧内核上 copy_file_range 不支持跨文件系统时改用 sendfile
+        zero_copy_methods = []
+        if hasattr(os, 'copy_file_range'):
+            zero_copy_methods.append(os.copy_file_range)
+        if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            zero_copy_methods.append(lambda src, dst, count: os.sendfile(dst, src, None, count))
+        view = None
         
-        # 循环查找可用的文件名
         while True:
-            new_path = f"{base_name}_{counter}{extension}"
-            if not os.path.exists(new_path):
-                return new_path
-            counter += 1
\ No newline at end of file
+            sent = None
+            while zero_copy_methods and sent is None:
+                try:
+                    sent = zero_copy_methods[0](source_fd, target_fd, COPY_CHUNK_SIZE)
+                except OSError as e:
+                    if e.errno not in _ZERO_COPY_UNSUPPORTED:
+                        raise
+                    # 不支持时从当前偏移继续尝试下一种方式，最终退回缓冲复制
+                    self.logger.debug(f"零拷贝方式不可用: {e}")
+                    zero_copy_methods.pop(0)
+            if sent is None:
+                if view is None:
+                    view = memoryview(bytearray(min(COPY_CHUNK_SIZE, max(size, 1))))
+                sent = source.readinto(view)
+                written = 0
+                while written < sent:
+                    written += os.write(target_fd, view[written:sent])
+            if not sent:
+                break
+            copied += sent
+            if slot is not None:
+                slot.consumed(sent)
+            
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                percent = copied * 100 / size if size else 100
+                rate = copied / (now - start_time) / 1024 / 1024
+                self.logger.info(f"复制进度 {source_path}: {percent:.0f}%, {rate:.1f} MB/s")
+        
+        return copied
+    
+    @staticmethod
+    def _fsync_directory(directory):
+        """同步目录项，保证重命名在断电后仍然可见（Windows 不支持，直接跳过）"""
+        if sys.platform == "win32":
+            return
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
@@ -1,53 +1,136 @@
-import time
 import os
-import threading
 from pathlib import Path
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import logging
 
 class FileHandler(FileSystemEventHandler):
-    """文件事件处理器"""
+    """文件事件处理器，将事件转交给稳定性跟踪器"""
     
-    def __init__(self, callback):
-        self.callback = callback
+    def __init__(self, stability_tracker, ignore_suffixes=None, exclude_directories=None, trace_writer=None):
+        """
+        :param stability_tracker: 稳定性跟踪器
+        :param ignore_suffixes: 需要忽略的临时文件后缀
+        :param exclude_directories: 不处理的子目录（如位于监听目录内的目标目录），避免移动后的文件被再次处理
+        :param trace_writer: 文件事件记录器（可选），记录所有文件事件（包括被忽略的），用于离线模拟
+        """
+        self.stability_tracker = stability_tracker
+        self.trace_writer = trace_writer
         self.logger = logging.getLogger(__name__)
+        self.configure(ignore_suffixes, exclude_directories)
+    
+    def configure(self, ignore_suffixes=None, exclude_directories=None):
+        """更新忽略后缀和排除目录，可在运行中调用，不会丢失事件"""
+        # 统一转为小写元组，便于 str.endswith 一次匹配
+        self.ignore_suffixes = tuple(suffix.lower() for suffix in (ignore_suffixes or []))
+        self.exclude_prefixes = tuple(
+            os.path.join(os.path.abspath(directory), '') for directory in (exclude_directories or [])
+        )
+    
+    def _is_ignored(self, file_path):
+        """检查文件是否为应忽略的临时下载文件，或位于排除的子目录中"""
+        if self.ignore_suffixes and file_path.lower().endswith(self.ignore_suffixes):
+            return True
+        return bool(self.exclude_prefixes) and file_path.startswith(self.exclude_prefixes)
+    
+    def on_any_event(self, event):
+        """在分类处理之前记录事件"""
+        if self.trace_writer is not None:
+            self.trace_writer.record(event)
     
     def on_created(self, event):
         """处理文件创建事件"""
-        if not event.is_directory:
-            self.logger.debug(f"检测到新文件: {event.src_path}")
-            # 在新线程中处理文件，避免阻塞事件处理
-            threading.Thread(target=self.callback, args=(event.src_path,), daemon=True).start()
+        if not event.is_directory and not self._is_ignored(event.src_path):
+            self.logger.debug("检测到新文件: %s", event.src_path)
+            self.stability_tracker.track(event.src_path)
+    
+    def on_modified(self, event):
+        """处理文件修改事件，重置该文件的静默计时"""
+        if not event.is_directory and not self._is_ignored(event.src_path):
+            self.stability_tracker.touch(event.src_path)
+    
+    def on_closed(self, event):
+        """处理文件关闭事件（仅部分平台支持），文件写入完成后立即处理"""
+        if not event.is_directory and not self._is_ignored(event.src_path):
+            self.logger.debug("检测到文件关闭: %s", event.src_path)
+            self.stability_tracker.mark_closed(event.src_path)
     
     def on_moved(self, event):
-        """处理文件移动事件"""
+        """
+        处理文件移动事件
+        跟随重命名（如浏览器下载完成后 .crdownload -> 正式文件名），同一个文件只处理一次
+        """
+        if event.is_directory:
+            return
+        self.logger.debug("检测到文件移动: %s -> %s", event.src_path, event.dest_path)
+        if self._is_ignored(event.dest_path):
+            self.stability_tracker.discard(event.src_path)
+            return
+        self.stability_tracker.rename(event.src_path, event.dest_path)
+    
+    def on_deleted(self, event):
+        """处理文件删除事件"""
         if not event.is_directory:
-            self.logger.debug(f"检测到文件移动: {event.dest_path}")
-            # 在新线程中处理文件，避免阻塞事件处理
-            threading.Thread(target=self.callback, args=(event.dest_path,), daemon=True).start()
+            self.stability_tracker.discard(event.src_path)
 
 class FileWatcher:
-    """文件监听器"""
+    """
+    文件监听器
+    所有监听目录共用一个 Observer，每个目录使用自己的事件处理器和稳定性跟踪器
+    """
     
-    def __init__(self, watch_directory, file_callback):
-        self.watch_directory = watch_directory
-        self.file_callback = file_callback
+    def __init__(self, watch_directory=None, stability_tracker=None, ignore_suffixes=None, recursive=False,
+                 trace_writer=None):
+        # 平台的 Observer 实现（inotify 等）导入较慢，只在使用文件系统事件监听时导入
+        from watchdog.observers import Observer
         self.observer = Observer()
+        self.trace_writer = trace_writer
         self.logger = logging.getLogger(__name__)
+        # (目录绝对路径, 是否递归) -> (ObservedWatch, FileHandler)
+        self._directories = {}
         
+        if watch_directory is not None:
+            self.add_directory(watch_directory, stability_tracker, ignore_suffixes, recursive)
+    
+    def add_directory(self, watch_directory, stability_tracker, ignore_suffixes=None, recursive=False,
+                      exclude_directories=None):
+        """
+        添加监听目录，可在启动前或启动后调用，不影响其他目录的监听
+        :param recursive: 是否同时监听所有子目录
+        :param exclude_directories: 不处理的子目录
+        """
         # 确保监听目录存在
         Path(watch_directory).mkdir(parents=True, exist_ok=True)
+        
+        event_handler = FileHandler(stability_tracker, ignore_suffixes, exclude_directories, self.trace_writer)
+        watch = self.observer.schedule(event_handler, watch_directory, recursive=recursive)
+        self._directories[(os.path.abspath(watch_directory), recursive)] = (watch, event_handler)
+        mode = "（包含子目录）" if recursive else ""
+        self.logger.info(f"开始监听目录: {watch_directory}{mode}")
+    
+    def update_directory(self, watch_directory, recursive, ignore_suffixes=None, exclude_directories=None):
+        """更新监听目录的忽略后缀和排除目录，不需要重新调度"""
+        entry = self._directories.get((os.path.abspath(watch_directory), recursive))
+        if entry is not None:
+            entry[1].configure(ignore_suffixes, exclude_directories)
+    
+    def remove_directory(self, watch_directory, recursive):
+        """停止监听目录，不影响其他目录的监听"""
+        entry = self._directories.pop((os.path.abspath(watch_directory), recursive), None)
+        if entry is None:
+            return
+        try:
+            self.observer.unschedule(entry[0])
+        except KeyError:
+            pass
+        self.logger.info(f"停止监听目录: {watch_directory}")
     
     def start(self):
         """启动文件监听"""
-        event_handler = FileHandler(self.file_callback)
-        self.observer.schedule(event_handler, self.watch_directory, recursive=False)
         self.observer.start()
-        self.logger.info(f"开始监听目录: {self.watch_directory}")
+        self.logger.info("文件监听已启动")
     
     def stop(self):
         """停止文件监听"""
         self.observer.stop()
         self.observer.join()
-        self.logger.info("文件监听已停止")
\ No newline at end of file
+        self.logger.info("文件监听已停止")
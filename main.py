@@ -1,59 +1,108 @@
+import time
+
+# 主模块开始导入的时间，用于统计启动用时
+IMPORT_TIME = time.perf_counter()
+
 import os
 import sys
+import signal
 import logging
+import argparse
 import threading
-import time
 import subprocess
+import functools
 from pathlib import Path
 
 from config_manager import config_manager
-from file_watcher import FileWatcher
+from file_dispatcher import FileDispatcher
 from file_integrity_checker import FileIntegrityChecker
+from stability_tracker import StabilityTracker
+from completion_detector import CompletionDetector
+from backlog_scanner import BacklogScanner
+from file_mover import FileMover, BatchResult
+from name_index import NameIndex
+from device_throttle import DeviceThrottle
 from rule_engine import RuleEngine
-from file_mover import FileMover
+from watch_source import WatchSource, SourcePipeline, BACKEND_POLLING, BACKENDS
+from move_journal import MoveJournal
+from duplicate_index import DuplicateIndex, DUPLICATE_POLICIES, DUPLICATE_SKIP
 from notification_manager import notification_manager
-from tray_manager import TrayManager
+from async_logging import AsyncLogWriter
+from metrics import metrics, stage_histogram, format_snapshot, MetricsServer
+
+_CLASSIFY_SECONDS = stage_histogram('classify')
+_MOVE_SECONDS = stage_histogram('move')
+_FILES_MOVED = metrics.counter('afm_files_moved_total', "移动成功的文件数量")
+_FILES_FAILED = metrics.counter('afm_files_failed_total', "移动失败的文件数量")
+_FILES_SKIPPED_DUPLICATE = metrics.counter('afm_files_skipped_total', "跳过处理的文件数量", reason='duplicate')
+_FILES_SKIPPED_MISSING = metrics.counter('afm_files_skipped_total', "跳过处理的文件数量", reason='missing')
+_BYTES_MOVED = metrics.counter('afm_bytes_moved_total', "移动的字节数")
 
 class AutoFileMover:
-    """文件自动转移主程序"""
+    """
+    文件自动转移主程序
+    图形模式下运行系统托盘图标；无界面模式（headless）下不加载托盘和 Tk，适合在服务器上作为守护进程运行
+    """
     
-    def __init__(self):
+    def __init__(self, config_path=None, headless=False, enable_notifications=None):
+        """
+        :param config_path: 配置文件路径（可选），默认使用当前目录下的 config.yaml
+        :param headless: 是否以无界面模式运行
+        :param enable_notifications: 是否发送通知（可选），指定时覆盖配置文件中的设置
+        """
+        if config_path:
+            config_manager.set_config_path(config_path)
+        self.headless = headless
+        self.notifications_override = enable_notifications
         self.setup_logging()
         self.logger = logging.getLogger(__name__)
         
         # 初始化组件
+        self.journal = None
+        self.duplicate_index = None
         self.init_components()
         
         # 初始化状态
         self.running = False
         self.watcher_thread = None
-        
-        # 初始化系统托盘
-        self.tray_manager = TrayManager(
-            on_open_config=self.open_config,
-            on_reload_config=self.reload_config,
-            on_exit=self.stop
-        )
+        self.dispatcher = None
+        self.classifier_pool = None
+        self.batch_enabled = False
+        self.event_watcher = None
+        self.polling_watcher = None
+        self.trace_writer = None
+        self._reload_lock = threading.Lock()
+        self._config_watch_stop = threading.Event()
+        self._config_watch_thread = None
+        self.metrics_server = None
+        self._metrics_log_stop = threading.Event()
+        self._metrics_log_thread = None
+        self._stop_event = threading.Event()
+        self.tray_manager = None
     
     def setup_logging(self):
-        """设置日志"""
+        """
+        设置日志
+        日志记录先进入队列，由单独的写入线程批量格式化和写入，处理文件的线程不等待磁盘和控制台 I/O
+        """
         log_file = config_manager.get_log_file()
+        json_file = config_manager.get_log_json_file()
         debug_mode = config_manager.is_debug_mode()
         
         # 创建日志目录
-        log_path = Path(log_file).parent
-        log_path.mkdir(parents=True, exist_ok=True)
+        for path in (log_file, json_file):
+            if path:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
         
-        # 配置日志格式
         log_level = logging.DEBUG if debug_mode else logging.INFO
-        logging.basicConfig(
+        self.log_writer = AsyncLogWriter(
+            log_file,
             level=log_level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
-            ]
+            max_bytes=int(config_manager.get_log_max_size() * 1024 * 1024),
+            backup_count=config_manager.get_log_backup_count(),
+            json_file=json_file or None
         )
+        self.log_writer.start()
     
     def init_components(self):
         """初始化核心组件"""
@@ -64,43 +113,355 @@ class AutoFileMover:
         check_delay = config_manager.get_integrity_check_delay()
         self.integrity_checker = FileIntegrityChecker(check_delay)
         
-        # 初始化规则引擎
-        rules = config_manager.get_rules()
-        default_target = config_manager.get_default_target()
-        self.rule_engine = RuleEngine(rules, default_target)
+        # 所有监听目录共用写入完成判定，打开句柄的扫描结果在所有待检查的文件之间共用
+        self.completion_detector = CompletionDetector()
+        self.configure_completion()
         
-        # 初始化文件移动器
-        target_directories = config_manager.get_target_directories()
-        self.file_mover = FileMover(target_directories)
+        # 所有文件移动器共用文件名索引和目录缓存，写入同一目标目录时不会冲突，重新加载配置时也不会重复创建目录
+        self.name_index = NameIndex()
+        self.directory_cache = {}
         
-        # 初始化通知管理器
-        enable_notifications = config_manager.is_notification_enabled()
-        enable_sound = config_manager.is_sound_enabled()
+        # 所有文件移动器共用跨设备复制的 I/O 限制，同一组设备的复制名额和速率上限在所有监听目录之间共享
+        self.io_throttle = DeviceThrottle()
+        self.configure_io_throttle()
+        
+        # 初始化通知管理器，创建监听目录时需要报告无效的规则
         self.notification_manager = notification_manager
-        self.notification_manager.enable_notifications = enable_notifications
-        self.notification_manager.enable_sound = enable_sound
+        self.configure_notifications()
+        
+        # 初始化监听目录，每个目录有自己的规则引擎和文件移动器
+        self.sources = []
+        for source_config in config_manager.get_watch_sources():
+            source = self.create_source(source_config)
+            self.sources.append(source)
+        self.check_source_overlap()
+    
+    def configure_completion(self):
+        """按当前配置设置默认的写入完成判定方式，附属文件后缀未配置时使用忽略的临时文件后缀"""
+        self.completion_detector.configure(
+            default_strategies=config_manager.get_completion_strategies(),
+            probe_interval=config_manager.get_completion_probe_interval(),
+            sidecar_suffixes=config_manager.get_sidecar_suffixes() or config_manager.get_ignore_suffixes()
+        )
+    
+    def configure_io_throttle(self):
+        """按当前配置设置跨设备复制的并发数和速率上限"""
+        self.io_throttle.configure(
+            max_concurrency=config_manager.get_io_max_concurrency(),
+            auto_max_concurrency=config_manager.get_io_auto_max_concurrency(),
+            bytes_per_second=config_manager.get_io_bandwidth_limit() * 1024 * 1024,
+            # 与分发器的大文件通道使用相同的阈值
+            large_file_size=int(config_manager.get_large_file_threshold() * 1024 * 1024)
+        )
+    
+    def configure_notifications(self):
+        """按当前配置设置通知管理器"""
+        if self.notifications_override is not None:
+            self.notification_manager.enable_notifications = self.notifications_override
+        else:
+            self.notification_manager.enable_notifications = config_manager.is_notification_enabled()
+        self.notification_manager.enable_sound = config_manager.is_sound_enabled()
+        self.notification_manager.enable_popups = not self.headless
+        self.notification_manager.configure(
+            rate_per_minute=config_manager.get_notification_rate_limit(),
+            burst=config_manager.get_notification_burst(),
+            aggregation_window=config_manager.get_notification_aggregation_window()
+        )
+    
+    def create_source(self, source_config):
+        """根据配置创建监听目录及其处理配置快照"""
+        source = WatchSource.from_config(source_config)
+        self.validate_backend(source)
+        source.pipeline = self.build_pipeline(source_config)
+        return source
+    
+    def validate_backend(self, source):
+        """监听方式无效时改用文件系统事件"""
+        if source.backend not in BACKENDS:
+            self.logger.error(f"监听目录 {source.name} 的监听方式无效: {source.backend}，使用文件系统事件")
+            source.backend = BACKENDS[0]
+    
+    def build_pipeline(self, source_config, previous=None):
+        """
+        创建监听目录的处理配置快照
+        与旧快照相同的规则和目标目录直接沿用已编译的规则引擎和已有的文件移动器
+        """
+        rules = source_config['rules']
+        default_target = source_config['default_target']
+        target_directories = source_config['target_directories']
+        duplicate_index = self.init_duplicate_index()
+        duplicate_policy = self.get_duplicate_policy()
+        adaptive = self.config_manager.is_adaptive_rule_order_enabled()
+        
+        if (previous is not None and previous.rule_engine.rules == rules
+                and previous.rule_engine.default_target == default_target
+                and previous.rule_engine.adaptive == adaptive):
+            rule_engine = previous.rule_engine
+        else:
+            rule_engine = RuleEngine(rules, default_target, adaptive)
+            if rule_engine.errors:
+                self.notification_manager.send_notification(
+                    "规则配置无效",
+                    "以下规则已被忽略: " + "; ".join(rule_engine.errors)
+                )
+        
+        if (previous is not None and previous.target_directories == target_directories
+                and previous.file_mover.duplicate_index is duplicate_index
+                and previous.file_mover.duplicate_policy == duplicate_policy):
+            file_mover = previous.file_mover
+        else:
+            file_mover = FileMover(
+                target_directories,
+                journal=self.init_journal(),
+                duplicate_index=duplicate_index,
+                duplicate_policy=duplicate_policy,
+                name_index=self.name_index,
+                directory_cache=self.directory_cache,
+                throttle=self.io_throttle
+            )
+        return SourcePipeline(rule_engine, file_mover, target_directories)
+    
+    def check_source_overlap(self):
+        """检查监听目录是否重叠，重叠部分的文件会被多个监听目录重复处理"""
+        for source in self.sources:
+            for other in self.sources:
+                if other is not source and source.contains(other.path):
+                    self.logger.warning(f"监听目录 {other.path} 位于 {source.path} 的监听范围内，其中的文件可能被重复处理")
+    
+    def init_journal(self):
+        """初始化移动日志（只创建一次，重新加载配置时沿用）"""
+        if getattr(self, 'journal', None) is None and config_manager.is_journal_enabled():
+            journal_path = config_manager.get_journal_path()
+            Path(journal_path).parent.mkdir(parents=True, exist_ok=True)
+            self.journal = MoveJournal(journal_path, compact_interval=config_manager.get_journal_compact_interval())
+        return getattr(self, 'journal', None)
+    
+    def init_duplicate_index(self):
+        """初始化重复文件索引（只创建一次，重新加载配置时沿用）"""
+        if not config_manager.is_duplicate_detection_enabled():
+            return None
+        if getattr(self, 'duplicate_index', None) is None:
+            index_path = config_manager.get_duplicate_index_path()
+            Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+            self.duplicate_index = DuplicateIndex(index_path)
+        return self.duplicate_index
+    
+    def get_duplicate_policy(self):
+        """获取重复文件处理策略，配置无效时使用 skip"""
+        policy = config_manager.get_duplicate_policy()
+        if policy not in DUPLICATE_POLICIES:
+            self.logger.error(f"无效的重复文件处理策略: {policy}，使用 {DUPLICATE_SKIP}")
+            return DUPLICATE_SKIP
+        return policy
     
-    def reload_config(self):
-        """重新加载配置"""
+    def reload_config(self, force=False):
+        """
+        重新加载配置
+        配置文件未变化时直接返回；变化时整体替换各监听目录的处理配置快照，
+        只有监听路径、递归或监听方式变化的目录才重新调度，分发器、稳定性跟踪器和其他目录的监听不受影响
+        :param force: 为 True 时即使配置文件未变化也重新加载
+        """
+        with self._reload_lock:
+            try:
+                if not self.config_manager.reload_config(force):
+                    self.logger.info("配置文件未变化，无需重新加载")
+                    return
+                self.apply_config()
+                
+                self.logger.info("配置已重新加载")
+                self.notification_manager.send_notification(
+                    "配置已更新", 
+                    "AutoFileMover 配置已成功重新加载"
+                )
+            except Exception as e:
+                # 配置没有完整应用，下次检查时即使文件未再修改也重新加载
+                self.config_manager.invalidate_signature()
+                self.logger.error(f"重新加载配置失败: {e}")
+                self.notification_manager.send_notification(
+                    "配置更新失败", 
+                    f"重新加载配置时发生错误: {str(e)}"
+                )
+    
+    def apply_config(self):
+        """把新加载的配置应用到正在运行的组件上"""
+        # 全局设置直接在原组件上更新
+        self.integrity_checker.check_delay = config_manager.get_integrity_check_delay()
+        self.configure_completion()
+        self.configure_notifications()
+        self.configure_io_throttle()
+        ignore_suffixes = config_manager.get_ignore_suffixes()
+        
+        current = {source.name: source for source in self.sources}
+        sources = []
         try:
-            self.config_manager.reload_config()
-            self.init_components()
-            
-            # 如果正在运行，重启监听器
+            for source_config in config_manager.get_watch_sources():
+                source = current.pop(source_config['name'], None)
+                if source is None:
+                    source = self.create_source(source_config)
+                    if self.running:
+                        self.start_source(source, scan=config_manager.is_startup_scan_enabled())
+                    sources.append(source)
+                    continue
+                sources.append(source)
+                self.update_source(source, source_config, ignore_suffixes)
+        except Exception:
+            # 保留尚未处理的监听目录，下次重新加载时继续
+            self.sources = sources + list(current.values())
+            raise
+        
+        # 配置中已删除的监听目录
+        for source in current.values():
             if self.running:
-                self.restart_watcher()
-            
-            self.logger.info("配置已重新加载")
-            self.notification_manager.send_notification(
-                "配置已更新", 
-                "AutoFileMover 配置已成功重新加载"
-            )
-        except Exception as e:
-            self.logger.error(f"重新加载配置失败: {e}")
-            self.notification_manager.send_notification(
-                "配置更新失败", 
-                f"重新加载配置时发生错误: {str(e)}"
+                self.stop_source(source)
+        self.sources = sources
+        self.check_source_overlap()
+    
+    def update_source(self, source, source_config, ignore_suffixes):
+        """
+        按新的配置更新已有的监听目录
+        监听设置变化但切换监听失败时恢复原来的监听设置，下次重新加载时重新切换
+        """
+        old_path, old_recursive, old_backend = source.path, source.recursive, source.backend
+        old_key = source.watch_key
+        source.update(source_config)
+        self.validate_backend(source)
+        # 新快照创建完成后一次性替换，处理中的批次继续使用旧快照
+        source.pipeline = self.build_pipeline(source_config, source.pipeline)
+        if not self.running:
+            return
+        try:
+            self.dispatcher.register_source(source.name, self.make_handler(source), priority=source.priority)
+            self.configure_tracker(source.stability_tracker)
+            excluded = source.get_excluded_directories()
+            if source.watch_key == old_key:
+                self.get_watcher(source.backend).update_directory(
+                    source.path, source.recursive, ignore_suffixes, excluded
+                )
+                return
+            # 先添加新的监听再移除旧的，切换期间不会遗漏事件（重复事件由稳定性跟踪器合并）
+            self.get_watcher(source.backend).add_directory(
+                source.path, source.stability_tracker, ignore_suffixes, source.recursive, excluded
             )
+            self.get_watcher(old_backend).remove_directory(old_path, old_recursive)
+        except Exception:
+            source.path, source.recursive, source.backend = old_path, old_recursive, old_backend
+            raise
+        if config_manager.is_startup_scan_enabled():
+            self.start_backlog_scan(source)
+    
+    def start_config_watch(self):
+        """启动配置文件检查线程，配置文件变化后自动重新加载"""
+        interval = config_manager.get_config_reload_interval()
+        if not interval or interval <= 0:
+            return
+        self._config_watch_stop.clear()
+        
+        def watch():
+            while not self._config_watch_stop.wait(interval):
+                # 未变化时只需一次 stat
+                if self.config_manager.has_changed():
+                    self.reload_config()
+        
+        self._config_watch_thread = threading.Thread(target=watch, name="ConfigWatch", daemon=True)
+        self._config_watch_thread.start()
+    
+    def stop_config_watch(self):
+        """停止配置文件检查线程"""
+        self._config_watch_stop.set()
+        if self._config_watch_thread:
+            self._config_watch_thread.join()
+            self._config_watch_thread = None
+    
+    def start_metrics(self):
+        """注册队列深度和线程数等当前值指标，按配置启动指标服务和定期日志快照"""
+        metrics.gauge('afm_queue_depth', "各监听目录等待处理的文件数量",
+                      lambda: self.get_source_stats('queue_depth'))
+        metrics.gauge('afm_in_flight', "各监听目录正在处理的文件数量",
+                      lambda: self.get_source_stats('in_flight'))
+        metrics.gauge('afm_pending_files', "各监听目录正在等待写入完成的文件数量", self.get_pending_counts)
+        metrics.gauge('afm_threads', "进程中的线程数量", threading.active_count)
+        metrics.gauge('afm_copy_concurrency_limit', "各组设备（源设备->目标设备）各处理通道当前的跨设备复制并发数上限",
+                      lambda: self.get_throttle_stats('limit'))
+        metrics.gauge('afm_copy_waiting', "各组设备各处理通道等待复制名额的文件数量",
+                      lambda: self.get_throttle_stats('waiting'))
+        metrics.gauge('afm_rule_hits', "各监听目录每条规则的命中次数（rule 为空表示默认目标）",
+                      lambda: self.get_rule_stats('hits'))
+        metrics.gauge('afm_rule_seconds', "各监听目录命中每条规则的分类总用时（秒）",
+                      lambda: self.get_rule_stats('seconds'))
+        
+        port = config_manager.get_metrics_port()
+        if port:
+            try:
+                self.metrics_server = MetricsServer(metrics, config_manager.get_metrics_host(), port)
+                self.metrics_server.start()
+            except OSError as e:
+                self.metrics_server = None
+                self.logger.error(f"启动指标服务失败: {e}")
+        
+        interval = config_manager.get_metrics_log_interval()
+        if interval and interval > 0:
+            self._metrics_log_stop.clear()
+            
+            def log_snapshot():
+                while not self._metrics_log_stop.wait(interval):
+                    self.logger.info(f"指标快照: {format_snapshot(metrics.snapshot())}")
+            
+            self._metrics_log_thread = threading.Thread(target=log_snapshot, name="MetricsLog", daemon=True)
+            self._metrics_log_thread.start()
+    
+    def stop_metrics(self):
+        """停止指标服务和定期日志快照"""
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self._metrics_log_stop.set()
+        if self._metrics_log_thread:
+            self._metrics_log_thread.join()
+            self._metrics_log_thread = None
+    
+    def get_source_stats(self, key):
+        """按监听目录读取分发器统计中的一项，用于当前值指标"""
+        if self.dispatcher is None:
+            return None
+        return {(('source', name),): stats[key] for name, stats in self.dispatcher.get_stats()['sources'].items()}
+    
+    def get_throttle_stats(self, key):
+        """按设备组和处理通道读取 I/O 限制统计中的一项，用于当前值指标"""
+        return {
+            (('devices', devices), ('lane', lane)): stats[key]
+            for (devices, lane), stats in self.io_throttle.get_stats().items()
+        }
+    
+    def get_rule_stats(self, key):
+        """按监听目录和规则名称读取规则命中统计中的一项（同名规则合计），用于当前值指标"""
+        values = {}
+        for source in list(self.sources):
+            for stats in source.pipeline.rule_engine.get_rule_stats():
+                labels = (('rule', stats['name'] or ''), ('source', source.name))
+                values[labels] = values.get(labels, 0) + stats[key]
+        return values
+    
+    def log_rule_stats(self):
+        """在日志中输出各监听目录每条规则的命中次数、平均分类用时和平均检查的条件规则数量"""
+        for source in self.sources:
+            parts = []
+            for stats in source.pipeline.rule_engine.get_rule_stats():
+                if not stats['hits']:
+                    continue
+                name = stats['name'] or f"默认目标({stats['target']})"
+                part = f"{name} {stats['hits']} 次, 平均 {stats['seconds'] / stats['hits'] * 1e6:.1f} µs"
+                if stats['mean_checks']:
+                    part += f", 平均检查 {stats['mean_checks']:.1f} 条条件规则"
+                parts.append(part)
+            if parts:
+                self.logger.info(f"规则命中统计 [{source.name}]: {'; '.join(parts)}")
+    
+    def get_pending_counts(self):
+        """各监听目录正在等待写入完成的文件数量"""
+        return {
+            (('source', source.name),): source.stability_tracker.get_pending_count()
+            for source in list(self.sources) if source.stability_tracker
+        }
     
     def open_config(self):
         """打开配置文件"""
@@ -120,57 +481,273 @@ class AutoFileMover:
                 f"无法打开配置文件: {str(e)}"
             )
     
-    def process_new_file(self, file_path):
+    def process_new_file(self, file_path, source=None):
         """处理新文件"""
-        self.logger.info(f"开始处理新文件: {file_path}")
+        self.process_batch([file_path], source)
+    
+    def process_batch(self, file_paths, source=None):
+        """
+        批量处理一组新文件
+        按目标分类分组后逐组移动，整批只输出一条汇总日志和一条通知
+        :param source: 文件所属的监听目录，决定使用的规则和目标目录，默认为第一个监听目录
+        """
+        if source is None:
+            source = self.sources[0]
+        # 整批使用同一份处理配置快照，期间重新加载配置不影响本批文件
+        pipeline = source.pipeline
+        # 文件已由稳定性跟踪器确认传输完成
+        groups = {}
+        decisions = {}
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                self.logger.debug("文件已不存在，跳过处理: %s", file_path)
+                _FILES_SKIPPED_MISSING.inc()
+                continue
+            if self.classifier_pool is None:
+                # 一次查找得到目标分类和通知设置
+                classify_start = time.perf_counter()
+                decision = pipeline.rule_engine.classify(file_path)
+                _CLASSIFY_SECONDS.observe(time.perf_counter() - classify_start)
+                decisions[file_path] = decision
+            else:
+                decisions[file_path] = None
         
-        # 检查文件是否完整
-        if not self.integrity_checker.wait_for_file_complete(file_path):
-            self.logger.warning(f"文件未完整或超时，跳过处理: {file_path}")
-            return
+        if self.classifier_pool is not None and decisions:
+            # 整批交给工作进程分类，用时按工作进程中的实际分类用时记录
+            for file_path, decision, seconds in self.classifier_pool.classify(pipeline.rule_engine, list(decisions)):
+                _CLASSIFY_SECONDS.observe(seconds)
+                decisions[file_path] = decision
+        for file_path, decision in decisions.items():
+            groups.setdefault(decision.target, []).append(file_path)
         
-        # 获取目标分类
-        target_category = self.rule_engine.get_target_for_file(file_path)
+        if not decisions:
+            return
+        if len(decisions) == 1:
+            self.logger.info("开始处理新文件: %s", next(iter(decisions)))
+        else:
+            self.logger.info("开始批量处理 %d 个新文件", len(decisions))
         
         # 移动文件
-        moved_path = self.file_mover.move_file(file_path, target_category)
+        result = BatchResult()
+        for target_category, group in groups.items():
+            with _MOVE_SECONDS.time():
+                pipeline.file_mover.move_batch(target_category, group, result)
+        _FILES_MOVED.inc(len(result.moved))
+        _FILES_FAILED.inc(len(result.failed))
+        _FILES_SKIPPED_DUPLICATE.inc(len(result.duplicates))
+        _BYTES_MOVED.inc(result.bytes_moved)
         
-        if moved_path:
-            # 发送通知
-            filename = os.path.basename(moved_path)
-            message = f"文件已移动到: {target_category}\n{filename}"
-            
+        if len(decisions) > 1:
+            self.logger.info(f"批量处理完成 [{source.name}]: {result.summary()}, 用时 {result.elapsed:.2f} 秒")
+        self.notify_batch_result(result, decisions)
+    
+    def notify_batch_result(self, result, decisions):
+        """根据批量处理结果发送通知，多个文件时合并为一条汇总通知"""
+        if result.moved:
             # 检查是否需要特别通知
-            should_notify = self.rule_engine.should_notify(file_path)
+            should_notify = any(decisions[source].notify for source, _, _ in result.moved)
             
             if should_notify or self.notification_manager.enable_notifications:
-                self.notification_manager.send_notification(
-                    "文件已处理", 
-                    message,
-                    moved_path
+                if len(result.moved) == 1:
+                    _, moved_path, target_category = result.moved[0]
+                    filename = os.path.basename(moved_path)
+                    self.notification_manager.send_notification(
+                        "文件已处理", 
+                        f"文件已移动到: {target_category}\n{filename}",
+                        moved_path,
+                        categories={target_category: 1}
+                    )
+                else:
+                    self.notification_manager.send_notification(
+                        "文件已处理",
+                        result.summary(),
+                        categories=result.category_counts()
+                    )
+        
+        if result.failed:
+            for file_path, _ in result.failed:
+                self.logger.error(f"文件移动失败: {file_path}")
+            if len(result.failed) == 1:
+                message = f"无法移动文件: {os.path.basename(result.failed[0][0])}"
+            else:
+                message = f"无法移动 {len(result.failed)} 个文件"
+            self.notification_manager.send_notification("文件处理失败", message)
+    
+    def start_dispatcher(self):
+        """启动文件分发器"""
+        # 分发器设置在重新加载配置时不变，修改后需要重启程序
+        # 每批只有一个文件时分发器传入单个文件路径，按未启用批处理对待，处理函数与之一致
+        batch_size = max(1, int(self.config_manager.get_batch_size())) if self.config_manager.is_batch_enabled() else 1
+        self.batch_enabled = batch_size > 1
+        # 各监听目录的处理函数在启动监听器时注册
+        self.dispatcher = FileDispatcher(
+            max_workers=self.config_manager.get_max_workers(),
+            queue_size=self.config_manager.get_queue_size(),
+            batch_size=batch_size,
+            batch_window=self.config_manager.get_batch_window(),
+            large_file_size=int(self.config_manager.get_large_file_threshold() * 1024 * 1024),
+            large_workers=self.config_manager.get_large_file_workers()
+        )
+        self.dispatcher.start()
+        
+        workers = self.config_manager.get_process_workers()
+        if workers and workers > 0:
+            from process_pool import ClassifierPool
+            self.classifier_pool = ClassifierPool(workers)
+            self.classifier_pool.start()
+    
+    def stop_dispatcher(self):
+        """停止文件分发器"""
+        if self.dispatcher:
+            self.dispatcher.stop()
+            self.dispatcher = None
+        # 分发器的工作线程已全部退出，不会再提交分类
+        if self.classifier_pool:
+            self.classifier_pool.stop()
+            self.classifier_pool = None
+    
+    def make_handler(self, source):
+        """创建监听目录在分发器中的处理函数"""
+        return functools.partial(self.process_batch if self.batch_enabled else self.process_new_file, source=source)
+    
+    def get_watcher(self, backend):
+        """
+        获取监听方式对应的监听器，首次使用时创建并启动
+        使用文件系统事件的监听目录共用一个 Observer，轮询的监听目录共用一个轮询线程
+        """
+        if backend == BACKEND_POLLING:
+            if self.polling_watcher is None:
+                from polling_watcher import PollingWatcher
+                self.polling_watcher = PollingWatcher(
+                    min_interval=self.config_manager.get_polling_min_interval(),
+                    max_interval=self.config_manager.get_polling_max_interval(),
+                    max_cpu=self.config_manager.get_polling_max_cpu(),
+                    trace_writer=self.trace_writer
                 )
-        else:
-            self.logger.error(f"文件移动失败: {file_path}")
-            self.notification_manager.send_notification(
-                "文件处理失败", 
-                f"无法移动文件: {os.path.basename(file_path)}"
-            )
+                self.polling_watcher.start()
+            return self.polling_watcher
+        if self.event_watcher is None:
+            from file_watcher import FileWatcher
+            self.event_watcher = FileWatcher(trace_writer=self.trace_writer)
+            self.event_watcher.start()
+        return self.event_watcher
+    
+    def start_source(self, source, scan=False):
+        """开始处理一个监听目录：注册分发器队列、启动稳定性跟踪器并加入监听"""
+        # 每个监听目录在分发器中有独立的队列和优先级，繁忙的目录不会阻塞其他目录
+        self.dispatcher.register_source(source.name, self.make_handler(source), priority=source.priority)
+        source.stability_tracker = StabilityTracker(
+            self.integrity_checker,
+            functools.partial(self.dispatcher.submit, source=source.name),
+            completion=self.completion_detector,
+            # 每次读取当前的处理配置快照，重新加载配置后按新规则选择判定方式
+            strategy_resolver=lambda file_path: source.pipeline.rule_engine.completion_strategies(file_path),
+            on_timeout=functools.partial(self.recheck_timed_out, source)
+        )
+        self.configure_tracker(source.stability_tracker)
+        source.stability_tracker.start()
+        self.get_watcher(source.backend).add_directory(
+            source.path, source.stability_tracker, self.config_manager.get_ignore_suffixes(),
+            source.recursive, source.get_excluded_directories()
+        )
+        # 监听启动后再扫描已存在的文件，避免遗漏扫描期间到达的文件
+        if scan:
+            self.start_backlog_scan(source)
+    
+    def configure_tracker(self, tracker):
+        """
+        按当前配置设置稳定性跟踪器的静默期和等待策略
+        大文件阈值与分发器的大文件通道保持一致，修改后需要重启程序
+        """
+        tracker.quiet_period = self.integrity_checker.check_delay
+        tracker.max_wait_time = self.config_manager.get_max_wait_time()
+        tracker.large_file_size = self.dispatcher.large_file_size
+        tracker.large_quiet_period = self.config_manager.get_large_file_quiet_period()
+        tracker.large_max_wait_time = self.config_manager.get_large_file_max_wait_time()
+        tracker.retry_interval = self.config_manager.get_large_file_retry_interval()
+    
+    def start_backlog_scan(self, source):
+        """扫描监听目录中已存在的文件"""
+        if source.backlog_scanner:
+            source.backlog_scanner.stop()
+        source.backlog_scanner = BacklogScanner(
+            source.path, source.stability_tracker, self.config_manager.get_ignore_suffixes(),
+            recursive=source.recursive, exclude_directories=source.get_excluded_directories()
+        )
+        source.backlog_scanner.start()
+    
+    def stop_source(self, source):
+        """停止处理一个监听目录"""
+        if source.backlog_scanner:
+            source.backlog_scanner.stop()
+            source.backlog_scanner = None
+        watcher = self.polling_watcher if source.backend == BACKEND_POLLING else self.event_watcher
+        if watcher:
+            watcher.remove_directory(source.path, source.recursive)
+        if source.stability_tracker:
+            source.stability_tracker.stop()
+            source.stability_tracker = None
+    
+    def recheck_timed_out(self, source, file_path):
+        """
+        文件等待超时被放弃后的处理
+        轮询监听不会因文件原地追加写入产生事件，交给轮询监听器单独检查，文件再次变化后重新跟踪；
+        文件系统事件监听在下一次 modified 事件时自动重新跟踪
+        """
+        if source.backend == BACKEND_POLLING and self.polling_watcher is not None:
+            self.polling_watcher.recheck(file_path)
     
     def start_watcher(self):
-        """启动文件监听器"""
-        watch_directory = self.config_manager.get_watch_directory()
-        self.watcher = FileWatcher(watch_directory, self.process_new_file)
-        self.watcher.start()
+        """启动文件监听器，所有监听目录共用监听器和文件分发器"""
+        startup_scan = self.config_manager.is_startup_scan_enabled()
+        trace_path = self.config_manager.get_trace_path()
+        if trace_path:
+            from event_trace import TraceWriter
+            try:
+                self.trace_writer = TraceWriter(trace_path)
+                self.trace_writer.open()
+            except OSError as e:
+                self.trace_writer = None
+                self.logger.error(f"无法创建文件事件记录 {trace_path}: {e}")
+        for source in self.sources:
+            self.start_source(source, scan=startup_scan)
     
     def stop_watcher(self):
         """停止文件监听器"""
-        if hasattr(self, 'watcher'):
-            self.watcher.stop()
+        for source in self.sources:
+            if source.backlog_scanner:
+                source.backlog_scanner.stop()
+                source.backlog_scanner = None
+        for watcher in (self.event_watcher, self.polling_watcher):
+            if watcher:
+                watcher.stop()
+        self.event_watcher = None
+        self.polling_watcher = None
+        if self.trace_writer:
+            self.trace_writer.close()
+            self.trace_writer = None
+        for source in self.sources:
+            if source.stability_tracker:
+                source.stability_tracker.stop()
+                source.stability_tracker = None
     
-    def restart_watcher(self):
-        """重启文件监听器"""
-        self.stop_watcher()
-        self.start_watcher()
+    def init_tray(self):
+        """
+        创建系统托盘（只在图形模式下导入托盘和图像库）
+        托盘依赖不可用时改为无界面模式运行
+        """
+        try:
+            from tray_manager import TrayManager
+        except ImportError as e:
+            self.logger.warning(f"系统托盘不可用，以无界面模式运行: {e}")
+            self.headless = True
+            self.notification_manager.enable_popups = False
+            return
+        self.tray_manager = TrayManager(
+            on_open_config=self.open_config,
+            on_reload_config=self.reload_config,
+            on_exit=self.stop
+        )
     
     def start(self):
         """启动程序"""
@@ -179,26 +756,36 @@ class AutoFileMover:
             return
         
         try:
-            # 启动文件监听器
+            # 完成或回滚上次退出时中断的移动
+            if self.journal:
+                self.journal.replay()
+            
+            # 启动文件分发器和文件监听器
+            self.start_dispatcher()
             self.start_watcher()
             self.running = True
-            
-            self.logger.info("AutoFileMover 已启动")
+            self.start_metrics()
+            self.logger.info(f"AutoFileMover 已启动, 用时 {(time.perf_counter() - IMPORT_TIME) * 1000:.1f} ms")
+            self.start_config_watch()
             self.notification_manager.send_notification(
                 "AutoFileMover 已启动", 
-                f"正在监听目录: {self.config_manager.get_watch_directory()}"
+                f"正在监听目录: {', '.join(source.path for source in self.sources)}"
             )
             
-            # 创建并运行系统托盘图标
-            self.tray_icon = self.tray_manager.create_icon()
-            if self.tray_icon:
-                # 在新线程中运行系统托盘图标
-                tray_thread = threading.Thread(target=self.tray_manager.run, daemon=True)
-                tray_thread.start()
-                
-                # 在当前线程中运行Tk事件循环
-                if hasattr(self.notification_manager, 'root') and self.notification_manager.root:
-                    self.notification_manager.root.mainloop()
+            # 文件处理已开始，再加载系统托盘
+            if not self.headless:
+                self.init_tray()
+            if self.tray_manager:
+                # 创建并运行系统托盘图标
+                self.tray_icon = self.tray_manager.create_icon()
+                if self.tray_icon:
+                    # 在新线程中运行系统托盘图标
+                    tray_thread = threading.Thread(target=self.tray_manager.run, daemon=True)
+                    tray_thread.start()
+                    
+                    # 在当前线程中运行Tk事件循环
+                    if hasattr(self.notification_manager, 'root') and self.notification_manager.root:
+                        self.notification_manager.root.mainloop()
             
         except Exception as e:
             self.logger.error(f"启动程序失败: {e}")
@@ -207,6 +794,18 @@ class AutoFileMover:
                 f"AutoFileMover 启动失败: {str(e)}"
             )
     
+    def wait(self):
+        """阻塞当前线程直到收到停止请求"""
+        # 分段等待，主线程可以及时响应信号
+        while not self._stop_event.wait(1):
+            pass
+    
+    def request_stop(self, signum=None, frame=None):
+        """请求停止程序，可作为信号处理函数"""
+        if signum is not None:
+            self.logger.info(f"收到信号 {signum}，准备退出")
+        self._stop_event.set()
+    
     def stop(self):
         """停止程序"""
         if not self.running:
@@ -214,18 +813,32 @@ class AutoFileMover:
             return
         
         try:
-            # 停止文件监听器
+            # 停止文件监听器和文件分发器
+            self.stop_config_watch()
+            self.stop_metrics()
             self.stop_watcher()
+            self.stop_dispatcher()
+            self.log_rule_stats()
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+            if self.duplicate_index:
+                self.duplicate_index.close()
+                self.duplicate_index = None
             self.running = False
+            self._stop_event.set()
             
             # 停止系统托盘
-            self.tray_manager.stop()
+            if self.tray_manager:
+                self.tray_manager.stop()
             
             self.logger.info("AutoFileMover 已停止")
             self.notification_manager.send_notification(
                 "AutoFileMover 已停止", 
                 "程序已正常退出"
             )
+            self.notification_manager.stop()
+            self.log_writer.stop()
             
             # 退出程序
             sys.exit(0)
@@ -233,10 +846,39 @@ class AutoFileMover:
         except Exception as e:
             self.logger.error(f"停止程序失败: {e}")
 
-def main():
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="AutoFileMover 文件自动转移工具")
+    parser.add_argument("-c", "--config", help="配置文件路径（默认: config.yaml）")
+    parser.add_argument("--headless", action="store_true",
+                        help="无界面模式：不加载系统托盘和 Tk，作为守护进程运行，收到 SIGINT/SIGTERM 时退出")
+    parser.add_argument("--no-notifications", action="store_true", help="不发送通知（覆盖配置文件中的设置）")
+    parser.add_argument("--exit-after-start", action="store_true",
+                        help="启动完成后立即退出，用于测量启动用时")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """主函数"""
-    app = AutoFileMover()
+    args = parse_args(argv)
+    app = AutoFileMover(
+        config_path=args.config,
+        headless=args.headless,
+        enable_notifications=False if args.no_notifications else None
+    )
+    signal.signal(signal.SIGINT, app.request_stop)
+    signal.signal(signal.SIGTERM, app.request_stop)
     app.start()
+    if not app.running:
+        sys.exit(1)
+    if args.exit_after_start:
+        app.request_stop()
+    # 托盘和文件处理都在后台线程中运行，主线程等待退出请求（托盘菜单退出时程序已停止）
+    app.wait()
+    if app.running:
+        app.stop()
 
 if __name__ == "__main__":
+    # 打包后的程序由此启动多进程分类的工作进程
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
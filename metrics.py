@@ -0,0 +1,302 @@
+import time
+import bisect
+import threading
+import logging
+
+# 阶段用时直方图的默认分桶上界（秒），覆盖从亚毫秒级的规则匹配到分钟级的大文件复制
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """只增不减的计数器"""
+
+    __slots__ = ('labels', 'value', '_lock')
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Histogram:
+    """
+    固定分桶的直方图
+    每次记录只做一次二分查找和三次加法，可在处理热路径上常开
+    """
+
+    __slots__ = ('labels', 'buckets', 'counts', 'count', 'sum', '_lock')
+
+    def __init__(self, labels, buckets):
+        self.labels = labels
+        self.buckets = buckets
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """计时上下文：with histogram.time(): ..."""
+        return _Timer(self)
+
+    def quantile(self, fraction):
+        """按分桶估算分位数，返回所在桶的上界（落在最后一个桶时返回最大的有限上界）"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        rank = fraction * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class _Family:
+    """同名指标的说明、类型和各标签组合的实例"""
+
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.children = {}
+        self.callback = None
+
+class MetricsRegistry:
+    """
+    指标注册表
+    计数器和直方图由各组件在处理过程中更新；队列深度、线程数等当前值由回调函数在导出时读取，不占用处理时间
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, name, kind, help_text):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = _Family(name, kind, help_text)
+                self._families[name] = family
+            elif family.kind != kind:
+                raise ValueError(f"指标 {name} 已注册为 {family.kind}")
+            return family
+
+    def counter(self, name, help_text, **labels):
+        """获取计数器，同名同标签的多次调用返回同一个实例"""
+        family = self._family(name, 'counter', help_text)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            child = family.children.get(key)
+            if child is None:
+                child = family.children[key] = Counter(key)
+            return child
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+        """获取直方图，同名同标签的多次调用返回同一个实例"""
+        family = self._family(name, 'histogram', help_text)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            child = family.children.get(key)
+            if child is None:
+                child = family.children[key] = Histogram(key, tuple(buckets))
+            return child
+
+    def gauge(self, name, help_text, callback):
+        """
+        注册当前值指标，导出时调用 callback 读取
+        callback 返回数值，或 {标签值字典的元组: 数值}（用于按来源等标签区分），出错或返回 None 时不导出
+        重复注册同名指标时替换回调函数
+        """
+        family = self._family(name, 'gauge', help_text)
+        family.callback = callback
+
+    def total(self, name):
+        """同名计数器所有标签组合的合计"""
+        family = self._families.get(name)
+        if family is None:
+            return 0
+        return sum(child.value for child in list(family.children.values()))
+
+    def get_histogram(self, name, **labels):
+        """获取已注册的直方图，未注册时返回 None"""
+        family = self._families.get(name)
+        if family is None:
+            return None
+        return family.children.get(tuple(sorted(labels.items())))
+
+    def _gauge_samples(self, family):
+        try:
+            value = family.callback()
+        except Exception as e:
+            logging.getLogger(__name__).debug(f"读取指标 {family.name} 失败: {e}")
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [(tuple(sorted(labels)), sample) for labels, sample in value.items()]
+        return [((), value)]
+
+    def render_prometheus(self):
+        """以 Prometheus 文本格式导出所有指标"""
+        lines = []
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            if family.kind == 'gauge':
+                for labels, value in self._gauge_samples(family):
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            for labels, child in list(family.children.items()):
+                if family.kind == 'counter':
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_value(child.value)}")
+                    continue
+                with child._lock:
+                    counts = list(child.counts)
+                    count, total = child.count, child.sum
+                cumulative = 0
+                for bound, bucket_count in zip(child.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (('le', _format_value(float(bound))),)
+                    lines.append(f"{family.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{family.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{family.name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        生成指标快照，用于定期写入日志
+        计数器为合计值，直方图为次数和 p50 / p99 估计，当前值指标按标签展开
+        """
+        result = {}
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            if family.kind == 'counter':
+                result[family.name] = sum(child.value for child in list(family.children.values()))
+            elif family.kind == 'histogram':
+                for labels, child in list(family.children.items()):
+                    if child.count:
+                        key = family.name + _format_labels(labels)
+                        result[key] = {'count': child.count, 'p50': child.quantile(0.5), 'p99': child.quantile(0.99)}
+            else:
+                for labels, value in self._gauge_samples(family):
+                    result[family.name + _format_labels(labels)] = value
+        return result
+
+def format_snapshot(snapshot):
+    """把指标快照格式化为一行日志"""
+    parts = []
+    for name, value in snapshot.items():
+        if isinstance(value, dict):
+            parts.append(f"{name} 次数 {value['count']} p50<={value['p50'] * 1000:g}ms p99<={value['p99'] * 1000:g}ms")
+        else:
+            parts.append(f"{name} {_format_value(value)}")
+    return ", ".join(parts)
+
+class MetricsServer:
+    """在本地 HTTP 端口上以 Prometheus 文本格式提供 /metrics"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """启动 HTTP 服务线程"""
+        # 只在启用指标服务时导入 http.server
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        registry = self.registry
+        logger = self.logger
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("指标请求: " + format % args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        self.logger.info(f"指标服务已启动: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """停止 HTTP 服务"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+        self.logger.info("指标服务已停止")
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# 各处理阶段的用时，由对应组件在处理过程中记录
+STAGE_SECONDS = 'afm_stage_seconds'
+STAGE_HELP = ("各处理阶段用时（秒）: stability 为发现到写入完成, queue 为分发队列等待, classify 为规则匹配, "
+              "move 为一组文件的移动, notify 为一条通知的发送")
+
+def stage_histogram(stage):
+    """获取处理阶段的用时直方图"""
+    return metrics.histogram(STAGE_SECONDS, STAGE_HELP, stage=stage)
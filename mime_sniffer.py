@@ -0,0 +1,104 @@
+"""根据文件头部的魔数识别文件内容类型"""
+
+# 需要读取的文件头部长度，tar 的 ustar 标记位于偏移 257 处
+HEADER_SIZE = 512
+
+# (偏移, 魔数, 内容类型)，按顺序匹配，越具体的签名越靠前
+_MAGIC_SIGNATURES = [
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (257, b'ustar', 'application/x-tar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'{\\rtf', 'application/rtf'),
+    (0, b'SQLite format 3\x00', 'application/vnd.sqlite3'),
+    (0, b'MZ', 'application/x-msdownload'),
+    (0, b'\x7fELF', 'application/x-executable'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'\xff\xf3', 'audio/mpeg'),
+    (0, b'\xff\xf2', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'\x1aE\xdf\xa3', 'video/x-matroska'),
+]
+
+# RIFF 容器根据偏移 8 处的格式标记区分
+_RIFF_FORMATS = {
+    b'WEBP': 'image/webp',
+    b'WAVE': 'audio/wav',
+    b'AVI ': 'video/x-msvideo',
+}
+
+# ISO 媒体容器（MP4/MOV 等）根据 ftyp 品牌区分
+_FTYP_BRANDS = {
+    b'qt  ': 'video/quicktime',
+    b'M4A ': 'audio/mp4',
+    b'M4B ': 'audio/mp4',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'avif': 'image/avif',
+}
+
+def sniff_mime(header):
+    """
+    根据文件头部内容识别内容类型
+    :param header: 文件开头的若干字节（建议至少 HEADER_SIZE 字节）
+    :return: 内容类型字符串，无法识别时返回 application/octet-stream
+    """
+    if not header:
+        return 'application/x-empty'
+
+    if header[:4] == b'RIFF' and len(header) >= 12:
+        mime = _RIFF_FORMATS.get(header[8:12])
+        if mime:
+            return mime
+
+    if header[4:8] == b'ftyp':
+        return _FTYP_BRANDS.get(header[8:12], 'video/mp4')
+
+    for offset, magic, mime in _MAGIC_SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            return mime
+
+    stripped = header.lstrip().lower()
+    if stripped.startswith(b'<?xml'):
+        return 'text/xml'
+    if stripped.startswith(b'<!doctype html') or stripped.startswith(b'<html'):
+        return 'text/html'
+
+    # 不含空字节且能按 UTF-8 解码的内容视为文本（末尾可能截断在多字节字符中间）
+    if b'\x00' not in header:
+        try:
+            header.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError as e:
+            if e.start >= len(header) - 3:
+                return 'text/plain'
+
+    return 'application/octet-stream'
+
+def mime_matches(mime, patterns):
+    """
+    检查内容类型是否匹配任一模式
+    模式支持完整类型（image/png）和通配子类型（image/*）
+    """
+    for pattern in patterns:
+        if pattern == mime or pattern == '*/*':
+            return True
+        if pattern.endswith('/*') and mime.startswith(pattern[:-1]):
+            return True
+    return False
@@ -0,0 +1,201 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+
+# 移动记录的状态：已登记意图 -> 目标文件已完整写入 -> 源文件已删除（完成）
+STATE_INTENT = 'intent'
+STATE_COPIED = 'copied'
+STATE_COMMITTED = 'committed'
+STATE_ROLLED_BACK = 'rolled_back'
+STATE_LOST = 'lost'
+
+_FINISHED_STATES = (STATE_COMMITTED, STATE_ROLLED_BACK, STATE_LOST)
+
+class MoveJournal:
+    """
+    移动日志，使用 WAL 模式的 SQLite 记录每次移动的进度
+    一批文件的意图在移动前统一提交一次，移动结果在批次结束时再统一提交一次，
+    磁盘同步的开销由整批文件分摊；程序启动时重放日志，完成或回滚中断的移动
+    """
+
+    def __init__(self, journal_path, compact_interval=300):
+        """
+        :param journal_path: 日志数据库文件路径
+        :param compact_interval: 清理已完成记录的间隔（秒）
+        """
+        self.journal_path = journal_path
+        self.compact_interval = compact_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._last_compact = time.monotonic()
+        self._connection = sqlite3.connect(journal_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS moves ("
+            " id INTEGER PRIMARY KEY,"
+            " source TEXT NOT NULL,"
+            " target TEXT NOT NULL,"
+            " temp TEXT,"
+            " state TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS moves_state ON moves (state)")
+        self._in_transaction = False
+
+    def _begin(self):
+        """开启写事务，必须在持有锁时调用"""
+        if not self._in_transaction:
+            self._connection.execute("BEGIN")
+            self._in_transaction = True
+
+    def record_intents(self, moves):
+        """
+        登记一批移动意图并立即持久化
+        :param moves: [(源路径, 目标路径, 临时文件路径或 None), ...]
+        :return: 对应的记录编号列表
+        """
+        now = time.time()
+        with self._lock:
+            self._begin()
+            ids = []
+            for source, target, temp in moves:
+                cursor = self._connection.execute(
+                    "INSERT INTO moves (source, target, temp, state, updated) VALUES (?, ?, ?, ?, ?)",
+                    (source, target, temp, STATE_INTENT, now)
+                )
+                ids.append(cursor.lastrowid)
+            self._commit_locked()
+        return ids
+
+    def set_target(self, move_id, target_path):
+        """目标文件名被占用而改名时更新目标路径（随下一次提交持久化）"""
+        self._update(move_id, "target = ?", (target_path,))
+
+    def mark(self, move_id, state):
+        """更新移动状态（随下一次提交持久化）"""
+        self._update(move_id, "state = ?", (state,))
+
+    def _update(self, move_id, assignment, values):
+        with self._lock:
+            self._begin()
+            self._connection.execute(
+                f"UPDATE moves SET {assignment}, updated = ? WHERE id = ?",
+                values + (time.time(), move_id)
+            )
+
+    def commit(self):
+        """提交所有未持久化的更新，并按需清理已完成的记录"""
+        with self._lock:
+            self._commit_locked()
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._compact_locked()
+
+    def _commit_locked(self):
+        if self._in_transaction:
+            self._connection.execute("COMMIT")
+            self._in_transaction = False
+
+    def compact(self):
+        """删除已完成的记录并截断 WAL 文件"""
+        with self._lock:
+            self._commit_locked()
+            self._compact_locked()
+
+    def _compact_locked(self):
+        placeholders = ", ".join("?" for _ in _FINISHED_STATES)
+        cursor = self._connection.execute(f"DELETE FROM moves WHERE state IN ({placeholders})", _FINISHED_STATES)
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._last_compact = time.monotonic()
+        if cursor.rowcount:
+            self.logger.debug(f"移动日志已清理 {cursor.rowcount} 条已完成记录")
+
+    def replay(self):
+        """
+        重放未完成的移动记录
+        目标文件已完整写入的移动会删除源文件完成移动；目标不完整的移动会删除临时文件回滚，
+        源文件留在原处，由启动扫描重新处理
+        返回 {状态: 数量} 统计
+        """
+        with self._lock:
+            self._commit_locked()
+            placeholders = ", ".join("?" for _ in _FINISHED_STATES)
+            rows = self._connection.execute(
+                f"SELECT id, source, target, temp, state FROM moves WHERE state NOT IN ({placeholders})",
+                _FINISHED_STATES
+            ).fetchall()
+
+        stats = {}
+        for move_id, source, target, temp, state in rows:
+            outcome = self.reconcile(move_id, source, target, temp, state)
+            if outcome:
+                stats[outcome] = stats.get(outcome, 0) + 1
+
+        if rows:
+            self.compact()
+            self.logger.info(f"移动日志重放完成: {len(rows)} 条未完成记录, {stats}")
+        return stats
+
+    def reconcile(self, move_id, source, target, temp, state=STATE_INTENT):
+        """
+        根据文件系统的实际情况完成或回滚一条未完成的移动，并更新其状态
+        用于启动时重放，以及移动过程中出错时立即收尾
+        返回最终状态，无法处理时返回 None
+        """
+        try:
+            outcome = self._recover(source, target, temp, state)
+        except OSError as e:
+            self.logger.error(f"恢复中断的移动失败 {source} -> {target}: {e}")
+            return None
+        self.mark(move_id, outcome)
+        return outcome
+
+    def _recover(self, source, target, temp, state):
+        """恢复单条未完成的移动，返回最终状态"""
+        source_exists = os.path.lexists(source)
+        target_exists = os.path.lexists(target)
+
+        # 残留的临时文件：已经链接到目标时只是多余的名称，否则是不完整的副本
+        if temp and os.path.lexists(temp):
+            os.unlink(temp)
+            self.logger.info(f"删除残留的临时文件: {temp}")
+
+        if source_exists and target_exists:
+            if self._is_complete_copy(source, target, state):
+                os.unlink(source)
+                self.logger.info(f"完成中断的移动: {source} -> {target}")
+                return STATE_COMMITTED
+            self.logger.info(f"目标文件不是本次移动的结果，回滚: {source}")
+            return STATE_ROLLED_BACK
+        if source_exists:
+            self.logger.info(f"回滚中断的移动，源文件保留在原处: {source}")
+            return STATE_ROLLED_BACK
+        if target_exists:
+            return STATE_COMMITTED
+
+        self.logger.warning(f"中断的移动无法恢复，源文件和目标文件都不存在: {source} -> {target}")
+        return STATE_LOST
+
+    @staticmethod
+    def _is_complete_copy(source, target, state):
+        """
+        检查目标文件是否为源文件的完整副本
+        同设备移动时二者是同一文件的两个硬链接；跨设备复制的目标只有在完整写入并同步后才会出现，
+        且保留了源文件的修改时间
+        """
+        if os.path.samefile(source, target):
+            return True
+        source_stat = os.stat(source)
+        target_stat = os.stat(target)
+        same_content = (source_stat.st_size == target_stat.st_size
+                        and source_stat.st_mtime_ns == target_stat.st_mtime_ns)
+        return same_content or (state == STATE_COPIED and source_stat.st_size == target_stat.st_size)
+
+    def close(self):
+        """提交剩余更新并关闭数据库"""
+        with self._lock:
+            self._commit_locked()
+            self._connection.close()
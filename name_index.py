@@ -0,0 +1,99 @@
+import os
+import re
+import threading
+import logging
+
+# 文件名末尾的数字后缀，如 report_12 -> (report, 12)
+_SUFFIX_PATTERN = re.compile(r'^(.*)_(\d+)$')
+
+class _DirectoryNames:
+    """单个目标目录的文件名索引"""
+
+    __slots__ = ('names', 'max_suffix')
+
+    def __init__(self):
+        # 已占用的文件名（按平台规则规范化大小写）
+        self.names = set()
+        # (文件名主体, 扩展名) -> 已使用的最大数字后缀
+        self.max_suffix = {}
+
+    def add(self, filename):
+        """记录一个已占用的文件名"""
+        key = os.path.normcase(filename)
+        self.names.add(key)
+        stem, extension = os.path.splitext(key)
+        match = _SUFFIX_PATTERN.match(stem)
+        if match:
+            suffix_key = (match.group(1), extension)
+            number = int(match.group(2))
+            if number > self.max_suffix.get(suffix_key, 0):
+                self.max_suffix[suffix_key] = number
+        return key
+
+class NameIndex:
+    """
+    目标目录文件名索引
+    每个目录在首次使用时通过一次 scandir 加载，之后随每次移动增量更新；
+    为文件名冲突直接给出下一个可用的数字后缀，并在多线程间原子地预留文件名
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._directories = {}
+        self._lock = threading.Lock()
+
+    def _load(self, target_dir):
+        """扫描目录建立索引，必须在持有锁时调用"""
+        directory = _DirectoryNames()
+        try:
+            with os.scandir(target_dir) as entries:
+                for entry in entries:
+                    directory.add(entry.name)
+        except FileNotFoundError:
+            pass
+        self.logger.debug(f"建立目录文件名索引: {target_dir}, {len(directory.names)} 个文件")
+        return directory
+
+    def _get(self, target_dir):
+        """获取目录索引，必须在持有锁时调用"""
+        key = os.path.normcase(os.path.abspath(target_dir))
+        directory = self._directories.get(key)
+        if directory is None:
+            directory = self._load(target_dir)
+            self._directories[key] = directory
+        return directory
+
+    def reserve(self, target_dir, filename):
+        """
+        为文件在目标目录中预留一个未被占用的文件名
+        名称已被占用时使用 文件名_N.扩展名 的形式，N 为该文件名已使用的最大后缀加一
+        返回预留的完整路径
+        """
+        with self._lock:
+            directory = self._get(target_dir)
+            if os.path.normcase(filename) not in directory.names:
+                directory.add(filename)
+                return os.path.join(target_dir, filename)
+
+            stem, extension = os.path.splitext(filename)
+            suffix_key = (os.path.normcase(stem), os.path.normcase(extension))
+            counter = directory.max_suffix.get(suffix_key, 0) + 1
+            while True:
+                candidate = f"{stem}_{counter}{extension}"
+                if os.path.normcase(candidate) not in directory.names:
+                    directory.add(candidate)
+                    return os.path.join(target_dir, candidate)
+                counter += 1
+
+    def release(self, target_path):
+        """释放未能使用的预留文件名（移动失败时调用）"""
+        target_dir, filename = os.path.split(target_path)
+        with self._lock:
+            directory = self._directories.get(os.path.normcase(os.path.abspath(target_dir)))
+            if directory is not None:
+                directory.names.discard(os.path.normcase(filename))
+
+    def forget(self, target_dir):
+        """丢弃目录索引，下次使用时重新扫描"""
+        with self._lock:
+            self._directories.pop(os.path.normcase(os.path.abspath(target_dir)), None)
@@ -6,40 +6,218 @@ import sys
 from pathlib import Path
 import threading
 import time
+import queue
 
-# 尝试导入tkinter
-try:
-    import tkinter as tk
-    from tkinter import messagebox
-    TKINTER_AVAILABLE = True
-except ImportError:
-    TKINTER_AVAILABLE = False
-    tk = None
-    messagebox = None
+from rate_limiter import TokenBucket
+from metrics import stage_histogram
+
+_NOTIFY_SECONDS = stage_histogram('notify')
+
+# tkinter 只在第一次显示弹窗时导入，无图形界面的服务器上导入本模块不会加载 Tk
+_tkinter = None
+
+def _load_tkinter():
+    """导入 tkinter，不可用时返回 None（只尝试一次）"""
+    global _tkinter
+    if _tkinter is None:
+        try:
+            import tkinter
+            _tkinter = tkinter
+        except ImportError:
+            _tkinter = False
+    return _tkinter or None
+
+class _Notification:
+    """排队中的通知"""
+    
+    __slots__ = ('title', 'message', 'file_path', 'categories')
+    
+    def __init__(self, title, message, file_path, categories):
+        self.title = title
+        self.message = message
+        self.file_path = file_path
+        self.categories = categories
 
 class NotificationManager:
-    """通知管理器，负责显示系统通知"""
+    """
+    通知管理器，负责显示系统通知
+    通知先进入队列，由一个常驻线程统一发送：短时间内的多条文件通知合并为一条汇总，
+    并通过令牌桶限制发送频率，令牌不足时其他通知按标题合并后延迟发送；
+    突发期间不播放声音，也不弹出单个文件的弹窗
+    """
     
-    def __init__(self, enable_notifications=True, enable_sound=True):
+    def __init__(self, enable_notifications=True, enable_sound=True, enable_popups=True):
+        """
+        :param enable_popups: 是否允许弹出图形窗口，无图形界面运行时关闭，通知改为系统通知或控制台输出
+        """
         self.enable_notifications = enable_notifications
         self.enable_sound = enable_sound
+        self.enable_popups = enable_popups
         self.logger = logging.getLogger(__name__)
         self.platform = platform.system().lower()
+        
+        # 聚合和限流设置
+        self.aggregation_window = 1.0
+        self.burst_cooldown = 10.0
+        self.rate_limiter = TokenBucket(rate=10 / 60, capacity=3)
+        
+        self._queue = queue.Queue()
+        self._consumer = None
+        self._consumer_lock = threading.Lock()
+        self._burst_until = 0
+    
+    def configure(self, rate_per_minute=10, burst=3, aggregation_window=1.0, burst_cooldown=10.0):
+        """
+        设置通知聚合和限流参数
+        :param rate_per_minute: 每分钟最多发送的通知数量，0 表示不限制
+        :param burst: 允许连续发送的最大通知数量
+        :param aggregation_window: 合并通知的时间窗口（秒）
+        :param burst_cooldown: 合并发送汇总后，保持静音和不弹窗的时间（秒）
+        """
+        self.rate_limiter = TokenBucket(rate=rate_per_minute / 60, capacity=burst)
+        self.aggregation_window = aggregation_window
+        self.burst_cooldown = burst_cooldown
     
-    def send_notification(self, title, message, file_path=None):
+    def send_notification(self, title, message, file_path=None, categories=None):
         """
-        发送系统通知
+        发送系统通知（异步）
         :param title: 通知标题
         :param message: 通知内容
         :param file_path: 相关文件路径（可选，用于在支持的平台上打开文件）
+        :param categories: 文件移动通知的 {分类: 文件数量}（可选），带此参数的通知会与其他文件通知合并
         """
         if not self.enable_notifications:
             return
         
+        self._ensure_consumer()
+        self._queue.put(_Notification(title, message, file_path, categories))
+    
+    def stop(self, timeout=5):
+        """发送队列中剩余的通知后停止发送线程"""
+        with self._consumer_lock:
+            consumer = self._consumer
+            if consumer is None:
+                return
+            self._queue.put(None)
+        consumer.join(timeout)
+        with self._consumer_lock:
+            self._consumer = None
+    
+    def _ensure_consumer(self):
+        """按需启动通知发送线程"""
+        with self._consumer_lock:
+            if self._consumer is None or not self._consumer.is_alive():
+                self._consumer = threading.Thread(target=self._consume, name="NotificationManager", daemon=True)
+                self._consumer.start()
+    
+    def _consume(self):
+        """通知发送线程主循环"""
+        pending_count = 0
+        pending_categories = {}
+        pending_single = None
+        # 令牌不足时暂存的其他通知: {标题: [条数, 最近一条通知]}，按标题合并，不会丢弃
+        pending_messages = {}
+        stopping = False
+        
+        while not stopping or pending_count or pending_messages:
+            # 有待发送的通知时，最多等到下一个令牌可用
+            timeout = self.rate_limiter.time_until_available() if pending_count or pending_messages else None
+            items = []
+            try:
+                if stopping:
+                    raise queue.Empty
+                if timeout is None:
+                    items.append(self._queue.get())
+                elif timeout > 0:
+                    items.append(self._queue.get(timeout=timeout))
+                else:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            # 在聚合窗口内收集更多通知
+            if items:
+                deadline = time.monotonic() + self.aggregation_window
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            
+            # 停止前把剩余通知全部发出，不再限流
+            if None in items:
+                stopping = True
+            for item in items:
+                if item is None:
+                    continue
+                elif item.categories:
+                    for category, count in item.categories.items():
+                        pending_categories[category] = pending_categories.get(category, 0) + count
+                    pending_count += sum(item.categories.values())
+                    pending_single = item
+                else:
+                    entry = pending_messages.setdefault(item.title, [0, item])
+                    entry[0] += 1
+                    entry[1] = item
+            
+            # 其他通知（如处理失败）优先于文件汇总发送
+            if pending_messages and (stopping or self.rate_limiter.try_acquire()):
+                self._deliver_messages(pending_messages)
+                pending_messages = {}
+            
+            if not pending_count:
+                continue
+            if not stopping and not self.rate_limiter.try_acquire():
+                # 令牌不足时继续累积，等下一次合并发送
+                continue
+            
+            if pending_count == 1 and not self._in_burst():
+                self._deliver(pending_single.title, pending_single.message, pending_single.file_path)
+            else:
+                self._burst_until = time.monotonic() + self.burst_cooldown
+                parts = [f"{category} {count}" for category, count in
+                         sorted(pending_categories.items(), key=lambda item: -item[1])]
+                self._deliver("文件已处理", f"{pending_count} 个文件已移动: " + ", ".join(parts), quiet=True)
+            pending_count = 0
+            pending_categories = {}
+            pending_single = None
+    
+    def _deliver_messages(self, pending_messages):
+        """
+        发送暂存的其他通知：只有一条时原样发送，多条时合并为一条，
+        每个标题保留条数和最近一条内容
+        """
+        if len(pending_messages) == 1:
+            title, (count, item) = next(iter(pending_messages.items()))
+            message = item.message if count == 1 else f"共 {count} 条，最近一条: {item.message}"
+            self._deliver(title, message, item.file_path if count == 1 else None, quiet=self._in_burst())
+            return
+        lines = []
+        for title, (count, item) in pending_messages.items():
+            prefix = f"{title}（{count} 条，最近一条）" if count > 1 else title
+            lines.append(f"{prefix}: {item.message}")
+        total = sum(count for count, _ in pending_messages.values())
+        title = f"{total} 条通知"
+        self._deliver(title, "\n".join(lines), quiet=self._in_burst())
+    
+    def _in_burst(self):
+        """检查当前是否处于突发期间"""
+        return time.monotonic() < self._burst_until
+    
+    def _deliver(self, title, message, file_path=None, quiet=False):
+        """
+        实际显示系统通知
+        :param quiet: 为 True 时不播放声音，也不弹出带按钮的弹窗
+        """
+        start = time.perf_counter()
         try:
             # Windows平台使用tkinter创建带按钮的弹窗
-            if self.platform == "windows" and TKINTER_AVAILABLE and file_path:
-                # 在新线程中显示弹窗，避免阻塞主线程
+            if (self.platform == "windows" and self.enable_popups and file_path and not quiet
+                    and _load_tkinter()):
+                # 在新线程中显示弹窗，避免阻塞发送线程
                 thread = threading.Thread(
                     target=self._show_tkinter_popup, 
                     args=(title, message, file_path),
@@ -50,10 +228,6 @@ class NotificationManager:
                 # 使用系统默认通知
                 if self.platform == "windows":
                     try:
-                        import winsound
-                        # 发送系统通知
-                        winsound.MessageBeep(winsound.MB_ICONASTERISK)
-                        
                         # 使用Windows命令行工具发送通知
                         cmd = f'powershell -Command "New-BurntToastNotification -Text \'{title}\', \'{message}\'"'
                         subprocess.run(cmd, shell=True, capture_output=True)
@@ -65,14 +239,15 @@ class NotificationManager:
                     # 其他平台降级到控制台输出
                     print(f"[通知] {title}: {message}")
             
-            self.logger.info(f"发送通知: {title} - {message}")
+            self.logger.info("发送通知: %s - %s", title, message)
             
             # 如果启用声音，播放系统声音
-            if self.enable_sound:
+            if self.enable_sound and not quiet:
                 self._play_system_sound()
                 
         except Exception as e:
             self.logger.error(f"发送通知失败: {e}")
+        _NOTIFY_SECONDS.observe(time.perf_counter() - start)
     
     def _show_tkinter_popup(self, title, message, file_path):
         """
@@ -81,6 +256,7 @@ class NotificationManager:
         :param message: 通知内容
         :param file_path: 文件路径
         """
+        tk = _load_tkinter()
         try:
             # 创建根窗口
             root = tk.Tk()
@@ -0,0 +1,364 @@
+import os
+import sys
+import time
+import heapq
+import itertools
+import threading
+import logging
+from pathlib import Path
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileDeletedEvent, FileMovedEvent
+
+from file_watcher import FileHandler
+
+# 目录修改时间的精度余量：网络文件系统的时间戳精度可能只有 1～2 秒，
+# 修改时间与上次列举时间过近的目录会在下一次轮询时再列举一次，避免遗漏同一时间戳内的变化
+MTIME_GRANULARITY_NS = 2 * 10 ** 9
+
+# 目录项签名：POSIX 上为 (inode, 大小, 修改时间)，inode 变化表示文件被替换；
+# Windows 上 inode 需要额外的系统调用，只使用随目录列表一起返回的 (大小, 修改时间)
+_SIGNATURE_HAS_INODE = sys.platform != 'win32'
+
+def _entry_signature(entry):
+    """目录项签名，用于发现新增、修改、替换和重命名的文件"""
+    stat_result = entry.stat(follow_symlinks=False)
+    if _SIGNATURE_HAS_INODE:
+        return (entry.inode(), stat_result.st_size, stat_result.st_mtime_ns)
+    return (stat_result.st_size, stat_result.st_mtime_ns)
+
+def _file_state(path):
+    """文件的 (大小, 修改时间)，文件不存在时返回 None"""
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat_result.st_size, stat_result.st_mtime_ns)
+
+class _DirectorySnapshot:
+    """单个目录的快照：目录修改时间、列举时间、文件名 -> 签名、子目录"""
+
+    __slots__ = ('mtime_ns', 'listed_ns', 'files', 'subdirs')
+
+    def __init__(self, mtime_ns, listed_ns, files, subdirs):
+        self.mtime_ns = mtime_ns
+        self.listed_ns = listed_ns
+        self.files = files
+        self.subdirs = subdirs
+
+class _PolledRoot:
+    """一个轮询的监听目录"""
+
+    def __init__(self, path, handler, recursive, exclude_directories, interval):
+        self.path = path
+        self.handler = handler
+        self.recursive = recursive
+        self.exclude_directories = {os.path.abspath(directory) for directory in (exclude_directories or [])}
+        self.interval = interval
+        self.removed = False
+        # 目录路径 -> _DirectorySnapshot，首次轮询时建立
+        self.directories = None
+        self.file_count = 0
+        # 需要单独检查的文件路径 -> (大小, 修改时间)，见 PollingWatcher.recheck
+        self.rechecks = {}
+
+class PollingWatcher:
+    """
+    轮询文件监听器，用于文件系统事件不可靠的网络共享目录（NFS / SMB）
+    每个目录保留一份内存快照，轮询时只 stat 目录本身，目录修改时间未变化的目录不重新列举；
+    重新列举的目录按 (inode, 大小, 修改时间) 比较每个文件，发现新增、原地修改、替换和重命名；
+    目录修改时间不随文件内容变化，等待超时的文件另外单独检查。
+    检测到的变化转换为与 Observer 相同的事件交给 FileHandler，轮询间隔随目录繁忙程度自动调整
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=30.0, max_cpu=0.05, trace_writer=None):
+        """
+        :param min_interval: 最短轮询间隔（秒），目录有变化时逐步缩短到此值
+        :param max_interval: 最长轮询间隔（秒），目录空闲时逐步延长到此值
+        :param max_cpu: 轮询允许占用的 CPU 比例，单次轮询耗时较长的目录会相应延长间隔
+        :param trace_writer: 文件事件记录器（可选）
+        """
+        self.min_interval = max(0.1, float(min_interval))
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.max_cpu = min(max(float(max_cpu), 0.001), 1.0)
+        self.trace_writer = trace_writer
+        self.logger = logging.getLogger(__name__)
+
+        # (目录绝对路径, 是否递归) -> _PolledRoot
+        self._roots = {}
+        # 轮询计划：(下次轮询时间, 序号, _PolledRoot)
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def add_directory(self, watch_directory, stability_tracker, ignore_suffixes=None, recursive=False,
+                      exclude_directories=None):
+        """
+        添加轮询目录，参数与 FileWatcher.add_directory 相同，可在启动前或启动后调用
+        """
+        Path(watch_directory).mkdir(parents=True, exist_ok=True)
+        handler = FileHandler(stability_tracker, ignore_suffixes, exclude_directories, self.trace_writer)
+        root = _PolledRoot(watch_directory, handler, recursive, exclude_directories, self.min_interval)
+        with self._condition:
+            self._roots[(os.path.abspath(watch_directory), recursive)] = root
+            heapq.heappush(self._schedule, (0.0, next(self._sequence), root))
+            self._condition.notify()
+        mode = "（包含子目录）" if recursive else ""
+        self.logger.info(f"开始轮询目录: {watch_directory}{mode}")
+
+    def update_directory(self, watch_directory, recursive, ignore_suffixes=None, exclude_directories=None):
+        """更新轮询目录的忽略后缀和排除目录，快照保留不变"""
+        root = self._roots.get((os.path.abspath(watch_directory), recursive))
+        if root is not None:
+            root.handler.configure(ignore_suffixes, exclude_directories)
+            root.exclude_directories = {os.path.abspath(directory) for directory in (exclude_directories or [])}
+
+    def remove_directory(self, watch_directory, recursive):
+        """停止轮询目录"""
+        with self._condition:
+            root = self._roots.pop((os.path.abspath(watch_directory), recursive), None)
+            if root is None:
+                return
+            # 计划中的条目在到期时跳过
+            root.removed = True
+        self.logger.info(f"停止轮询目录: {watch_directory}")
+
+    def recheck(self, file_path):
+        """
+        在每次轮询时单独检查文件，文件再次变化后产生 modified 事件
+        原地追加写入不会改变目录的修改时间，稳定性跟踪器等待超时放弃的文件由此继续跟踪
+        """
+        state = _file_state(file_path)
+        if state is None:
+            return
+        path = os.path.abspath(file_path)
+        with self._condition:
+            for (directory, recursive), root in self._roots.items():
+                parent = os.path.dirname(path)
+                if parent == directory or (recursive and parent.startswith(os.path.join(directory, ''))):
+                    root.rechecks[path] = state
+                    return
+
+    def start(self):
+        """启动轮询线程"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PollingWatcher", daemon=True)
+        self._thread.start()
+        self.logger.info("轮询监听已启动")
+
+    def stop(self):
+        """停止轮询"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.logger.info("轮询监听已停止")
+
+    def get_stats(self):
+        """获取每个轮询目录的快照规模和当前轮询间隔"""
+        return {
+            root.path: {
+                'directories': len(root.directories or ()),
+                'files': root.file_count,
+                'interval': root.interval,
+            }
+            for root in list(self._roots.values())
+        }
+
+    def _run(self):
+        """轮询线程主循环，所有目录共用一个线程，按各自的下次轮询时间调度"""
+        while True:
+            with self._condition:
+                root = None
+                while self._running:
+                    if not self._schedule:
+                        self._condition.wait()
+                        continue
+                    due, _, root = self._schedule[0]
+                    if root.removed:
+                        heapq.heappop(self._schedule)
+                        continue
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        self._condition.wait(wait)
+                        continue
+                    heapq.heappop(self._schedule)
+                    break
+                if not self._running:
+                    return
+
+            try:
+                self._poll(root)
+            except Exception as e:
+                self.logger.error(f"轮询目录失败 {root.path}: {e}")
+            with self._condition:
+                if not root.removed:
+                    heapq.heappush(self._schedule, (time.monotonic() + root.interval, next(self._sequence), root))
+
+    def _poll(self, root):
+        """轮询一个监听目录：检查每个目录的修改时间，只重新列举发生变化的目录"""
+        start_cpu = time.thread_time()
+        start_time = time.monotonic()
+
+        if root.directories is None:
+            root.directories = {}
+            self._list(root, root.path, None, None)
+            self.logger.info(
+                f"建立轮询快照: {root.path}, {len(root.directories)} 个目录, {root.file_count} 个文件, "
+                f"用时 {time.monotonic() - start_time:.2f} 秒"
+            )
+            self._adapt_interval(root, 0, time.thread_time() - start_cpu)
+            return
+
+        created = []
+        deleted = []
+        listed = 0
+        for directory in list(root.directories):
+            snapshot = root.directories.get(directory)
+            if snapshot is None:
+                # 已随父目录一起移除
+                continue
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self._remove_directory(root, directory, deleted)
+                continue
+            except OSError as e:
+                self.logger.debug("无法读取目录状态 %s: %s", directory, e)
+                continue
+            recent = snapshot.mtime_ns + MTIME_GRANULARITY_NS > snapshot.listed_ns
+            if mtime_ns == snapshot.mtime_ns and not recent:
+                continue
+            self._list(root, directory, snapshot, (created, deleted))
+            listed += 1
+
+        changes = self._dispatch(root, created, deleted) + self._recheck_files(root)
+        cpu_time = time.thread_time() - start_cpu
+        self._adapt_interval(root, changes, cpu_time)
+        if listed:
+            self.logger.debug(
+                f"轮询 {root.path}: 重新列举 {listed} 个目录, {changes} 个变化, "
+                f"CPU {cpu_time * 1000:.1f} ms, 下次间隔 {root.interval:.1f} 秒"
+            )
+
+    def _list(self, root, directory, snapshot, changes):
+        """
+        列举目录并与旧快照比较
+        :param snapshot: 目录的旧快照，新目录为 None
+        :param changes: (新增列表, 删除列表)，建立初始快照时为 None，不产生事件
+        """
+        listed_ns = time.time_ns()
+        try:
+            # 先取目录修改时间再列举，列举期间发生的变化会在下次轮询时被发现
+            mtime_ns = os.stat(directory).st_mtime_ns
+            files = {}
+            subdirs = set()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            files[entry.name] = _entry_signature(entry)
+                        elif (root.recursive and entry.is_dir(follow_symlinks=False)
+                              and os.path.abspath(entry.path) not in root.exclude_directories):
+                            subdirs.add(entry.path)
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            if snapshot is not None and changes is not None:
+                self._remove_directory(root, directory, changes[1])
+            return
+        except OSError as e:
+            self.logger.warning(f"无法列举目录 {directory}: {e}")
+            return
+
+        old_files = snapshot.files if snapshot is not None else {}
+        old_subdirs = snapshot.subdirs if snapshot is not None else set()
+        root.directories[directory] = _DirectorySnapshot(mtime_ns, listed_ns, files, subdirs)
+        root.file_count += len(files) - len(old_files)
+
+        if changes is not None:
+            created, deleted = changes
+            for name, signature in files.items():
+                old_signature = old_files.get(name)
+                if old_signature is None:
+                    created.append((os.path.join(directory, name), signature))
+                elif old_signature != signature:
+                    # POSIX 上 inode 变化表示文件被替换，其余变化表示文件被修改
+                    if _SIGNATURE_HAS_INODE and old_signature[0] != signature[0]:
+                        created.append((os.path.join(directory, name), signature))
+                    else:
+                        root.handler.dispatch(FileModifiedEvent(os.path.join(directory, name)))
+            for name, signature in old_files.items():
+                if name not in files:
+                    deleted.append((os.path.join(directory, name), signature))
+
+        for subdir in subdirs - old_subdirs:
+            if subdir not in root.directories:
+                self._list(root, subdir, None, changes)
+        for subdir in old_subdirs - subdirs:
+            self._remove_directory(root, subdir, changes[1] if changes is not None else None)
+
+    def _recheck_files(self, root):
+        """检查 recheck 登记的文件，已变化的文件产生 modified 事件并停止检查，返回变化数量"""
+        with self._condition:
+            rechecks = list(root.rechecks.items())
+        changed = 0
+        for path, state in rechecks:
+            current = _file_state(path)
+            if current == state:
+                continue
+            with self._condition:
+                root.rechecks.pop(path, None)
+            if current is not None:
+                root.handler.dispatch(FileModifiedEvent(path))
+                changed += 1
+        return changed
+
+    def _remove_directory(self, root, directory, deleted):
+        """从快照中移除目录及其所有子目录，其中的文件记为已删除"""
+        snapshot = root.directories.pop(directory, None)
+        if snapshot is None:
+            return
+        root.file_count -= len(snapshot.files)
+        if deleted is not None:
+            deleted.extend((os.path.join(directory, name), signature) for name, signature in snapshot.files.items())
+        for subdir in snapshot.subdirs:
+            self._remove_directory(root, subdir, deleted)
+
+    def _dispatch(self, root, created, deleted):
+        """
+        把变化转换为文件事件交给事件处理器，返回变化数量
+        签名相同的一对删除和新增视为重命名，以便稳定性跟踪器跟随重命名
+        """
+        removed_by_signature = {}
+        for path, signature in deleted:
+            # 签名不唯一时无法确定对应关系，按删除和新增分别处理
+            removed_by_signature[signature] = None if signature in removed_by_signature else path
+
+        renamed = set()
+        for path, signature in created:
+            src_path = removed_by_signature.pop(signature, None)
+            if src_path is not None:
+                renamed.add(src_path)
+                root.handler.dispatch(FileMovedEvent(src_path, path))
+            else:
+                root.handler.dispatch(FileCreatedEvent(path))
+        for path, _ in deleted:
+            if path not in renamed:
+                root.handler.dispatch(FileDeletedEvent(path))
+        return len(created) + len(deleted)
+
+    def _adapt_interval(self, root, changes, cpu_time):
+        """
+        根据目录繁忙程度调整轮询间隔：有变化时减半，空闲时逐步延长；
+        同时保证轮询占用的 CPU 不超过 max_cpu
+        """
+        if changes:
+            interval = root.interval / 2
+        else:
+            interval = root.interval * 1.5
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        root.interval = max(interval, cpu_time / self.max_cpu)
@@ -0,0 +1,120 @@
+import time
+import pickle
+import logging
+import itertools
+import threading
+import weakref
+
+# 每个工作进程保留的已编译规则快照数量，重新加载配置后旧快照仍可能被处理中的批次使用
+_WORKER_CACHE_SIZE = 4
+
+# 工作进程中已编译的规则引擎：快照编号 -> RuleEngine
+_worker_engines = {}
+
+def _classify_in_worker(snapshot_id, snapshot, file_paths):
+    """
+    在工作进程中对一组文件分类
+    :param snapshot: 序列化的 (规则列表, 默认目标, 是否自适应顺序)，只在本进程尚未编译该快照时反序列化
+    返回 ([(文件路径, RuleDecision, 用时秒数)], 本次分类的规则命中计数)
+    """
+    engine = _worker_engines.get(snapshot_id)
+    if engine is None:
+        from rule_engine import RuleEngine
+        rules, default_target, adaptive = pickle.loads(snapshot)
+        engine = RuleEngine(rules, default_target, adaptive)
+        while len(_worker_engines) >= _WORKER_CACHE_SIZE:
+            _worker_engines.pop(min(_worker_engines))
+        _worker_engines[snapshot_id] = engine
+    counters = engine.get_counters()
+    results = []
+    for file_path in file_paths:
+        start = time.perf_counter()
+        decision = engine.classify(file_path)
+        results.append((file_path, decision, time.perf_counter() - start))
+    return results, engine.counters_since(counters)
+
+class ClassifierPool:
+    """
+    多进程分类
+    规则匹配和内容类型识别在工作进程中执行，不受主进程 GIL 限制；分发器的工作线程提交整批文件并等待结果，
+    移动、移动日志、重复文件索引和通知仍在主进程中处理。
+    规则快照不经过 YAML：每个规则引擎只序列化一次，工作进程按快照编号缓存编译结果
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: 工作进程数量
+        """
+        self.workers = max(1, int(workers))
+        self.logger = logging.getLogger(__name__)
+        self._executor = None
+        self._lock = threading.Lock()
+        # RuleEngine -> (快照编号, 序列化的规则)，规则引擎被替换并释放后自动移除
+        self._snapshots = weakref.WeakKeyDictionary()
+        self._snapshot_ids = itertools.count(1)
+
+    def start(self):
+        """创建进程池，工作进程在首次提交时启动"""
+        # 统一使用 spawn：主进程已有多个线程，fork 可能复制处于加锁状态的锁
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+        self.logger.info(f"多进程分类已启用: {self.workers} 个工作进程")
+
+    def stop(self):
+        """关闭进程池，等待正在执行的分类完成"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _snapshot(self, rule_engine):
+        with self._lock:
+            snapshot = self._snapshots.get(rule_engine)
+            if snapshot is None:
+                payload = pickle.dumps(
+                    (rule_engine.rules, rule_engine.default_target, rule_engine.adaptive), pickle.HIGHEST_PROTOCOL
+                )
+                snapshot = self._snapshots[rule_engine] = (next(self._snapshot_ids), payload)
+            return snapshot
+
+    def classify(self, rule_engine, file_paths):
+        """
+        在工作进程中按规则引擎的规则对文件分类
+        进程池不可用（已关闭或工作进程异常退出）时在当前线程中分类，异常退出的进程池会重新创建；
+        工作进程中的规则命中计数合并到主进程的规则引擎
+        返回 [(文件路径, RuleDecision, 用时秒数)]
+        """
+        executor = self._executor
+        if executor is not None:
+            snapshot_id, payload = self._snapshot(rule_engine)
+            try:
+                results, counters = executor.submit(_classify_in_worker, snapshot_id, payload, list(file_paths)).result()
+                rule_engine.merge_counters(*counters)
+                return results
+            except Exception as e:
+                from concurrent.futures.process import BrokenProcessPool
+                if isinstance(e, BrokenProcessPool):
+                    self.logger.error(f"分类工作进程异常退出，重新创建进程池: {e}")
+                    self._restart(executor)
+                else:
+                    self.logger.error(f"多进程分类失败，改为在主进程中分类: {e}")
+        results = []
+        for file_path in file_paths:
+            start = time.perf_counter()
+            decision = rule_engine.classify(file_path)
+            results.append((file_path, decision, time.perf_counter() - start))
+        return results
+
+    def _restart(self, broken):
+        """替换异常退出的进程池（多个线程同时发现时只替换一次）"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
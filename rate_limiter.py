@@ -0,0 +1,58 @@
+import time
+import threading
+
+class TokenBucket:
+    """令牌桶限流器，按固定速率补充令牌，允许不超过桶容量的突发"""
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate: 每秒补充的令牌数量，小于等于 0 表示不限流
+        :param capacity: 桶容量，即允许的最大突发量
+        """
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """按经过的时间补充令牌，必须在持有锁时调用"""
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, amount=1):
+        """尝试取出令牌，成功返回 True，令牌不足时立即返回 False"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+    def acquire(self, amount=1):
+        """
+        取出令牌，令牌不足时阻塞等待
+        数量超过桶容量时允许令牌变为负数，由后续请求分摊等待时间
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def time_until_available(self, amount=1):
+        """距离可以取出指定数量令牌还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = amount - self._tokens
+            return max(0.0, missing / self.rate)
@@ -1,50 +1,548 @@
 import os
+import re
+import time
+import fnmatch
 import logging
+import threading
+from collections import namedtuple
+
+from mime_sniffer import HEADER_SIZE, sniff_mime, mime_matches
+from completion_detector import normalize_strategies
+
+# 规则匹配结果：目标分类、是否通知、命中的规则名称（未命中任何规则时为 None）
+RuleDecision = namedtuple('RuleDecision', ['target', 'notify', 'rule_name'])
+
+# 除扩展名外的匹配条件，包含其中任意一项的规则按顺序逐条判断
+PREDICATE_KEYS = ('patterns', 'regex', 'min_size', 'max_size', 'min_age', 'max_age', 'mime')
+
+_SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2,
+               'g': 1024 ** 3, 'gb': 1024 ** 3, 't': 1024 ** 4, 'tb': 1024 ** 4}
+_AGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+_QUANTITY_PATTERN = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*$')
+
+# 嵌入其他正则后含义会改变的写法：编号反向引用、命名反向引用、全局内联标志（如 (?i)）
+_STANDALONE_REGEX = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+# 自适应匹配顺序：每分类这么多个文件后按近期命中次数重新排列条件规则，较早的命中次数每次减半
+REORDER_INTERVAL = 1000
+
+def parse_quantity(value, units):
+    """解析带单位的数量，如 "10MB"、"2h"；纯数字直接返回"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    match = _QUANTITY_PATTERN.match(str(value))
+    if not match or match.group(2).lower() not in units:
+        raise ValueError(f"无法解析的数值: {value}")
+    return float(match.group(1)) * units[match.group(2).lower()]
+
+def _ranges_disjoint(low, high, other_low, other_high):
+    """两个闭区间（None 表示不限）是否没有交集"""
+    return ((high is not None and other_low is not None and high < other_low)
+            or (other_high is not None and low is not None and other_high < low))
+
+def _mime_patterns_overlap(pattern, other):
+    """两个内容类型模式是否可能匹配同一类型"""
+    if pattern == other or '*/*' in (pattern, other):
+        return True
+    if pattern.endswith('/*') and other.startswith(pattern[:-1]):
+        return True
+    return other.endswith('/*') and pattern.startswith(other[:-1])
+
+class _FileProbe:
+    """
+    单个文件的惰性属性读取器
+    文件状态和头部内容只在规则真正需要时读取，并且每个文件最多读取一次
+    """
+
+    __slots__ = ('path', 'filename', 'extensions', '_size', '_mtime', '_stat_loaded', '_mime', '_name_match')
+
+    def __init__(self, path, filename, extensions, size=None, mtime=None):
+        self.path = path
+        self.filename = filename
+        self.extensions = extensions
+        self._size = size
+        self._mtime = mtime
+        self._stat_loaded = size is not None and mtime is not None
+        self._mime = None
+        self._name_match = None
+
+    def _load_stat(self):
+        self._stat_loaded = True
+        try:
+            stat_result = os.stat(self.path)
+        except OSError:
+            return
+        if self._size is None:
+            self._size = stat_result.st_size
+        if self._mtime is None:
+            self._mtime = stat_result.st_mtime
+
+    @property
+    def size(self):
+        if not self._stat_loaded:
+            self._load_stat()
+        return self._size
+
+    @property
+    def mtime(self):
+        if not self._stat_loaded:
+            self._load_stat()
+        return self._mtime
+
+    @property
+    def mime(self):
+        if self._mime is None:
+            try:
+                with open(self.path, 'rb') as file:
+                    header = file.read(HEADER_SIZE)
+            except OSError:
+                header = None
+            self._mime = sniff_mime(header) if header is not None else ''
+        return self._mime
+
+class _PredicateRule:
+    """编译后的条件规则，匹配条件按开销从低到高排列"""
+
+    def __init__(self, order, decision, rule):
+        self.order = order
+        self.decision = decision
+
+        extensions = rule.get('extensions')
+        self.extensions = frozenset(RuleEngine._normalize_extension(ext) for ext in extensions) if extensions else None
+
+        # 文件名条件：通配符（不区分大小写）和正则（search 语义）
+        patterns = rule.get('patterns') or []
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        regexes = rule.get('regex') or []
+        if isinstance(regexes, str):
+            regexes = [regexes]
+        self.name_sources = ['(?i:' + fnmatch.translate(pattern) + ')' for pattern in patterns]
+        # 不能嵌入合并正则的用户正则单独编译，按原样以 search 匹配
+        self.standalone_regexes = []
+        for regex in regexes:
+            try:
+                compiled = re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"正则表达式无效 {regex!r}: {e}") from e
+            wrapped = '.*?(?:' + regex + ')'
+            if _STANDALONE_REGEX.search(regex) is None:
+                try:
+                    re.compile(wrapped, re.DOTALL)
+                except re.error:
+                    pass
+                else:
+                    self.name_sources.append(wrapped)
+                    continue
+            self.standalone_regexes.append(compiled)
+        self.name_regex = re.compile('|'.join(self.name_sources), re.DOTALL) if self.name_sources else None
+        self.has_name_condition = bool(self.name_sources or self.standalone_regexes)
+        # 合并正则中本规则对应的分组编号，由 RuleEngine 编译时设置
+        self.name_group = None
+        # 排在本规则之前且可能命中同一文件的规则序号，由 RuleEngine 编译时设置
+        self.blockers = frozenset()
+
+        self.min_size = parse_quantity(rule.get('min_size'), _SIZE_UNITS)
+        self.max_size = parse_quantity(rule.get('max_size'), _SIZE_UNITS)
+        self.min_age = parse_quantity(rule.get('min_age'), _AGE_UNITS)
+        self.max_age = parse_quantity(rule.get('max_age'), _AGE_UNITS)
+
+        mime = rule.get('mime') or []
+        self.mime = [mime] if isinstance(mime, str) else list(mime)
+
+    def name_matches(self, filename):
+        """检查文件名是否满足本规则的任一文件名条件"""
+        if self.name_regex is not None and self.name_regex.match(filename):
+            return True
+        return any(regex.search(filename) for regex in self.standalone_regexes)
+
+    def matches(self, probe, name_first_order):
+        """
+        检查文件是否满足本规则的全部条件
+        :param name_first_order: 合并正则给出的第一个文件名匹配的规则序号，用于跳过不可能匹配的规则
+        """
+        if self.extensions is not None and not self.extensions.intersection(probe.extensions):
+            return False
+
+        if self.has_name_condition:
+            if name_first_order is None or self.order < name_first_order:
+                return False
+            if self.order > name_first_order and not self.name_matches(probe.filename):
+                return False
+
+        if self.min_size is not None or self.max_size is not None:
+            size = probe.size
+            if size is None:
+                return False
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+
+        if self.min_age is not None or self.max_age is not None:
+            mtime = probe.mtime
+            if mtime is None:
+                return False
+            age = time.time() - mtime
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+
+        if self.mime and not mime_matches(probe.mime, self.mime):
+            return False
+
+        return True
+
+    def may_overlap(self, other):
+        """
+        两条规则是否可能命中同一个文件
+        只根据扩展名、大小、年龄和内容类型条件判断，文件名条件总是视为可能重叠
+        """
+        if self.extensions is not None and other.extensions is not None:
+            # 多段扩展名的文件同时具有长短两种扩展名（如 .tar.gz 和 .gz）
+            if not any(extension.endswith(other_extension) or other_extension.endswith(extension)
+                       for extension in self.extensions for other_extension in other.extensions):
+                return False
+        if _ranges_disjoint(self.min_size, self.max_size, other.min_size, other.max_size):
+            return False
+        if _ranges_disjoint(self.min_age, self.max_age, other.min_age, other.max_age):
+            return False
+        if self.mime and other.mime:
+            if not any(_mime_patterns_overlap(pattern, other_pattern)
+                       for pattern in self.mime for other_pattern in other.mime):
+                return False
+        return True
 
 class RuleEngine:
-    """规则引擎，根据配置规则对文件进行分类"""
-    
-    def __init__(self, rules, default_target):
+    """
+    规则引擎，根据配置规则对文件进行分类
+    记录每条规则的命中次数和分类用时；启用自适应匹配顺序时，互不重叠的条件规则按命中次数排列，
+    可能同时命中的规则保持配置中的先后顺序，匹配结果与按配置顺序逐条检查相同
+    """
+
+    def __init__(self, rules, default_target, adaptive=False):
+        """
+        :param rules: 规则列表
+        :param default_target: 未匹配任何规则时的目标分类
+        :param adaptive: 是否按命中次数调整条件规则的检查顺序
+        """
         self.rules = rules
         self.default_target = default_target
+        self.adaptive = adaptive
         self.logger = logging.getLogger(__name__)
-    
+
+        # 规则在构造时编译：纯扩展名规则进入 扩展名 -> (规则序号, 匹配结果) 索引，
+        # 其余规则编译为按配置顺序排列的条件规则列表
+        self.default_decision = RuleDecision(default_target, False, None)
+        self._extension_index = {}
+        self._max_extension_parts = 1
+        self._predicate_rules = []
+        self._name_regex = None
+        # 按配置顺序排列的 (扩展名集合, 文件名匹配函数, 写入完成判定方式)，没有规则设置 completion 时为空
+        self._completion_rules = []
+        # 配置无效而被忽略的规则: ["规则名称: 原因"]
+        self.errors = []
+        # 文件名条件未并入合并正则、需要逐条检查的条件规则（按配置顺序）
+        self._unmerged_name_rules = []
+        self._compile_rules()
+        # 条件规则的检查顺序，未启用自适应顺序时即为配置顺序；调整时整体替换
+        self._evaluation_order = self._predicate_rules
+
+        # 按规则序号记录的命中次数、分类用时和检查的条件规则数量，最后一项为默认目标
+        self._stats_lock = threading.Lock()
+        slots = len(self.rules) + 1
+        self._hits = [0] * slots
+        self._seconds = [0.0] * slots
+        self._checks = [0] * slots
+        self._classified = 0
+        # 自适应顺序使用的近期命中次数和上次调整时的命中次数
+        self._weights = [0.0] * slots
+        self._reorder_base = [0] * slots
+
+    def _compile_rules(self):
+        """编译规则，同一文件命中多条规则时以配置中靠前的规则为准"""
+        index = {}
+        predicate_rules = []
+        completion_rules = []
+        max_parts = 1
+        for order, rule in enumerate(self.rules):
+            decision = RuleDecision(
+                rule.get('target', self.default_target),
+                rule.get('notify', False),
+                rule.get('name', 'Unknown')
+            )
+            extensions = [self._normalize_extension(ext) for ext in rule.get('extensions', [])]
+            for extension in extensions:
+                if extension:
+                    # 多段扩展名（如 .tar.gz）需要额外检查的段数
+                    max_parts = max(max_parts, extension.count('.'))
+
+            strategies = normalize_strategies(rule.get('completion'))
+            if any(rule.get(key) is not None for key in PREDICATE_KEYS):
+                try:
+                    predicate_rule = _PredicateRule(order, decision, rule)
+                except (ValueError, re.error) as e:
+                    self.logger.error(f"规则 {decision.rule_name} 配置无效，已忽略: {e}")
+                    self.errors.append(f"{decision.rule_name}: {e}")
+                    continue
+                # 排在前面且可能命中同一文件的条件规则，调整顺序时必须仍排在本规则之前
+                predicate_rule.blockers = frozenset(
+                    earlier.order for earlier in predicate_rules if earlier.may_overlap(predicate_rule)
+                )
+                predicate_rules.append(predicate_rule)
+                name_matches = predicate_rule.name_matches if predicate_rule.has_name_condition else None
+                completion_rules.append((predicate_rule.extensions, name_matches, strategies))
+                continue
+
+            completion_rules.append((frozenset(extension for extension in extensions if extension), None, strategies))
+            for extension in extensions:
+                if extension:
+                    index.setdefault(extension, (order, decision))
+
+        self._extension_index = index
+        self._max_extension_parts = max_parts
+        self._predicate_rules = predicate_rules
+        self._name_regex = self._merge_name_regexes(predicate_rules)
+        if any(strategies is not None for _, _, strategies in completion_rules):
+            self._completion_rules = completion_rules
+        else:
+            self._completion_rules = []
+        self.logger.debug(
+            f"规则编译完成: {len(self.rules)} 条规则, {len(index)} 个扩展名, {len(predicate_rules)} 条条件规则"
+        )
+
+    def _merge_name_regexes(self, predicate_rules):
+        """
+        将条件规则的文件名条件合并为一个按规则顺序排列的分支正则
+        一次匹配即可得到第一个文件名匹配的规则；含有不能嵌入的用户正则的规则逐条检查，
+        合并失败（如分组名称冲突）时全部逐条检查
+        """
+        named_rules = [rule for rule in predicate_rules if rule.has_name_condition]
+        mergeable = [rule for rule in named_rules if not rule.standalone_regexes]
+        self._unmerged_name_rules = [rule for rule in named_rules if rule.standalone_regexes]
+        if not mergeable:
+            return None
+        source = '|'.join(f'(?P<_r{rule.order}>' + '|'.join(rule.name_sources) + ')' for rule in mergeable)
+        try:
+            merged = re.compile(source, re.DOTALL)
+        except re.error as e:
+            self.logger.debug(f"文件名正则无法合并，使用逐条匹配: {e}")
+            self._unmerged_name_rules = named_rules
+            return None
+        for rule in mergeable:
+            rule.name_group = merged.groupindex[f'_r{rule.order}']
+        return merged
+
+    def _first_name_match(self, filename):
+        """返回第一个文件名条件匹配的规则序号，没有匹配时返回 None"""
+        first = None
+        if self._name_regex is not None:
+            match = self._name_regex.match(filename)
+            if match is not None:
+                for rule in self._predicate_rules:
+                    if rule.name_group is not None and match.group(rule.name_group) is not None:
+                        first = rule.order
+                        break
+        # 逐条检查的规则只需检查排在合并正则结果之前的
+        for rule in self._unmerged_name_rules:
+            if first is not None and rule.order >= first:
+                break
+            if rule.name_matches(filename):
+                return rule.order
+        return first
+
+    @staticmethod
+    def _normalize_extension(extension):
+        """统一扩展名格式为小写并带前导点"""
+        extension = str(extension).strip().lower()
+        if extension and not extension.startswith('.'):
+            extension = '.' + extension
+        return extension
+
+    def _candidate_extensions(self, filename):
+        """
+        生成文件可能的扩展名，从最长的多段扩展名到最后一段
+        例如 archive.tar.gz -> .tar.gz, .gz
+        """
+        # 与 os.path.splitext 一致，忽略文件名开头的点（隐藏文件）
+        parts = filename.lower().lstrip('.').split('.')
+        if len(parts) < 2:
+            return []
+        start = max(1, len(parts) - self._max_extension_parts)
+        return ['.' + '.'.join(parts[i:]) for i in range(start, len(parts))]
+
+    def classify(self, file_path, size=None, mtime=None):
+        """
+        对文件进行分类
+        :param size: 已知的文件大小（可选），提供时不再读取文件状态
+        :param mtime: 已知的修改时间（可选）
+        返回 RuleDecision，包含目标分类、是否通知以及命中的规则名称
+        """
+        start = time.perf_counter()
+        decision, slot, checks = self._match(file_path, size, mtime)
+        self._record(slot, checks, time.perf_counter() - start)
+        return decision
+
+    def _match(self, file_path, size, mtime):
+        """返回 (RuleDecision, 命中的规则序号（默认目标为规则数量）, 检查的条件规则数量)"""
+        filename = os.path.basename(file_path)
+        extensions = self._candidate_extensions(filename)
+
+        # 扩展名索引给出的候选结果：多个候选扩展名都命中时取配置中靠前的规则
+        indexed = None
+        for extension in extensions:
+            hit = self._extension_index.get(extension)
+            if hit is not None and (indexed is None or hit[0] < indexed[0]):
+                indexed = hit
+
+        # 只需检查排在扩展名命中规则之前的条件规则
+        checks = 0
+        if self._predicate_rules:
+            limit = indexed[0] if indexed is not None else len(self.rules)
+            evaluation_order = self._evaluation_order
+            in_config_order = evaluation_order is self._predicate_rules
+            probe = _FileProbe(file_path, filename, extensions, size, mtime)
+            name_first_order = None
+            name_checked = False
+            for rule in evaluation_order:
+                if rule.order >= limit:
+                    if in_config_order:
+                        break
+                    continue
+                if rule.has_name_condition and not name_checked:
+                    name_first_order = self._first_name_match(filename)
+                    name_checked = True
+                checks += 1
+                if rule.matches(probe, name_first_order):
+                    self.logger.debug("文件: %s, 匹配规则: %s, 目标: %s", file_path, rule.decision.rule_name, rule.decision.target)
+                    return rule.decision, rule.order, checks
+
+        if indexed is not None:
+            order, decision = indexed
+            self.logger.debug("文件: %s, 匹配规则: %s, 目标: %s", file_path, decision.rule_name, decision.target)
+            return decision, order, checks
+
+        # 没有匹配的规则，返回默认目标
+        self.logger.debug("文件: %s, 未匹配任何规则，使用默认目标: %s", file_path, self.default_target)
+        return self.default_decision, len(self.rules), checks
+
+    def _record(self, slot, checks, seconds):
+        """记录一次分类的结果，启用自适应顺序时每 REORDER_INTERVAL 次分类调整一次检查顺序"""
+        with self._stats_lock:
+            self._hits[slot] += 1
+            self._seconds[slot] += seconds
+            self._checks[slot] += checks
+            self._classified += 1
+            if not self.adaptive or self._classified % REORDER_INTERVAL:
+                return
+            self._reorder()
+
+    def _reorder(self):
+        """
+        按近期命中次数重新排列条件规则，必须在持有统计锁时调用
+        每次选择可以放入的规则中命中最多的一条：可能与它命中同一文件的靠前规则都已放入时才可以放入，
+        因此按新顺序第一条命中的规则与按配置顺序第一条命中的规则相同
+        """
+        for slot, hits in enumerate(self._hits):
+            self._weights[slot] = self._weights[slot] / 2 + hits - self._reorder_base[slot]
+        self._reorder_base = list(self._hits)
+
+        remaining = list(self._predicate_rules)
+        placed = set()
+        order = []
+        while remaining:
+            best = None
+            for index, rule in enumerate(remaining):
+                if not rule.blockers <= placed:
+                    continue
+                if best is None or self._weights[rule.order] > self._weights[remaining[best].order]:
+                    best = index
+            rule = remaining.pop(best)
+            placed.add(rule.order)
+            order.append(rule)
+
+        if [rule.order for rule in order] == [rule.order for rule in self._evaluation_order]:
+            return
+        self._evaluation_order = self._predicate_rules if order == self._predicate_rules else order
+        self.logger.debug(f"条件规则检查顺序已调整: {', '.join(rule.decision.rule_name for rule in order)}")
+
+    def get_counters(self):
+        """返回 (命中次数, 分类用时, 检查的条件规则数量) 的副本，按规则序号排列，最后一项为默认目标"""
+        with self._stats_lock:
+            return list(self._hits), list(self._seconds), list(self._checks)
+
+    def counters_since(self, previous):
+        """返回自 get_counters 取得 previous 以来的增量"""
+        return tuple(
+            [value - before for value, before in zip(current, earlier)]
+            for current, earlier in zip(self.get_counters(), previous)
+        )
+
+    def merge_counters(self, hits, seconds, checks):
+        """合并在其他进程中分类得到的计数（多进程分类时由主进程调用）"""
+        with self._stats_lock:
+            for slot in range(min(len(hits), len(self._hits))):
+                self._hits[slot] += hits[slot]
+                self._seconds[slot] += seconds[slot]
+                self._checks[slot] += checks[slot]
+            self._classified += sum(hits)
+
+    def get_rule_stats(self):
+        """
+        每条规则的命中统计，按配置顺序排列，最后一项为默认目标（name 为 None）
+        返回字典列表: name, target, hits, seconds（命中该规则的分类总用时）, mean_checks（平均检查的条件规则数量）,
+        position（条件规则当前的检查位置，扩展名规则和默认目标为 None）
+        """
+        hits, seconds, checks = self.get_counters()
+        positions = {rule.order: position for position, rule in enumerate(self._evaluation_order)}
+        decisions = {}
+        for _, (order, decision) in self._extension_index.items():
+            decisions.setdefault(order, decision)
+        for rule in self._predicate_rules:
+            decisions[rule.order] = rule.decision
+        decisions[len(self.rules)] = self.default_decision
+
+        stats = []
+        for slot in sorted(decisions):
+            stats.append({
+                'name': decisions[slot].rule_name,
+                'target': decisions[slot].target,
+                'hits': hits[slot],
+                'seconds': seconds[slot],
+                'mean_checks': checks[slot] / hits[slot] if hits[slot] else None,
+                'position': positions.get(slot),
+            })
+        return stats
+
+    def completion_strategies(self, file_path):
+        """
+        获取文件的写入完成判定方式（规则的 completion 设置），没有规则设置时返回 None
+        文件写入完成之前无法可靠判断大小、内容类型等条件，只按扩展名和文件名条件选择第一条可能命中的规则
+        """
+        if not self._completion_rules:
+            return None
+        filename = os.path.basename(file_path)
+        extensions = self._candidate_extensions(filename)
+        for rule_extensions, name_matches, strategies in self._completion_rules:
+            if rule_extensions is not None and not rule_extensions.intersection(extensions):
+                continue
+            if name_matches is not None and not name_matches(filename):
+                continue
+            return strategies
+        return None
+
     def get_target_for_file(self, file_path):
         """
         根据文件路径获取目标分类
         返回目标分类名称
         """
-        # 获取文件扩展名
-        _, extension = os.path.splitext(file_path)
-        extension = extension.lower()
-        
-        self.logger.debug(f"文件: {file_path}, 扩展名: {extension}")
-        
-        # 遍历规则查找匹配项
-        for rule in self.rules:
-            extensions = rule.get('extensions', [])
-            if extension in extensions:
-                target = rule.get('target', self.default_target)
-                self.logger.debug(f"匹配规则: {rule.get('name', 'Unknown')}, 目标: {target}")
-                return target
-        
-        # 没有匹配的规则，返回默认目标
-        self.logger.debug(f"未匹配任何规则，使用默认目标: {self.default_target}")
-        return self.default_target
-    
+        return self.classify(file_path).target
+
     def should_notify(self, file_path):
         """
         检查是否应该对文件移动发送通知
         """
-        # 获取文件扩展名
-        _, extension = os.path.splitext(file_path)
-        extension = extension.lower()
-        
-        # 遍历规则查找匹配项
-        for rule in self.rules:
-            extensions = rule.get('extensions', [])
-            if extension in extensions:
-                # 检查规则是否要求通知
-                return rule.get('notify', False)
-        
-        return False
\ No newline at end of file
+        return self.classify(file_path).notify
@@ -0,0 +1,432 @@
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+import itertools
+
+# 将当前目录添加到Python路径中
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import percentile, format_seconds
+
+class _TraceEvent:
+    """回放用的文件事件，提供事件处理器需要的 watchdog 事件属性"""
+
+    __slots__ = ('event_type', 'src_path', 'dest_path')
+    is_directory = False
+
+    def __init__(self, event_type, src_path, dest_path):
+        self.event_type = event_type
+        self.src_path = src_path
+        self.dest_path = dest_path or ''
+
+class _NullMover:
+    """不移动文件的文件移动器，只计算目标路径并统计各分类的文件数量和大小"""
+
+    def __init__(self, target_directories):
+        self.target_directories = target_directories
+        self.placements = {}
+
+    def move_file(self, file_path, target_category, size=0):
+        """返回文件将被移动到的路径"""
+        counts = self.placements.setdefault(target_category, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+        target_dir = self.target_directories.get(target_category, target_category)
+        return os.path.join(target_dir, os.path.basename(file_path))
+
+class _SimulatedFile:
+    """模拟中等待稳定的文件"""
+
+    __slots__ = ('path', 'size', 'first_seen', 'changed', 'deadline', 'strategies')
+
+    def __init__(self, path, size, first_seen, deadline, strategies):
+        self.path = path
+        self.size = size
+        self.first_seen = first_seen
+        self.changed = first_seen
+        self.deadline = deadline
+        self.strategies = strategies
+
+class SimulatedTracker:
+    """
+    按虚拟时间运行的稳定性跟踪器，接口与 StabilityTracker 相同，由 FileHandler 调用
+    文件状态取自事件记录中的大小；静默期沿用 StabilityTracker 的计算方式，
+    关闭事件按文件的判定方式处理（open_handles 在下一次探测时确认），其余探测无法离线重现，按静默期判断
+    """
+
+    def __init__(self, policy, completion, strategy_resolver, on_ready):
+        """
+        :param policy: 未启动的 StabilityTracker，提供按大小计算的静默期
+        :param completion: 写入完成判定（CompletionDetector），提供默认判定方式和探测间隔
+        :param strategy_resolver: 按文件路径返回判定方式的函数
+        :param on_ready: 文件稳定后调用的回调函数，参数为 (_SimulatedFile, 稳定时间)
+        """
+        self.policy = policy
+        self.completion = completion
+        self.strategy_resolver = strategy_resolver
+        self.on_ready = on_ready
+        # 当前事件的虚拟时间和文件大小，由回放循环在分发事件前设置
+        self.now = 0.0
+        self.size = 0
+        self._pending = {}
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def _quiet_period(self, size):
+        return self.policy._quiet_period_for((size, 0))
+
+    def _strategies_for(self, file_path):
+        strategies = self.strategy_resolver(file_path)
+        return strategies if strategies is not None else self.completion.default_strategies
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, (entry.deadline, next(self._sequence), entry))
+
+    def track(self, file_path):
+        entry = self._pending.get(file_path)
+        if entry is None:
+            entry = _SimulatedFile(file_path, self.size, self.now, self.now + self._quiet_period(self.size),
+                                   self._strategies_for(file_path))
+            self._pending[file_path] = entry
+            self._push(entry)
+        else:
+            self._changed(entry)
+
+    def touch(self, file_path):
+        self.track(file_path)
+
+    def _changed(self, entry):
+        """文件变化时推迟截止时间，堆中的旧条目在到期时重新入堆"""
+        entry.size = self.size
+        entry.changed = self.now
+        entry.deadline = max(entry.deadline, self.now + self._quiet_period(self.size))
+
+    def mark_closed(self, file_path):
+        entry = self._pending.get(file_path)
+        if entry is None:
+            return
+        if 'close_write' in entry.strategies:
+            entry.deadline = self.now
+        elif 'open_handles' in entry.strategies:
+            entry.deadline = self.now + self.completion.probe_interval
+        else:
+            self._changed(entry)
+            return
+        entry.changed = self.now
+        self._push(entry)
+
+    def rename(self, src_path, dest_path):
+        entry = self._pending.pop(src_path, None)
+        if entry is None:
+            self.track(dest_path)
+            return
+        moved = self._pending.get(dest_path)
+        if moved is not None:
+            moved.first_seen = min(moved.first_seen, entry.first_seen)
+            self._changed(moved)
+            return
+        moved = _SimulatedFile(dest_path, self.size, entry.first_seen, self.now + self._quiet_period(self.size),
+                               self._strategies_for(dest_path))
+        moved.changed = self.now
+        self._pending[dest_path] = moved
+        self._push(moved)
+
+    def discard(self, file_path):
+        self._pending.pop(file_path, None)
+
+    def advance(self, now):
+        """处理截止时间不晚于 now 的文件"""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, _, entry = heapq.heappop(heap)
+            if self._pending.get(entry.path) is not entry:
+                continue
+            if entry.deadline > deadline:
+                self._push(entry)
+                continue
+            del self._pending[entry.path]
+            self.on_ready(entry, deadline)
+
+    def get_pending_count(self):
+        return len(self._pending)
+
+class _WorkerLane:
+    """一组处理线程：按文件稳定的先后顺序交给最早空闲的线程"""
+
+    def __init__(self, workers):
+        self._free_at = [0.0] * max(1, workers)
+
+    def submit(self, ready_time, service_time):
+        """返回 (开始处理时间, 处理完成时间)"""
+        start = max(ready_time, heapq.heappop(self._free_at))
+        finish = start + service_time
+        heapq.heappush(self._free_at, finish)
+        return start, finish
+
+class Simulation:
+    """
+    按事件记录离线模拟文件处理
+    事件经过与实际监听相同的事件处理器（忽略后缀、排除目录）进入虚拟时间的稳定性跟踪器，
+    稳定后的文件由 RuleEngine 实际分类、由不移动文件的文件移动器统计去向，
+    处理用时按 分类实测用时 + 每个文件的固定开销 + 跨设备复制用时 计算，
+    小文件和大文件分别排队交给对应数量的处理线程
+    """
+
+    def __init__(self, config_manager, args):
+        from watch_source import WatchSource, SourcePipeline
+        from rule_engine import RuleEngine
+        from file_watcher import FileHandler
+        from file_integrity_checker import FileIntegrityChecker
+        from stability_tracker import StabilityTracker
+        from completion_detector import CompletionDetector
+
+        self.args = args
+        self.large_file_size = int(config_manager.get_large_file_threshold() * 1024 * 1024)
+        policy = StabilityTracker(
+            FileIntegrityChecker(config_manager.get_integrity_check_delay()), None,
+            large_file_size=self.large_file_size,
+            large_quiet_period=config_manager.get_large_file_quiet_period()
+        )
+        completion = CompletionDetector(
+            config_manager.get_completion_strategies(), config_manager.get_completion_probe_interval()
+        )
+        self.small_lane = _WorkerLane(args.workers or config_manager.get_max_workers())
+        self.large_lane = _WorkerLane(args.large_workers or config_manager.get_large_file_workers())
+
+        self.sources = []
+        self._handlers = {}
+        for source_config in config_manager.get_watch_sources():
+            source = WatchSource.from_config(source_config)
+            target_directories = source_config['target_directories']
+            rule_engine = RuleEngine(
+                source_config['rules'], source_config['default_target'], config_manager.is_adaptive_rule_order_enabled()
+            )
+            source.pipeline = SourcePipeline(rule_engine, _NullMover(target_directories), target_directories)
+            source.stability_tracker = SimulatedTracker(
+                policy, completion, rule_engine.completion_strategies,
+                lambda entry, ready, source=source: self._process(source, entry, ready)
+            )
+            self._handlers[source.name] = FileHandler(
+                source.stability_tracker, config_manager.get_ignore_suffixes(), source.get_excluded_directories()
+            )
+            self.sources.append(source)
+
+        self.events = {}
+        self.unmatched_events = 0
+        self.rule_hits = {}
+        self.latencies = []
+        self.stability_waits = []
+        self.queue_waits = []
+        self.classify_seconds = 0.0
+        self.files = 0
+        self.bytes = 0
+        self.cross_device_files = 0
+        self.first_event = None
+        self.last_finish = 0.0
+        self._source_by_directory = {}
+        self._devices = {}
+
+    def _source_for(self, path):
+        """文件所属的监听目录（按所在目录缓存），不属于任何监听目录时返回 None"""
+        directory = path.rpartition(os.sep)[0]
+        try:
+            return self._source_by_directory[directory]
+        except KeyError:
+            pass
+        source = next((source for source in self.sources if source.contains(path)), None)
+        self._source_by_directory[directory] = source
+        return source
+
+    def _device_of(self, path):
+        """路径所在的设备，路径不存在时取最近的已存在上级目录；无法判断时返回 None"""
+        directory = os.path.abspath(path)
+        if directory in self._devices:
+            return self._devices[directory]
+        device = None
+        probe = directory
+        while True:
+            try:
+                device = os.stat(probe).st_dev
+                break
+            except OSError:
+                parent = os.path.dirname(probe)
+                if parent == probe:
+                    break
+                probe = parent
+        self._devices[directory] = device
+        return device
+
+    def replay(self, events):
+        """回放事件记录，返回回放用时（秒）"""
+        speed = self.args.speed
+        counts = self.events
+        started = time.perf_counter()
+        for timestamp, event_type, path, dest_path, size in events:
+            if self.first_event is None:
+                self.first_event = timestamp
+            now = (timestamp - self.first_event) / speed
+            counts[event_type] = counts.get(event_type, 0) + 1
+            # 先处理所有监听目录中到这一时刻已经稳定的文件，处理线程才能按稳定先后排队
+            self._advance_all(now)
+            source = self._source_for(path)
+            if source is None:
+                self.unmatched_events += 1
+                continue
+            tracker = source.stability_tracker
+            tracker.now = now
+            tracker.size = size
+            getattr(self._handlers[source.name], 'on_' + event_type)(_TraceEvent(event_type, path, dest_path))
+        # 记录结束后所有文件都按静默期满处理
+        self._advance_all(float('inf'))
+        return time.perf_counter() - started
+
+    def _advance_all(self, now):
+        """按截止时间先后处理所有监听目录中不晚于 now 的稳定文件"""
+        trackers = [source.stability_tracker for source in self.sources]
+        while True:
+            due = [tracker for tracker in trackers if tracker._heap and tracker._heap[0][0] <= now]
+            if not due:
+                return
+            if len(due) == 1:
+                due[0].advance(now)
+                continue
+            due.sort(key=lambda tracker: tracker._heap[0][0])
+            # 只处理到下一个目录最早的截止时间，保持跨目录的先后顺序
+            due[0].advance(min(now, due[1]._heap[0][0]))
+
+    def _process(self, source, entry, ready):
+        """对稳定的文件分类并按处理线程的占用情况计算完成时间"""
+        pipeline = source.pipeline
+        # 年龄条件按分类时距最近一次修改的时间判断；内容类型只能在文件仍存在时识别
+        mtime = time.time() - max(0.0, ready - entry.changed)
+        classify_start = time.perf_counter()
+        decision = pipeline.rule_engine.classify(entry.path, size=entry.size, mtime=mtime)
+        classify_seconds = time.perf_counter() - classify_start
+        self.classify_seconds += classify_seconds
+
+        target_path = pipeline.file_mover.move_file(entry.path, decision.target, entry.size)
+        service_time = classify_seconds + self.args.move_overhead
+        if self.args.copy_bandwidth and self._device_of(os.path.dirname(entry.path)) != self._device_of(os.path.dirname(target_path)):
+            service_time += entry.size / (self.args.copy_bandwidth * 1024 * 1024)
+            self.cross_device_files += 1
+        large = bool(self.large_file_size) and entry.size >= self.large_file_size
+        start, finish = (self.large_lane if large else self.small_lane).submit(ready, service_time)
+
+        rule_name = decision.rule_name or '(默认目标)'
+        self.rule_hits[rule_name] = self.rule_hits.get(rule_name, 0) + 1
+        self.files += 1
+        self.bytes += entry.size
+        self.stability_waits.append(ready - entry.first_seen)
+        self.queue_waits.append(start - ready)
+        self.latencies.append(finish - entry.first_seen)
+        self.last_finish = max(self.last_finish, finish)
+
+    def report(self, replay_seconds):
+        """汇总模拟结果"""
+        latencies = sorted(self.latencies)
+        stability_waits = sorted(self.stability_waits)
+        queue_waits = sorted(self.queue_waits)
+        total_events = sum(self.events.values())
+        return {
+            'events': total_events,
+            'events_by_type': self.events,
+            'unmatched_events': self.unmatched_events,
+            'files': self.files,
+            'bytes': self.bytes,
+            'cross_device_files': self.cross_device_files,
+            'placements': {
+                source.name: {
+                    category: {'files': counts[0], 'bytes': counts[1]}
+                    for category, counts in source.pipeline.file_mover.placements.items()
+                }
+                for source in self.sources
+            },
+            'rule_hits': dict(sorted(self.rule_hits.items(), key=lambda item: -item[1])),
+            'classify_seconds_mean': self.classify_seconds / self.files if self.files else None,
+            'simulated_seconds': self.last_finish,
+            'files_per_second': self.files / self.last_finish if self.last_finish > 0 else None,
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p90': percentile(latencies, 0.9),
+            'latency_p99': percentile(latencies, 0.99),
+            'latency_max': latencies[-1] if latencies else None,
+            'stability_p50': percentile(stability_waits, 0.5),
+            'stability_p99': percentile(stability_waits, 0.99),
+            'queue_wait_p50': percentile(queue_waits, 0.5),
+            'queue_wait_p99': percentile(queue_waits, 0.99),
+            'replay_seconds': replay_seconds,
+            'replay_events_per_second': total_events / replay_seconds if replay_seconds > 0 else None,
+        }
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+
+def print_report(stats):
+    """输出模拟结果"""
+    print()
+    print("=" * 50)
+    events = ", ".join(f"{name} {count}" for name, count in stats['events_by_type'].items())
+    print(f"事件: {stats['events']}（{events}），不属于任何监听目录 {stats['unmatched_events']}")
+    print(f"处理文件: {stats['files']}, 共 {format_bytes(stats['bytes'])}, 跨设备 {stats['cross_device_files']}")
+    for source_name, placements in stats['placements'].items():
+        print(f"  [{source_name}]")
+        for category, counts in sorted(placements.items(), key=lambda item: -item[1]['files']):
+            print(f"    {category}: {counts['files']} 个文件, {format_bytes(counts['bytes'])}")
+    print("规则命中次数:")
+    for rule_name, hits in stats['rule_hits'].items():
+        print(f"  {rule_name}: {hits}")
+    rate = stats['files_per_second']
+    print(f"吞吐量: {'-' if rate is None else f'{rate:.1f}'} 个文件/秒, 模拟时长 {stats['simulated_seconds']:.2f} 秒, "
+          f"平均分类用时 {format_seconds(stats['classify_seconds_mean'])}")
+    print(f"延迟（首个事件 -> 移动完成）: p50 {format_seconds(stats['latency_p50'])}, "
+          f"p90 {format_seconds(stats['latency_p90'])}, p99 {format_seconds(stats['latency_p99'])}, "
+          f"max {format_seconds(stats['latency_max'])}")
+    print(f"  其中等待稳定: p50 {format_seconds(stats['stability_p50'])}, p99 {format_seconds(stats['stability_p99'])}; "
+          f"排队: p50 {format_seconds(stats['queue_wait_p50'])}, p99 {format_seconds(stats['queue_wait_p99'])}")
+    replay_rate = stats['replay_events_per_second']
+    print(f"回放用时: {stats['replay_seconds']:.2f} 秒（{'-' if replay_rate is None else f'{replay_rate:.0f}'} 个事件/秒）")
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="AutoFileMover 事件记录离线模拟：不移动任何文件，按记录的事件评估规则和处理能力")
+    parser.add_argument("trace", help="事件记录文件（配置 trace.path 后运行程序得到）")
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml"),
+                        help="配置文件，监听目录、规则、静默期和处理线程数量沿用此文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，大于 1 时按更密集的事件到达评估（默认: 1）")
+    parser.add_argument("--workers", type=int, default=0, help="处理线程数量（默认: 沿用配置）")
+    parser.add_argument("--large-workers", type=int, default=0, help="大文件处理线程数量（默认: 沿用配置）")
+    parser.add_argument("--move-overhead", type=float, default=0.001, help="每个文件的移动开销（秒，默认: 0.001）")
+    parser.add_argument("--copy-bandwidth", type=float, default=0,
+                        help="跨设备复制速率（MB/s），0 表示不计算复制用时；目标目录与文件位于同一设备时不计算")
+    parser.add_argument("--json", help="把结果以 JSON 格式写入此文件，便于比较不同规则")
+    parser.add_argument("--verbose", action="store_true", help="输出规则匹配等调试日志")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed 必须大于 0")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from config_manager import config_manager
+    from event_trace import read_trace
+    config_manager.set_config_path(args.config)
+
+    simulation = Simulation(config_manager, args)
+    replay_seconds = simulation.replay(read_trace(args.trace))
+    stats = simulation.report(replay_seconds)
+    print_report(stats)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(stats, file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import math
+import heapq
+import itertools
+import time
+import threading
+import logging
+
+from metrics import metrics, stage_histogram
+from completion_detector import DEFAULT_STRATEGIES, STRATEGY_CLOSE_WRITE
+
+_FILES_SEEN = metrics.counter('afm_files_seen_total', "发现的新文件数量")
+_STABILITY_SECONDS = stage_histogram('stability')
+
+class _PendingFile:
+    """待处理文件的跟踪状态"""
+
+    __slots__ = ('path', 'state', 'first_seen', 'deadline', 'retrying', 'strategies', 'changed', 'next_probe',
+                 'closed')
+
+    def __init__(self, path, state, first_seen, deadline, strategies=DEFAULT_STRATEGIES):
+        self.path = path
+        self.state = state
+        self.first_seen = first_seen
+        self.deadline = deadline
+        # 大文件超过最长等待时间后改为定期重试
+        self.retrying = False
+        # 写入完成判定方式、最近一次变化的时间、下次主动探测的时间（不探测时为 None）
+        self.strategies = strategies
+        self.changed = first_seen
+        self.next_probe = None
+        # 已收到写入方关闭文件的事件
+        self.closed = False
+
+    def due(self):
+        """下次需要检查的时间"""
+        if self.next_probe is not None and self.next_probe < self.deadline:
+            return self.next_probe
+        return self.deadline
+
+class StabilityTracker:
+    """
+    文件稳定性跟踪器
+    集中记录所有待处理文件的大小和修改时间，由单个定时线程驱动：
+    每次 modified 事件都会重置该文件的静默计时，文件静默期满且状态未变化时才交给处理流程。
+    大文件的静默期随大小增长，超过最长等待时间后不会放弃，而是定期重试直到写入完成。
+    配置了写入完成判定方式（打开句柄、文件锁、附属文件）的文件在静默期之外还会定期探测，
+    确认写入方已关闭文件后立即处理，确认仍在写入时不会因为静默而被提前处理
+    """
+
+    def __init__(self, integrity_checker, on_ready, max_wait_time=30, large_file_size=0, large_quiet_period=30,
+                 large_max_wait_time=600, retry_interval=60, completion=None, strategy_resolver=None, on_timeout=None):
+        """
+        :param integrity_checker: 文件完整性检查器，提供状态读取和比较
+        :param on_ready: 文件稳定后调用的回调函数，参数为文件路径
+        :param max_wait_time: 文件持续变化的最长等待时间（秒），超时后放弃处理
+        :param large_file_size: 大文件的大小阈值（字节），0 表示不区分大小文件
+        :param large_quiet_period: 大文件静默期的上限（秒）
+        :param large_max_wait_time: 大文件持续变化的最长等待时间（秒），超时后改为定期重试
+        :param retry_interval: 大文件重试检查的间隔（秒）
+        :param completion: 写入完成判定（可选，CompletionDetector），未设置时只使用关闭事件和静默期
+        :param strategy_resolver: 按文件路径返回判定方式的函数（可选，如按规则选择），返回 None 时使用默认判定方式
+        :param on_timeout: 等待超时放弃的文件交给此函数（可选），参数为文件路径，用于在文件再次变化时重新跟踪
+        """
+        self.integrity_checker = integrity_checker
+        self.on_ready = on_ready
+        self.quiet_period = integrity_checker.check_delay
+        self.max_wait_time = max_wait_time
+        self.large_file_size = large_file_size
+        self.large_quiet_period = large_quiet_period
+        self.large_max_wait_time = large_max_wait_time
+        self.retry_interval = retry_interval
+        self.completion = completion
+        self.strategy_resolver = strategy_resolver
+        self.on_timeout = on_timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._pending = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """启动定时线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="StabilityTracker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定时线程，丢弃所有待处理文件"""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._pending.clear()
+            self._heap.clear()
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _is_large(self, size):
+        return bool(self.large_file_size) and size >= self.large_file_size
+
+    def _quiet_period_for(self, state):
+        """
+        按文件大小确定静默期
+        小文件使用 quiet_period；大文件的静默期按大小的平方根增长（阈值处与小文件相同，100 倍阈值时为 10 倍），
+        不超过 large_quiet_period，写入过程中短暂停顿的大文件不会被提前处理
+        """
+        size = state[0]
+        if not self._is_large(size):
+            return self.quiet_period
+        scaled = self.quiet_period * math.sqrt(size / self.large_file_size)
+        return max(self.quiet_period, min(scaled, self.large_quiet_period))
+
+    def _strategies_for(self, file_path):
+        """文件使用的写入完成判定方式"""
+        if self.completion is None:
+            return DEFAULT_STRATEGIES
+        strategies = self.strategy_resolver(file_path) if self.strategy_resolver is not None else None
+        return strategies if strategies is not None else self.completion.default_strategies
+
+    def _is_probing(self, strategies):
+        return self.completion is not None and self.completion.has_probes(strategies)
+
+    def track(self, file_path):
+        """
+        开始跟踪文件（created / moved 事件）
+        已经静默超过检查延迟的文件会立即交给处理流程（需要探测的文件先在定时线程中探测一次）
+        """
+        state = self.integrity_checker.get_file_state(file_path)
+        if state is None:
+            return
+
+        strategies = self._strategies_for(file_path)
+        probing = self._is_probing(strategies)
+        at_rest = self.integrity_checker.is_at_rest(state, self._quiet_period_for(state))
+        if at_rest and not probing:
+            with self._condition:
+                entry = self._pending.pop(file_path, None)
+            if entry is None:
+                _FILES_SEEN.inc()
+            self._hand_off(file_path, entry)
+            return
+
+        now = time.monotonic()
+        with self._condition:
+            entry = self._pending.get(file_path)
+            if entry is None:
+                _FILES_SEEN.inc()
+                deadline = now if at_rest else now + self._quiet_period_for(state)
+                entry = _PendingFile(file_path, state, now, deadline, strategies)
+                if probing:
+                    entry.next_probe = now if at_rest else now + self.completion.probe_interval
+                self._pending[file_path] = entry
+                self._push(entry)
+            else:
+                entry.state = state
+                entry.changed = now
+                entry.closed = False
+                entry.deadline = max(entry.deadline, now + self._quiet_period_for(state))
+
+    def touch(self, file_path):
+        """
+        文件被修改（modified 事件），重置静默计时
+        未被跟踪的文件会开始跟踪
+        """
+        with self._condition:
+            entry = self._pending.get(file_path)
+            if entry is not None:
+                # 只推迟截止时间，堆中的旧条目在弹出时再重新入堆（重试中的大文件保持原来的重试时间）
+                now = time.monotonic()
+                entry.deadline = max(entry.deadline, now + self._quiet_period_for(entry.state))
+                entry.changed = now
+                entry.closed = False
+                return
+        self.track(file_path)
+
+    def mark_closed(self, file_path):
+        """
+        文件写入方已关闭文件（closed 事件），立即检查并交给处理流程
+        文件的判定方式不包含 close_write 时按修改处理；还需要探测的文件交给定时线程立即探测
+        """
+        with self._condition:
+            entry = self._pending.get(file_path)
+            if entry is None:
+                return
+            now = time.monotonic()
+            if STRATEGY_CLOSE_WRITE not in entry.strategies:
+                entry.changed = now
+                entry.deadline = max(entry.deadline, now + self._quiet_period_for(entry.state))
+                return
+            if self._is_probing(entry.strategies):
+                # 关闭事件确认写入完成，但仍需确认附属文件、其他写入方等（如下载工具关闭后重新打开）
+                entry.changed = now
+                entry.closed = True
+                entry.next_probe = now
+                self._push(entry)
+                return
+            del self._pending[file_path]
+        if self.integrity_checker.get_file_state(file_path) is None:
+            return
+        self._hand_off(file_path, entry)
+
+    def rename(self, src_path, dest_path):
+        """
+        跟随重命名（moved 事件）
+        源路径正在跟踪时，将其状态转移到新路径并重置静默计时，保证同一个文件只处理一次
+        """
+        with self._condition:
+            entry = self._pending.pop(src_path, None)
+        if entry is None:
+            self.track(dest_path)
+            return
+
+        state = self.integrity_checker.get_file_state(dest_path)
+        if state is None:
+            return
+        now = time.monotonic()
+        with self._condition:
+            existing = self._pending.get(dest_path)
+            if existing is not None:
+                existing.state = state
+                existing.first_seen = min(existing.first_seen, entry.first_seen)
+                existing.deadline = max(existing.deadline, now + self._quiet_period_for(state))
+                existing.changed = now
+                existing.closed = False
+                return
+            # 重命名后扩展名可能改变（如 .crdownload -> .pdf），重新选择判定方式
+            strategies = self._strategies_for(dest_path)
+            moved = _PendingFile(dest_path, state, entry.first_seen, now + self._quiet_period_for(state), strategies)
+            moved.changed = now
+            if self._is_probing(strategies):
+                moved.next_probe = now + self.completion.probe_interval
+            self._pending[dest_path] = moved
+            self._push(moved)
+
+    def discard(self, file_path):
+        """停止跟踪文件（deleted 事件）"""
+        with self._condition:
+            self._pending.pop(file_path, None)
+
+    def get_pending_count(self):
+        """获取正在等待稳定的文件数量"""
+        with self._condition:
+            return len(self._pending)
+
+    def _push(self, entry):
+        """将条目按下次检查时间放入堆中，必须在持有锁时调用"""
+        heapq.heappush(self._heap, (entry.due(), next(self._sequence), entry))
+        self._condition.notify()
+
+    def _run(self):
+        """定时线程主循环"""
+        while True:
+            due = []
+            with self._condition:
+                while self._running:
+                    now = time.monotonic()
+                    while self._heap and self._heap[0][0] <= now:
+                        _, _, entry = heapq.heappop(self._heap)
+                        if self._pending.get(entry.path) is not entry:
+                            continue
+                        if entry.due() > now:
+                            self._push(entry)
+                            continue
+                        due.append(entry)
+                    if due:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+
+            for entry in due:
+                self._check(entry)
+
+    def _check(self, entry):
+        """
+        检查到期的文件：先按判定方式探测，探测无法判断时在静默期满后比较文件状态
+        """
+        now = time.monotonic()
+        verdict = None
+        if self._is_probing(entry.strategies):
+            verdict = self.completion.check(entry.path, entry.strategies, entry.changed)
+        if verdict is None and entry.closed:
+            # 关闭事件本身即可确认写入完成
+            verdict = True
+        quiet_due = entry.deadline <= now
+        if verdict is False or (verdict is None and not quiet_due):
+            complete, state = False, entry.state
+        else:
+            complete, state = self.integrity_checker.is_file_complete(entry.path, entry.state)
+            complete = complete or verdict is True
+
+        timed_out = False
+        with self._condition:
+            if self._pending.get(entry.path) is not entry:
+                return
+            if verdict is False:
+                self._schedule_probe(entry, now)
+                return
+            if not complete and verdict is None and not quiet_due:
+                # 探测无法判断，等到静默期满再检查
+                entry.next_probe = None
+                self._push(entry)
+                return
+            if state is None:
+                del self._pending[entry.path]
+                return
+            if not complete:
+                entry.state = state
+                waited = now - entry.first_seen
+                delay = self._quiet_period_for(state)
+                if self._is_large(state[0]):
+                    # 大文件不放弃，超过最长等待时间后按重试间隔检查
+                    if waited >= self.large_max_wait_time:
+                        if not entry.retrying:
+                            entry.retrying = True
+                            self.logger.warning(
+                                f"大文件 {waited:.0f} 秒内仍未写入完成，改为每 {self.retry_interval} 秒检查一次: {entry.path}"
+                            )
+                        delay = max(delay, self.retry_interval)
+                elif waited >= self.max_wait_time:
+                    del self._pending[entry.path]
+                    timed_out = True
+                if not timed_out:
+                    entry.deadline = now + delay
+                    if self._is_probing(entry.strategies):
+                        entry.next_probe = now + self.completion.probe_interval
+                    self._push(entry)
+                    return
+            else:
+                del self._pending[entry.path]
+        if timed_out:
+            self.logger.warning(f"等待文件完成超时: {entry.path}")
+            if self.on_timeout is not None:
+                self.on_timeout(entry.path)
+            return
+        self._hand_off(entry.path, entry)
+
+    def _schedule_probe(self, entry, now):
+        """
+        文件确认仍在写入时安排下次探测，必须在持有锁时调用
+        探测间隔随等待时间增长到静默期；确认仍在写入的文件不会因超时被放弃，超过最长等待时间后按重试间隔探测
+        """
+        entry.closed = False
+        waited = now - entry.first_seen
+        delay = min(max(waited / 4, self.completion.probe_interval), self._quiet_period_for(entry.state))
+        max_wait_time = self.large_max_wait_time if self._is_large(entry.state[0]) else self.max_wait_time
+        if waited >= max_wait_time:
+            if not entry.retrying:
+                entry.retrying = True
+                self.logger.warning(
+                    f"文件 {waited:.0f} 秒内仍被写入方占用，改为每 {self.retry_interval} 秒检查一次: {entry.path}"
+                )
+            delay = max(delay, self.retry_interval)
+        entry.next_probe = now + delay
+        # 静默期的检查推迟到下次探测之后，确认仍在写入的文件不会因为静默而被处理
+        entry.deadline = max(entry.deadline, entry.next_probe)
+        self._push(entry)
+
+    def _hand_off(self, file_path, entry=None):
+        """
+        将稳定的文件交给处理流程
+        :param entry: 文件的跟踪状态（可选），用于统计从发现到写入完成的用时
+        """
+        if entry is not None:
+            _STABILITY_SECONDS.observe(time.monotonic() - entry.first_seen)
+        try:
+            self.on_ready(file_path)
+        except Exception as e:
+            self.logger.error(f"提交稳定文件时发生错误 {file_path}: {e}")
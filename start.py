@@ -13,6 +13,9 @@ def run_autofilemover():
     app.start()
 
 if __name__ == "__main__":
+    # 打包后的程序由此启动多进程分类的工作进程
+    import multiprocessing
+    multiprocessing.freeze_support()
     # 在新线程中运行AutoFileMover
     autofilemover_thread = threading.Thread(target=run_autofilemover, daemon=True)
     autofilemover_thread.start()
@@ -0,0 +1,77 @@
+import os
+import logging
+from collections import namedtuple
+
+# 监听方式
+BACKEND_EVENTS = 'events'    # 文件系统事件（inotify / ReadDirectoryChangesW / FSEvents）
+BACKEND_POLLING = 'polling'  # 定时轮询目录快照，用于事件不可靠的网络共享目录
+BACKENDS = (BACKEND_EVENTS, BACKEND_POLLING)
+
+# 监听目录的处理配置快照：编译后的规则引擎、文件移动器和目标目录映射
+# 快照创建后不再修改，重新加载配置时整体替换；正在处理的批次继续使用开始时取得的快照
+SourcePipeline = namedtuple('SourcePipeline', ['rule_engine', 'file_mover', 'target_directories'])
+
+class WatchSource:
+    """
+    单个监听目录
+    包含监听设置和调度优先级、当前的处理配置快照，以及运行时为它创建的稳定性跟踪器和积压扫描器
+    """
+
+    def __init__(self, name, path, recursive=False, priority=1, backend=BACKEND_EVENTS):
+        """
+        :param name: 来源名称，用于日志、统计和分发器队列
+        :param path: 监听目录路径
+        :param recursive: 是否同时监听所有子目录
+        :param priority: 调度权重，多个目录同时繁忙时按权重分配处理机会
+        :param backend: 监听方式: events 使用文件系统事件，polling 定时轮询（用于网络共享目录）
+        """
+        self.name = name
+        self.path = path
+        self.recursive = recursive
+        self.priority = priority
+        self.backend = backend
+        self.logger = logging.getLogger(__name__)
+
+        self.pipeline = None
+        self.stability_tracker = None
+        self.backlog_scanner = None
+
+    @classmethod
+    def from_config(cls, config):
+        """从 ConfigManager.get_watch_sources 返回的配置创建（处理配置快照由调用方设置）"""
+        source = cls(config['name'], config['path'])
+        source.update(config)
+        return source
+
+    def update(self, config):
+        """按新的配置更新监听设置和优先级"""
+        self.path = config['path']
+        self.recursive = config['recursive']
+        self.priority = config['priority']
+        self.backend = config.get('backend', BACKEND_EVENTS)
+
+    @property
+    def watch_key(self):
+        """决定监听调度方式的设置，只有这些设置变化时才需要重新调度监听"""
+        return (os.path.abspath(self.path), self.recursive, self.backend)
+
+    def get_excluded_directories(self):
+        """
+        位于监听目录内的目标目录
+        递归监听时这些目录中的文件不再处理，避免移动后的文件被再次移动
+        """
+        if not self.recursive or self.pipeline is None:
+            return []
+        root = os.path.join(os.path.abspath(self.path), '')
+        return sorted({
+            os.path.abspath(directory) for directory in self.pipeline.target_directories.values()
+            if os.path.join(os.path.abspath(directory), '').startswith(root)
+        })
+
+    def contains(self, path):
+        """检查路径是否位于本监听目录的监听范围内"""
+        root = os.path.abspath(self.path)
+        path = os.path.abspath(path)
+        if self.recursive:
+            return os.path.join(path, '').startswith(os.path.join(root, ''))
+        return os.path.dirname(path) == root